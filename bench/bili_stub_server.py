@@ -0,0 +1,280 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+B 站投稿接口本地替身：实现 push/bilibili 上传链路用到的全部接口，供压测与基准使用（不校验 Cookie/签名）。
+- GET  /preupload?r=probe                线路探测（lines 列表，probe_url 指向本服务 /probe）
+- GET  /preupload                        返回 endpoint（//本服务）、upos_uri、auth、biz_id、chunk_size
+- GET/PUT /probe                         线路测速
+- GET  /x/web-interface/nav              登录校验（恒为已登录）
+- POST /<bucket>/<file>?uploads          init multipart，返回 upload_id
+- PUT  /<bucket>/<file>?partNumber=...   分片，校验 size 参数与实际长度一致，ETag 为序号
+- POST /<bucket>/<file>?uploadId=...     complete，校验分片齐全
+- POST /x/vu/web/add/v3、/x/vu/app/add  投稿；complete 后 not_ready_seconds 内返回 21015
+- GET  /_stats                           各接口请求数、注入的错误数、接收字节数等计数
+
+可调参数：每个请求的延迟（latency）、接收分片的单连接带宽（bandwidth）、分片 PUT 返回 500 的概率
+（part_error_rate，请求体照常读完，模拟节点偶发失败）、投稿就绪延迟（not_ready_seconds）。
+上传端需设置 upload.UPOS_SCHEME = "http:" 并把 PREUPLOAD_URL / ADD_URL / APP_ADD_URL、
+lines.LINE_PROBE_URL、auth.NAV_URL 指向本服务（bench/bili_upload.py 的 point_to_stub）。
+
+单独运行：
+  python bench/bili_stub_server.py --port 8900 --latency 0.02 --bandwidth 20M --part-error-rate 0.05 --not-ready-seconds 2
+"""
+
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib import parse
+
+from throttled_http import SEND_BLOCK, parse_rate
+
+STUB_BUCKET = "ugcstub"
+STUB_LINES = ["upcdn=stub&zone=local", "upcdn=stub2&zone=local"]
+DEFAULT_CHUNK_SIZE = 4 * 1024 * 1024
+NOT_READY_CODE = 21015
+
+
+class StubState(object):
+    """替身服务的上传会话与计数（线程安全）。"""
+
+    def __init__(self, chunk_size=DEFAULT_CHUNK_SIZE, part_error_rate=0.0, not_ready_seconds=0.0, seed=None):
+        self.chunk_size = chunk_size
+        self.part_error_rate = part_error_rate
+        self.not_ready_seconds = not_ready_seconds
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.uploads = {}  # upload_id -> {"key", "parts": {partNumber: size}, "completed_at"}
+            self.keys = {}  # 文件名（无扩展名）-> upload_id
+            self.counters = {
+                "preupload": 0,
+                "probe": 0,
+                "nav": 0,
+                "init": 0,
+                "part_put": 0,
+                "part_error_injected": 0,
+                "part_bytes": 0,
+                "complete": 0,
+                "add": 0,
+                "add_not_ready": 0,
+                "bad_request": 0,
+            }
+
+    def count(self, name, n=1):
+        with self.lock:
+            self.counters[name] += n
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.counters)
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, fmt, *args):
+        pass
+
+    @property
+    def state(self):
+        return self.server.state
+
+    def _send_json(self, obj, status=200, headers=None):
+        body = json.dumps(obj, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_body(self):
+        """读完请求体，按 bandwidth 限速；返回 (字节数, 内容)。分片只计长度不保留内容。"""
+        length = int(self.headers.get("Content-Length") or 0)
+        keep = length <= 1024 * 1024
+        chunks = []
+        received = 0
+        t0 = time.time()
+        bandwidth = self.server.bandwidth
+        while received < length:
+            block = self.rfile.read(min(SEND_BLOCK, length - received))
+            if not block:
+                break
+            received += len(block)
+            if keep:
+                chunks.append(block)
+            if bandwidth:
+                ahead = received / float(bandwidth) - (time.time() - t0)
+                if ahead > 0:
+                    time.sleep(ahead)
+        return received, b"".join(chunks)
+
+    def _route(self, method):
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        url = parse.urlsplit(self.path)
+        query = dict(parse.parse_qsl(url.query, keep_blank_values=True))
+        size, body = self._read_body() if method in ("PUT", "POST") else (0, b"")
+        path = url.path
+        if path == "/_stats":
+            return self._send_json(self.state.snapshot())
+        if path == "/preupload":
+            if query.get("r") == "probe":
+                return self._send_json({"lines": [
+                    {"query": line, "probe_url": "{}/probe".format(self.server.base_url)} for line in STUB_LINES
+                ]})
+            return self._preupload(query)
+        if path == "/probe":
+            self.state.count("probe")
+            return self._send_json({"OK": 1})
+        if path == "/x/web-interface/nav":
+            self.state.count("nav")
+            return self._send_json({"code": 0, "data": {"isLogin": True, "mid": 1, "uname": "stub"}})
+        if path in ("/x/vu/web/add/v3", "/x/vu/app/add") and method == "POST":
+            return self._add(body)
+        m = re.match(r"^/{}/([^/]+)$".format(STUB_BUCKET), path)
+        if m:
+            if method == "POST" and "uploads" in query:
+                return self._init(m.group(1))
+            if method == "PUT" and "partNumber" in query:
+                return self._part(query, size)
+            if method == "POST" and "uploadId" in query:
+                return self._complete(query, body)
+        self.state.count("bad_request")
+        self._send_json({"code": -404, "message": "not found"}, status=404)
+
+    def do_GET(self):
+        self._route("GET")
+
+    def do_PUT(self):
+        self._route("PUT")
+
+    def do_POST(self):
+        self._route("POST")
+
+    def _preupload(self, query):
+        self.state.count("preupload")
+        name = "n{}{}".format(int(time.time()), uuid.uuid4().hex[:8])
+        self._send_json({
+            "OK": 1,
+            "endpoint": "//{}:{}".format(*self.server.server_address[:2]),
+            "upos_uri": "upos://{}/{}.mp4".format(STUB_BUCKET, name),
+            "auth": "stub-auth-{}".format(name),
+            "biz_id": abs(hash(name)) % 100000000,
+            "chunk_size": self.state.chunk_size,
+            "threads": 3,
+        })
+
+    def _init(self, filename):
+        self.state.count("init")
+        upload_id = uuid.uuid4().hex
+        key = filename.rsplit(".", 1)[0]
+        with self.state.lock:
+            self.state.uploads[upload_id] = {"key": key, "parts": {}, "completed_at": None}
+            self.state.keys[key] = upload_id
+        self._send_json({"OK": 1, "upload_id": upload_id, "bucket": STUB_BUCKET, "key": "/" + filename})
+
+    def _part(self, query, size):
+        state = self.state
+        state.count("part_put")
+        with state.lock:
+            upload = state.uploads.get(query.get("uploadId"))
+            inject = state.random.random() < state.part_error_rate
+        if upload is None:
+            return self._send_json({"OK": 0, "message": "no such upload"}, status=404)
+        if inject:
+            state.count("part_error_injected")
+            return self._send_json({"OK": 0, "message": "injected error"}, status=500)
+        if str(size) != query.get("size"):
+            state.count("bad_request")
+            return self._send_json({"OK": 0, "message": "size mismatch"}, status=400)
+        part_number = int(query["partNumber"])
+        with state.lock:
+            upload["parts"][part_number] = size
+        state.count("part_bytes", size)
+        self._send_json({"OK": 1}, headers={"ETag": '"etag-{}"'.format(part_number)})
+
+    def _complete(self, query, body):
+        state = self.state
+        state.count("complete")
+        with state.lock:
+            upload = state.uploads.get(query.get("uploadId"))
+        if upload is None:
+            return self._send_json({"OK": 0, "message": "no such upload"}, status=404)
+        try:
+            numbers = [p["partNumber"] for p in json.loads(body.decode("utf-8"))["parts"]]
+        except (ValueError, KeyError, TypeError):
+            numbers = []
+        missing = [n for n in numbers if n not in upload["parts"]]
+        if not numbers or missing:
+            return self._send_json({"OK": 0, "message": "missing parts: {}".format(missing[:10])})
+        with state.lock:
+            upload["completed_at"] = time.time()
+        self._send_json({"OK": 1, "filename": upload["key"], "location": "upos://{}/{}.mp4".format(STUB_BUCKET, upload["key"])})
+
+    def _add(self, body):
+        state = self.state
+        state.count("add")
+        try:
+            videos = json.loads(body.decode("utf-8")).get("videos") or []
+        except ValueError:
+            videos = []
+        with state.lock:
+            uploads = [state.uploads.get(state.keys.get(v.get("filename"))) for v in videos]
+        if not uploads or None in uploads or any(u["completed_at"] is None for u in uploads):
+            return self._send_json({"code": 21020, "message": "视频文件不存在"})
+        if any(time.time() - u["completed_at"] < state.not_ready_seconds for u in uploads):
+            state.count("add_not_ready")
+            return self._send_json({"code": NOT_READY_CODE, "message": "视频尚未处理完成"})
+        self._send_json({"code": 0, "message": "0", "data": {"aid": 100000 + len(state.uploads), "bvid": "BVstub"}})
+
+
+def serve(latency=0.0, bandwidth=0, part_error_rate=0.0, not_ready_seconds=0.0, chunk_size=DEFAULT_CHUNK_SIZE,
+          seed=None, host="127.0.0.1", port=0):
+    """
+    后台线程启动替身服务。
+    :return: (server, base_url)；server.state 为 StubState（计数、reset），用完调用 server.shutdown()
+    """
+    server = ThreadingHTTPServer((host, port), StubHandler)
+    server.daemon_threads = True
+    server.latency = latency
+    server.bandwidth = bandwidth
+    server.state = StubState(chunk_size, part_error_rate, not_ready_seconds, seed)
+    server.base_url = "http://{}:{}".format(host, server.server_address[1])
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, server.base_url
+
+
+def main():
+    parser = argparse.ArgumentParser(description="B 站投稿接口本地替身服务（基准用）")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency", type=float, default=0.0, help="每个请求的延迟秒数（默认 0）")
+    parser.add_argument("--bandwidth", default="0", help="接收分片的单连接带宽，如 20M（默认 0 不限速）")
+    parser.add_argument("--part-error-rate", type=float, default=0.0, help="分片 PUT 返回 500 的概率（默认 0）")
+    parser.add_argument("--not-ready-seconds", type=float, default=0.0, help="complete 后该时长内投稿返回 21015（默认 0）")
+    parser.add_argument("--chunk-size", default="4M", help="preupload 返回的分片大小（默认 4M）")
+    args = parser.parse_args()
+    server, url = serve(
+        args.latency, parse_rate(args.bandwidth), args.part_error_rate, args.not_ready_seconds,
+        parse_rate(args.chunk_size), host=args.host, port=args.port,
+    )
+    print("bili stub at {}".format(url))
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
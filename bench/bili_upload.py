@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+B 站上传链路基准：启动本地替身服务（bench/bili_stub_server.py），把 push/bilibili 的接口地址指向它，
+按不同初始并发调用 BilibiliPusher.upload，输出各组的上传吞吐、分片重试次数与投稿就绪等待（JSON）。
+分片重试次数 = 替身注入的分片错误数（每次注入的 500 都会触发一次重试）。
+
+运行示例：
+  python bench/bili_upload.py --size 128M --concurrency 1,3,6 --bandwidth 10M --latency 0.02
+  python bench/bili_upload.py --size 64M --part-error-rate 0.1 --not-ready-seconds 3 --app -o bili.json
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+for _d in (BASE_DIR, BENCH_DIR):
+    if _d not in sys.path:
+        sys.path.insert(0, _d)
+
+import bili_stub_server
+from throttled_http import parse_rate
+
+
+def point_to_stub(base_url):
+    """把上传、投稿、线路探测、登录校验的地址全部指向替身服务。"""
+    from push.bilibili import auth, lines, upload
+
+    upload.PREUPLOAD_URL = base_url + "/preupload"
+    upload.ADD_URL = base_url + "/x/vu/web/add/v3"
+    upload.APP_ADD_URL = base_url + "/x/vu/app/add"
+    upload.UPOS_SCHEME = "http:"
+    lines.LINE_PROBE_URL = base_url + "/preupload?r=probe"
+    lines.SELECTOR.invalidate()
+    auth.NAV_URL = base_url + "/x/web-interface/nav"
+
+
+def make_video(path, size):
+    """写 size 字节随机数据（替身服务不解析内容）。"""
+    block = os.urandom(1024 * 1024)
+    with open(path, "wb") as f:
+        remaining = size
+        while remaining > 0:
+            f.write(block[:remaining])
+            remaining -= len(block)
+
+
+def make_pusher(work_dir, app):
+    """替身凭据登录；app=True 时写入带 token_info 的 cookie 文件，走 APP 投稿接口。"""
+    from push import get_pusher
+
+    cookies = {"SESSDATA": "stub", "bili_jct": "stub", "DedeUserID": "1"}
+    if not app:
+        return get_pusher("bilibili", pooled=True, cookie_dict=cookies)
+    cookie_path = os.path.join(work_dir, "cookie.json")
+    with open(cookie_path, "w") as f:
+        json.dump(dict(cookies, token_info={"access_token": "stub"}), f)
+    return get_pusher("bilibili", pooled=True, cookie_path=cookie_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="B 站上传链路基准（本地替身服务）")
+    parser.add_argument("--size", default="64M", help="测试文件大小，如 64M、1G（默认 64M）")
+    parser.add_argument("--concurrency", default="1,3,6", help="初始分片并发，逗号分隔（默认 1,3,6）")
+    parser.add_argument("--repeat", type=int, default=1, help="每组重复次数（默认 1）")
+    parser.add_argument("--chunk-size", default="4M", help="替身返回的分片大小（默认 4M）")
+    parser.add_argument("--latency", type=float, default=0.02, help="替身每个请求的延迟秒数（默认 0.02）")
+    parser.add_argument("--bandwidth", default="10M", help="替身单连接接收带宽，0 不限速（默认 10M）")
+    parser.add_argument("--part-error-rate", type=float, default=0.0, help="分片 PUT 返回 500 的概率（默认 0）")
+    parser.add_argument("--not-ready-seconds", type=float, default=0.0, help="complete 后该时长内投稿返回 21015（默认 0）")
+    parser.add_argument("--seed", type=int, default=None, help="错误注入的随机种子")
+    parser.add_argument("--app", action="store_true", help="使用 APP 投稿接口（默认 Web 接口）")
+    parser.add_argument("-o", "--output", default=None, help="结果 JSON 路径（默认输出到 stdout）")
+    args = parser.parse_args()
+
+    size = parse_rate(args.size)
+    concurrencies = [int(c) for c in args.concurrency.split(",")]
+    server, base_url = bili_stub_server.serve(
+        latency=args.latency,
+        bandwidth=parse_rate(args.bandwidth),
+        part_error_rate=args.part_error_rate,
+        not_ready_seconds=args.not_ready_seconds,
+        chunk_size=parse_rate(args.chunk_size),
+        seed=args.seed,
+    )
+    point_to_stub(base_url)
+    work_dir = tempfile.mkdtemp(prefix="bench_bili_")
+    results = []
+    try:
+        video_path = os.path.join(work_dir, "bench.mp4")
+        make_video(video_path, size)
+        pusher = make_pusher(work_dir, args.app)
+        for concurrency in concurrencies:
+            for i in range(args.repeat):
+                server.state.reset()
+                t0 = time.time()
+                result = pusher.upload(
+                    video_path, "bench {} #{}".format(concurrency, i), concurrency=concurrency, resume=False
+                )
+                elapsed = time.time() - t0
+                stats = result.get("upload_stats") or {}
+                counters = server.state.snapshot()
+                row = {
+                    "concurrency": concurrency,
+                    "size": size,
+                    "total_seconds": round(elapsed, 3),
+                    "upload_seconds": stats.get("upload_seconds"),
+                    "upload_mb_s": round(size / max(stats.get("upload_seconds") or elapsed, 1e-6) / 1048576.0, 2),
+                    "part_puts": counters["part_put"],
+                    "part_retries": counters["part_error_injected"],
+                    "submit_attempts": stats.get("submit_attempts"),
+                    "submit_wait": stats.get("submit_wait"),
+                    "code": result.get("code"),
+                    "stub": counters,
+                }
+                results.append(row)
+                print(json.dumps(dict((k, v) for k, v in row.items() if k != "stub")), file=sys.stderr)
+    finally:
+        server.shutdown()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {
+        "created_at": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime()),
+        "latency": args.latency,
+        "bandwidth": parse_rate(args.bandwidth),
+        "chunk_size": parse_rate(args.chunk_size),
+        "part_error_rate": args.part_error_rate,
+        "not_ready_seconds": args.not_ready_seconds,
+        "api": "app" if args.app else "web",
+        "results": results,
+    }
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+merge_mp4_cv2 帧缓冲复用基准：对比 pool_frames=True / False 的耗时、帧率与峰值内存。
+用 cv2.VideoWriter 生成若干测试分段（交替两种分辨率，使一半分段走缩放路径），
+每种模式在独立子进程中合并（峰值 RSS 互不影响），结果以 JSON 输出。
+"""
+
+import argparse
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+
+def make_segments(out_dir, count, seconds, size, fps=30):
+    """生成 count 个测试分段，奇数分段为 size 的 3/4 分辨率；返回 concat 列表文件路径。"""
+    import cv2
+    import numpy as np
+
+    w, h = size
+    list_path = os.path.join(out_dir, "list.txt")
+    rng = np.random.RandomState(0)
+    with open(list_path, "w", encoding="utf-8") as lf:
+        for i in range(count):
+            sw, sh = (w, h) if i % 2 == 0 else (w * 3 // 4, h * 3 // 4)
+            path = os.path.join(out_dir, "seg_{:03d}.mp4".format(i))
+            writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), fps, (sw, sh))
+            base = rng.randint(0, 255, (sh, sw, 3), dtype=np.uint8)
+            for k in range(int(seconds * fps)):
+                writer.write(np.roll(base, k * 4, axis=1))
+            writer.release()
+            lf.write("file '{}'\n".format(path))
+    return list_path
+
+
+def run_one(list_path, output_path, pool_frames, threads):
+    """子进程内执行一次合并，返回统计 dict。"""
+    import merge_mp4_cv2
+
+    t0 = time.time()
+    merge_mp4_cv2.merge_mp4_cv2(
+        list_path, output_path, add_audio=False, threads=threads, pool_frames=pool_frames
+    )
+    elapsed = time.time() - t0
+    cap = merge_mp4_cv2.cv2.VideoCapture(output_path)
+    frames = int(cap.get(merge_mp4_cv2.cv2.CAP_PROP_FRAME_COUNT))
+    cap.release()
+    return {
+        "pool_frames": pool_frames,
+        "seconds": round(elapsed, 3),
+        "frames": frames,
+        "fps": round(frames / max(elapsed, 1e-6), 1),
+        # Linux 下 ru_maxrss 单位为 KB
+        "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="merge_mp4_cv2 帧缓冲复用基准")
+    parser.add_argument("--segments", type=int, default=10, help="测试分段数（默认 10）")
+    parser.add_argument("--seconds", type=float, default=5, help="每段时长秒数（默认 5）")
+    parser.add_argument("--size", default="1920x1080", help="分辨率，如 1920x1080")
+    parser.add_argument("--threads", type=int, default=None, help="缩放线程数（默认 CPU 核数）")
+    parser.add_argument("--repeat", type=int, default=1, help="每种模式重复次数（默认 1）")
+    parser.add_argument("--keep", action="store_true", help="保留生成的测试文件")
+    parser.add_argument("--child", nargs=3, metavar=("LIST", "OUTPUT", "POOL"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        list_path, output_path, pool = args.child
+        print(json.dumps(run_one(list_path, output_path, pool == "1", args.threads)))
+        return
+
+    w, h = (int(x) for x in args.size.lower().split("x"))
+    work_dir = tempfile.mkdtemp(prefix="bench_cv2_")
+    try:
+        print("生成测试分段: {} 段 x {}s @ {}".format(args.segments, args.seconds, args.size), file=sys.stderr)
+        list_path = make_segments(work_dir, args.segments, args.seconds, (w, h))
+        results = []
+        for _ in range(args.repeat):
+            for pool in ("0", "1"):
+                cmd = [sys.executable, os.path.abspath(__file__), "--child", list_path,
+                       os.path.join(work_dir, "out_{}.mp4".format(pool)), pool]
+                if args.threads:
+                    cmd += ["--threads", str(args.threads)]
+                out = subprocess.run(cmd, check=True, capture_output=True, text=True).stdout
+                results.append(json.loads(out.strip().splitlines()[-1]))
+                print(json.dumps(results[-1]), file=sys.stderr)
+        print(json.dumps({"segments": args.segments, "seconds": args.seconds, "size": args.size,
+                          "results": results}, indent=2))
+    finally:
+        if not args.keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+merge_mp4_ffmpeg2 端到端基准（离线）：
+1. ffmpeg lavfi（testsrc + sine）按 profile 生成测试分段（分辨率、时长、编码各异）
+2. 本地限速 HTTP 服务器（bench/throttled_http.py）以设定的延迟与单连接带宽提供分段
+3. 对每组（profile, 并发下载数, 是否重编码）调用 merge_paths_to_one(stats=...)，
+   记录 download / concat / remux / reencode / total 各阶段耗时，结果以 JSON 输出
+传 --baseline 时与之前保存的结果按相同配置对比 total 耗时。
+
+运行示例：
+  python bench/merge_pipeline.py --profiles short,hd --concurrency 1,4,8 --bandwidth 8M --latency 0.05 -o bench.json
+  python bench/merge_pipeline.py --baseline bench.json
+"""
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+for _d in (BASE_DIR, BENCH_DIR):
+    if _d not in sys.path:
+        sys.path.insert(0, _d)
+
+from throttled_http import parse_rate, serve_directory
+
+# profile -> 分段规格列表 (宽, 高, 时长秒, 视频编码)；按列表循环生成 --segments 段
+PROFILES = {
+    # 大量短片段：下载与小文件开销为主
+    "short": [(640, 360, 1, "libx264")],
+    # 少量高清长片段：带宽与 remux 为主
+    "hd": [(1280, 720, 6, "libx264"), (1920, 1080, 6, "libx264")],
+    # 分辨率、时长、编码混合：只有重编码能得到规范的输出
+    "mixed": [(1280, 720, 2, "libx264"), (854, 480, 3, "mpeg4"), (1920, 1080, 1, "libx264")],
+}
+DEFAULT_SEGMENTS = {"short": 40, "hd": 6, "mixed": 9}
+FPS = 25
+
+
+def make_segments(out_dir, profile, count, ffmpeg_bin="ffmpeg"):
+    """生成 count 个测试分段（带 440Hz 正弦音轨），返回文件名列表。"""
+    specs = PROFILES[profile]
+    names = []
+    for i in range(count):
+        w, h, seconds, vcodec = specs[i % len(specs)]
+        name = "{}_{:04d}_{}x{}.mp4".format(profile, i, w, h)
+        cmd = [
+            ffmpeg_bin, "-y", "-v", "error",
+            "-f", "lavfi", "-i", "testsrc=size={}x{}:rate={}:duration={}".format(w, h, FPS, seconds),
+            "-f", "lavfi", "-i", "sine=frequency=440:duration={}".format(seconds),
+            "-c:v", vcodec,
+        ]
+        if vcodec == "libx264":
+            cmd += ["-preset", "ultrafast", "-pix_fmt", "yuv420p"]
+        cmd += ["-c:a", "aac", "-shortest", os.path.join(out_dir, name)]
+        subprocess.run(cmd, check=True)
+        names.append(name)
+    return names
+
+
+def run_case(urls, work_dir, concurrency, reencode, ffmpeg_bin, ram_stage, tree_group):
+    """执行一次合并，返回 stats。"""
+    import merge_mp4_ffmpeg2
+
+    stats = {}
+    output_path = os.path.join(work_dir, "out.mp4")
+    merge_mp4_ffmpeg2.merge_paths_to_one(
+        urls,
+        output_path=output_path,
+        base_dir=work_dir,
+        reencode=reencode,
+        ffmpeg_bin=ffmpeg_bin,
+        ram_stage=ram_stage,
+        tree_group=tree_group,
+        download_concurrency=concurrency,
+        stats=stats,
+    )
+    os.remove(output_path)
+    return stats
+
+
+def _case_key(r):
+    return (r["profile"], r["concurrency"], r["reencode"], r.get("ram_stage"), r.get("tree_group"))
+
+
+def compare(results, baseline_path):
+    """按相同配置对比 total，打印 当前/基线 比值（<1 表示变快）。"""
+    with open(baseline_path, "r") as f:
+        baseline = dict((_case_key(r), r) for r in json.load(f).get("results", []))
+    for r in results:
+        old = baseline.get(_case_key(r))
+        if not old:
+            continue
+        ratio = r["stats"]["total"] / max(old["stats"]["total"], 1e-6)
+        print("{} 并发={} 重编码={}: {:.2f}s -> {:.2f}s ({:.2f}x)".format(
+            r["profile"], r["concurrency"], r["reencode"], old["stats"]["total"], r["stats"]["total"], ratio
+        ), file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="merge_mp4_ffmpeg2 端到端基准")
+    parser.add_argument("--profiles", default="short,hd", help="逗号分隔：{}（默认 short,hd）".format(",".join(PROFILES)))
+    parser.add_argument("--segments", type=int, default=None, help="每个 profile 的分段数（默认按 profile）")
+    parser.add_argument("--concurrency", default="1,4", help="并发下载数，逗号分隔（默认 1,4）")
+    parser.add_argument("--reencode", choices=("no", "yes", "both"), default="no", help="是否测重编码（默认 no）")
+    parser.add_argument("--latency", type=float, default=0.05, help="服务器首字节延迟秒数（默认 0.05）")
+    parser.add_argument("--bandwidth", default="8M", help="单连接带宽，如 8M、512k，0 不限速（默认 8M）")
+    parser.add_argument("--no-ram-stage", action="store_true", help="分片全部暂存到磁盘")
+    parser.add_argument("--tree-group", type=int, default=0, help="树形合并每组段数（默认 0 不启用）")
+    parser.add_argument("--repeat", type=int, default=1, help="每组配置重复次数（默认 1）")
+    parser.add_argument("--ffmpeg", default="ffmpeg", help="ffmpeg 命令（默认 ffmpeg）")
+    parser.add_argument("-o", "--output", default=None, help="结果 JSON 路径（默认输出到 stdout）")
+    parser.add_argument("--baseline", default=None, help="之前的结果 JSON，对比 total 耗时")
+    parser.add_argument("--keep", action="store_true", help="保留生成的测试文件")
+    args = parser.parse_args()
+
+    profiles = [p.strip() for p in args.profiles.split(",") if p.strip()]
+    for p in profiles:
+        if p not in PROFILES:
+            parser.error("未知 profile: {}".format(p))
+    concurrencies = [int(c) for c in args.concurrency.split(",")]
+    reencodes = {"no": [False], "yes": [True], "both": [False, True]}[args.reencode]
+    bandwidth = parse_rate(args.bandwidth)
+
+    root = tempfile.mkdtemp(prefix="bench_merge_")
+    media_dir = os.path.join(root, "media")
+    os.makedirs(media_dir)
+    server, base_url = serve_directory(media_dir, latency=args.latency, bandwidth=bandwidth)
+    results = []
+    try:
+        for profile in profiles:
+            count = args.segments or DEFAULT_SEGMENTS[profile]
+            print("生成 {}: {} 段".format(profile, count), file=sys.stderr)
+            urls = ["{}/{}".format(base_url, n) for n in make_segments(media_dir, profile, count, args.ffmpeg)]
+            for reencode in reencodes:
+                for concurrency in concurrencies:
+                    for _ in range(args.repeat):
+                        work_dir = os.path.join(root, "work")
+                        os.makedirs(work_dir, exist_ok=True)
+                        stats = run_case(
+                            urls, work_dir, concurrency, reencode, args.ffmpeg,
+                            not args.no_ram_stage, args.tree_group,
+                        )
+                        shutil.rmtree(work_dir, ignore_errors=True)
+                        results.append({
+                            "profile": profile, "concurrency": concurrency, "reencode": reencode,
+                            "ram_stage": not args.no_ram_stage, "tree_group": args.tree_group, "stats": stats,
+                        })
+                        print(json.dumps(results[-1], ensure_ascii=False), file=sys.stderr)
+    finally:
+        server.shutdown()
+        if not args.keep:
+            shutil.rmtree(root, ignore_errors=True)
+
+    report = {
+        "created_at": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime()),
+        "latency": args.latency,
+        "bandwidth": bandwidth,
+        "results": results,
+    }
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+    if args.baseline:
+        compare(results, args.baseline)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+限速静态文件服务器：模拟 CDN 的首字节延迟与单连接带宽，供下载/合并基准使用。
+- latency：每个请求返回响应头前等待的秒数
+- bandwidth：每个连接的发送速率上限（字节/秒，0 不限速），按 64KB 分块发送并休眠补齐
+- 支持单区间 Range 请求（返回 206）
+
+单独运行：
+  python bench/throttled_http.py /path/to/dir --port 8800 --latency 0.05 --bandwidth 4M
+"""
+
+import argparse
+import os
+import re
+import threading
+import time
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+SEND_BLOCK = 64 * 1024
+
+
+def parse_rate(text):
+    """'4M' / '512k' / '1000000' -> 字节/秒。"""
+    text = str(text).strip().lower()
+    units = {"k": 1024, "m": 1024 ** 2, "g": 1024 ** 3}
+    if text and text[-1] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(float(text or 0))
+
+
+def _make_handler(directory, latency, bandwidth):
+    class ThrottledHandler(SimpleHTTPRequestHandler):
+        def __init__(self, *args, **kwargs):
+            super(ThrottledHandler, self).__init__(*args, directory=directory, **kwargs)
+
+        def log_message(self, fmt, *args):
+            pass
+
+        def do_GET(self):
+            path = self.translate_path(self.path)
+            if not os.path.isfile(path):
+                self.send_error(404)
+                return
+            if latency:
+                time.sleep(latency)
+            size = os.path.getsize(path)
+            start, end = 0, size - 1
+            m = re.match(r"bytes=(\d*)-(\d*)$", self.headers.get("Range", ""))
+            if m and (m.group(1) or m.group(2)):
+                if m.group(1):
+                    start = int(m.group(1))
+                    end = min(int(m.group(2)), size - 1) if m.group(2) else size - 1
+                else:
+                    start = max(0, size - int(m.group(2)))
+                self.send_response(206)
+                self.send_header("Content-Range", "bytes {}-{}/{}".format(start, end, size))
+            else:
+                self.send_response(200)
+            length = max(0, end - start + 1)
+            self.send_header("Content-Type", "video/mp4")
+            self.send_header("Content-Length", str(length))
+            self.send_header("Accept-Ranges", "bytes")
+            self.end_headers()
+            with open(path, "rb") as f:
+                f.seek(start)
+                t0 = time.time()
+                sent = 0
+                while sent < length:
+                    block = f.read(min(SEND_BLOCK, length - sent))
+                    if not block:
+                        break
+                    self.wfile.write(block)
+                    sent += len(block)
+                    if bandwidth:
+                        ahead = sent / float(bandwidth) - (time.time() - t0)
+                        if ahead > 0:
+                            time.sleep(ahead)
+
+    return ThrottledHandler
+
+
+def serve_directory(directory, latency=0.0, bandwidth=0, host="127.0.0.1", port=0):
+    """
+    后台线程启动服务器。
+    :return: (server, base_url)；用完调用 server.shutdown()
+    """
+    server = ThreadingHTTPServer((host, port), _make_handler(os.path.abspath(directory), latency, bandwidth))
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, "http://{}:{}".format(host, server.server_address[1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="限速静态文件服务器（基准用）")
+    parser.add_argument("directory", help="服务的目录")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8800)
+    parser.add_argument("--latency", type=float, default=0.0, help="每个请求的首字节延迟秒数（默认 0）")
+    parser.add_argument("--bandwidth", default="0", help="单连接带宽，如 4M、512k（默认 0 不限速）")
+    args = parser.parse_args()
+    server, url = serve_directory(args.directory, args.latency, parse_rate(args.bandwidth), args.host, args.port)
+    print("serving {} at {}".format(args.directory, url))
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,50 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
-"""高效截取 MP4 第一帧（依赖系统 ffmpeg）。"""
+"""
+高效截取 MP4 第一帧（依赖系统 ffmpeg）。
+URL 默认交给 ffmpeg 直接读取：HTTP 支持 Range，ffmpeg 只按需读取 moov 与首个关键帧附近的数据，
+不下载整个文件；直读失败（如服务端不支持 Range、超时）时回退为下载到临时文件再截帧。
+批量模式（--batch）：输入列表文件（每行 file '...'）或目录，进程池并发截帧，输出 JSON/CSV 清单，已存在的输出跳过。
+capture_first_frame_bytes：ffmpeg 以 image2pipe 把图片写到 stdout，直接返回 PNG/JPEG 字节（可缩放），不落盘。
+缓存（--cache）：按来源标识（URL 的 ETag/大小，本地文件的 mtime/大小）+ 格式 + 缩放滤镜缓存截图，命中时不调用 ffmpeg，见 thumb_cache.py；
+capture_first_frame_bytes（/frame/first 接口）默认使用同一缓存。
+public_only（对外接口用）：URL 由 url_guard 逐跳校验、直连公网 IP 取流后经管道交给 ffmpeg，
+ffmpeg 只允许 pipe/file 协议且强制 mov/mp4 格式，不会自行访问网络或解析播放列表。
+"""
 
 import os
 import sys
+import csv
+import json
+import time
+import hashlib
 import subprocess
+import shutil
 import tempfile
+import threading
 import argparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import thumb_cache
+import url_guard
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+# 列表解析与合并脚本共用项目根目录的 manifest.py
+_PROJECT_DIR = os.path.dirname(BASE_DIR)
+if _PROJECT_DIR not in sys.path:
+    sys.path.append(_PROJECT_DIR)
+
+import manifest
+
 TMP_DIR = os.path.join(BASE_DIR, "tmp")
+# 直接读取 URL 时单次网络读写的超时（秒），超时即回退下载
+URL_RW_TIMEOUT = 15
+# public_only 模式 ffmpeg 的输入限制：只允许本地协议，强制按 mov/mp4 解析（不解析 HLS、concat 等播放列表）
+SAFE_INPUT_FORMAT = "mov"
+# 批量模式默认并发进程数、目录输入时收集的视频扩展名
+BATCH_WORKERS = 4
+VIDEO_EXTS = (".mp4", ".mov", ".mkv", ".flv", ".ts", ".m4v")
 
 try:
     import requests
@@ -29,15 +64,23 @@ def download_from_url(url, save_path, timeout=60):
                 f.write(chunk)
 
 
-def capture_first_frame_ffmpeg(video_path, output_path, format="png", ffmpeg_cmd="ffmpeg"):
+def capture_first_frame_ffmpeg(video_path, output_path, format="png", ffmpeg_cmd="ffmpeg", input_args=None):
+    """
+    :param video_path: 本地路径或 http(s) URL
+    :param input_args: 放在 -i 之前的输入参数（如 URL 的 -rw_timeout）
+    """
     args = [
         ffmpeg_cmd,
         "-y",
+    ]
+    args.extend(input_args or [])
+    args.extend([
         "-i", video_path,
         "-vframes", "1",
-    ]
-    if format.lower() == "jpg" or output_path.lower().endswith(".jpg"):
-        args.extend(["-vf", "scale=trunc(iw/2)*2:trunc(ih/2)*2"])
+    ])
+    vf = _scale_filter("jpg" if format.lower() == "jpg" or output_path.lower().endswith(".jpg") else "png")
+    if vf:
+        args.extend(["-vf", vf])
     args.extend(["-q:v", "2", output_path])
     result = subprocess.run(
         args,
@@ -50,35 +93,74 @@ def capture_first_frame_ffmpeg(video_path, output_path, format="png", ffmpeg_cmd
     return os.path.abspath(output_path)
 
 
-def capture_first_frame(source, output_path=None, format="png", ffmpeg_cmd="ffmpeg"):
+def _url_input_args():
+    """直接读取 URL 的输入参数：网络读写超时（微秒）。"""
+    return ["-rw_timeout", str(URL_RW_TIMEOUT * 1000000)]
+
+
+def capture_first_frame(source, output_path=None, format="png", ffmpeg_cmd="ffmpeg", direct=True, cache=None):
+    """
+    截取第一帧。
+    :param source: 视频 URL 或本地文件路径
+    :param direct: URL 时先让 ffmpeg 直接读取（只取所需字节），失败再下载整个文件；False 则总是先下载
+    :param cache: True 使用默认缓存，或传入 thumb_cache.ThumbCache；命中且未指定 output_path 时直接返回缓存图片路径
+    :return: 输出图片的绝对路径
+    """
     ext = "png" if format.lower() not in ("jpg", "jpeg") else "jpg"
     is_url = source.startswith("http://") or source.startswith("https://")
+    if not is_url and not os.path.isfile(source):
+        raise FileNotFoundError("本地文件不存在: {}".format(source))
+
+    store = thumb_cache.default_cache() if cache is True else cache
+    key = store.key_for(source, ext, scale=_scale_filter(ext)) if store else None
+    if key:
+        hit = store.get(key, ext)
+        if hit:
+            if output_path is None:
+                return hit
+            shutil.copyfile(hit, output_path.rstrip())
+            return os.path.abspath(output_path.rstrip())
+
+    out = _capture_first_frame(source, output_path, ext, ffmpeg_cmd, direct)
+    if key:
+        try:
+            store.put(key, ext, out)
+        except OSError as e:
+            print("写入缩略图缓存失败: {}".format(e), file=sys.stderr)
+    return out
+
+
+def _capture_first_frame(source, output_path, ext, ffmpeg_cmd, direct):
+    """capture_first_frame 的无缓存实现。"""
+    is_url = source.startswith("http://") or source.startswith("https://")
     temp_path = None
     os.makedirs(TMP_DIR, exist_ok=True)
 
     try:
-        if is_url:
-            fd, temp_path = tempfile.mkstemp(suffix=".mp4", dir=TMP_DIR)
-            os.close(fd)
-            download_from_url(source, temp_path)
-            video_path = temp_path
-        else:
-            if not os.path.isfile(source):
-                raise FileNotFoundError("本地文件不存在: {}".format(source))
-            video_path = source
-
         if output_path is None:
             if is_url:
                 base = os.path.splitext(os.path.basename(source.split("?")[0].rstrip("/")))[0]
             else:
-                base = os.path.splitext(os.path.basename(video_path))[0]
+                base = os.path.splitext(os.path.basename(source))[0]
             if not base or base.endswith(".mp4"):
                 base = "frame"
             output_path = os.path.join(TMP_DIR, base + "_first_frame." + ext)
         else:
             output_path = output_path.rstrip()
 
-        return capture_first_frame_ffmpeg(video_path, output_path, format=ext, ffmpeg_cmd=ffmpeg_cmd)
+        if not is_url:
+            return capture_first_frame_ffmpeg(source, output_path, format=ext, ffmpeg_cmd=ffmpeg_cmd)
+        if direct:
+            try:
+                return capture_first_frame_ffmpeg(
+                    source, output_path, format=ext, ffmpeg_cmd=ffmpeg_cmd, input_args=_url_input_args()
+                )
+            except (RuntimeError, subprocess.TimeoutExpired) as e:
+                print("直接读取 URL 失败，改为下载后截帧: {}".format(str(e)[:200]), file=sys.stderr)
+        fd, temp_path = tempfile.mkstemp(suffix=".mp4", dir=TMP_DIR)
+        os.close(fd)
+        download_from_url(source, temp_path)
+        return capture_first_frame_ffmpeg(temp_path, output_path, format=ext, ffmpeg_cmd=ffmpeg_cmd)
     finally:
         if temp_path and os.path.isfile(temp_path):
             try:
@@ -87,22 +169,354 @@ def capture_first_frame(source, output_path=None, format="png", ffmpeg_cmd="ffmp
                 pass
 
 
+def _scale_filter(ext, width=None, height=None):
+    """缩放滤镜：只给一边时另一边按比例（-2 保证偶数）；都不给时 jpg 仅取偶数宽高，png 不缩放。"""
+    if width or height:
+        return "scale={}:{}".format(int(width) if width else -2, int(height) if height else -2)
+    if ext == "jpg":
+        return "scale=trunc(iw/2)*2:trunc(ih/2)*2"
+    return None
+
+
+def _image_pipe_args(ffmpeg_cmd, video_path, ext, width, height, input_args, nostdin=True):
+    args = [ffmpeg_cmd]
+    if nostdin:
+        args.append("-nostdin")
+    args.extend(input_args or [])
+    args.extend(["-i", video_path, "-vframes", "1"])
+    vf = _scale_filter(ext, width, height)
+    if vf:
+        args.extend(["-vf", vf])
+    args.extend(["-f", "image2pipe", "-vcodec", "mjpeg" if ext == "jpg" else "png", "-q:v", "2", "pipe:1"])
+    return args
+
+
+def _safe_input_args(protocol):
+    return ["-protocol_whitelist", protocol, "-f", SAFE_INPUT_FORMAT]
+
+
+def _first_frame_to_stdout(video_path, ext, ffmpeg_cmd, width=None, height=None, input_args=None):
+    """ffmpeg 截第一帧并以 image2pipe 写到 stdout，返回图片字节。"""
+    args = _image_pipe_args(ffmpeg_cmd, video_path, ext, width, height, input_args)
+    result = subprocess.run(args, capture_output=True, timeout=30)
+    if result.returncode != 0 or not result.stdout:
+        stderr = (result.stderr or b"").decode("utf-8", errors="replace")
+        raise RuntimeError("ffmpeg 执行失败: {}".format(stderr.strip() or result.returncode))
+    return result.stdout
+
+
+def _first_frame_from_response(response, ext, ffmpeg_cmd, width=None, height=None, timeout=30):
+    """
+    把 HTTP 响应体经 stdin 管道喂给 ffmpeg（pipe 协议、强制 mov 格式）截第一帧，返回图片字节。
+    moov 在文件头时 ffmpeg 读到首帧即退出，不下载整个文件；moov 在文件尾时管道无法回读，抛 RuntimeError。
+    """
+    args = _image_pipe_args(
+        ffmpeg_cmd, "pipe:0", ext, width, height, _safe_input_args("pipe"), nostdin=False
+    )
+    proc = subprocess.Popen(args, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    stderr = []
+
+    def _feed():
+        try:
+            for chunk in response.iter_content(chunk_size=65536):
+                if chunk:
+                    proc.stdin.write(chunk)
+        except (OSError, ValueError):
+            pass  # ffmpeg 已取到首帧退出（BrokenPipe），或被超时终止
+        except Exception as e:
+            stderr.append("读取 URL 失败: {}".format(e).encode("utf-8"))
+        finally:
+            try:
+                proc.stdin.close()
+            except OSError:
+                pass
+
+    feeder = threading.Thread(target=_feed, daemon=True)
+    reader = threading.Thread(target=lambda: stderr.append(proc.stderr.read()), daemon=True)
+    timer = threading.Timer(timeout, proc.kill)
+    feeder.start()
+    reader.start()
+    timer.start()
+    try:
+        data = proc.stdout.read()
+        proc.wait()
+    finally:
+        timer.cancel()
+        response.close()
+    feeder.join()
+    reader.join()
+    if proc.returncode != 0 or not data:
+        text = b"".join(stderr).decode("utf-8", errors="replace").strip()
+        raise RuntimeError("ffmpeg 执行失败: {}".format(text or proc.returncode))
+    return data
+
+
+def _open_public_ok(url):
+    r = url_guard.open_public(url, timeout=URL_RW_TIMEOUT)
+    try:
+        r.raise_for_status()
+    except Exception:
+        r.close()
+        raise
+    return r
+
+
+def _first_frame_public(source, ext, ffmpeg_cmd, width, height):
+    """public_only 模式截帧：URL 经 url_guard 取流，ffmpeg 只读管道或本地临时文件。"""
+    if not (source.startswith("http://") or source.startswith("https://")):
+        return _first_frame_to_stdout(source, ext, ffmpeg_cmd, width, height, input_args=_safe_input_args("file"))
+    try:
+        return _first_frame_from_response(_open_public_ok(source), ext, ffmpeg_cmd, width, height)
+    except RuntimeError as e:
+        print("管道读取 URL 失败，改为下载后截帧: {}".format(str(e)[:200]), file=sys.stderr)
+    os.makedirs(TMP_DIR, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(suffix=".mp4", dir=TMP_DIR)
+    r = _open_public_ok(source)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            for chunk in r.iter_content(chunk_size=65536):
+                if chunk:
+                    f.write(chunk)
+        r.close()
+        return _first_frame_to_stdout(temp_path, ext, ffmpeg_cmd, width, height, input_args=_safe_input_args("file"))
+    finally:
+        r.close()
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+
+
+def capture_first_frame_bytes(
+    source, format="png", ffmpeg_cmd="ffmpeg", width=None, height=None, direct=True, cache=True, public_only=False
+):
+    """
+    截取第一帧并直接返回图片字节，不写输出文件。
+    :param source: 视频 URL 或本地文件路径
+    :param format: png 或 jpg
+    :param width, height: 输出尺寸；只给一边时按比例缩放，都不给时保持原尺寸
+    :param direct: URL 时先让 ffmpeg 直接读取，失败再下载到临时文件（mp4 的 moov 可能在文件尾，无法从管道读取）
+    :param cache: True 使用默认缓存，或传入 thumb_cache.ThumbCache，False/None 不缓存；键含缩放滤镜，
+        不同尺寸各自缓存，与 capture_first_frame 同格式、同尺寸的截图共用缓存
+    :param public_only: 对外接口用（防 SSRF）：URL 只访问公网地址（逐跳校验重定向、直连校验过的 IP），
+        ffmpeg 不直接访问网络、只允许本地协议并强制 mov/mp4 格式；direct 参数被忽略
+    :return: PNG/JPEG 字节
+    """
+    ext = "png" if format.lower() not in ("jpg", "jpeg") else "jpg"
+    is_url = source.startswith("http://") or source.startswith("https://")
+    if not is_url and not os.path.isfile(source):
+        raise FileNotFoundError("本地文件不存在: {}".format(source))
+
+    store = thumb_cache.default_cache() if cache is True else cache
+    scale = _scale_filter(ext, width, height)
+    key = store.key_for(source, ext, scale=scale, public_only=public_only) if store else None
+    if key:
+        hit = store.get(key, ext)
+        if hit:
+            try:
+                with open(hit, "rb") as f:
+                    return f.read()
+            except (IOError, OSError):
+                pass  # 刚被淘汰，重新截取
+
+    if public_only:
+        data = _first_frame_public(source, ext, ffmpeg_cmd, width, height)
+    else:
+        data = _capture_first_frame_bytes(source, ext, ffmpeg_cmd, width, height, direct)
+    if key:
+        try:
+            store.put_bytes(key, ext, data)
+        except OSError as e:
+            print("写入缩略图缓存失败: {}".format(e), file=sys.stderr)
+    return data
+
+
+def _capture_first_frame_bytes(source, ext, ffmpeg_cmd, width, height, direct):
+    """capture_first_frame_bytes 的无缓存实现。"""
+    is_url = source.startswith("http://") or source.startswith("https://")
+    if not is_url:
+        return _first_frame_to_stdout(source, ext, ffmpeg_cmd, width, height)
+    if direct:
+        try:
+            return _first_frame_to_stdout(source, ext, ffmpeg_cmd, width, height, input_args=_url_input_args())
+        except (RuntimeError, subprocess.TimeoutExpired) as e:
+            print("直接读取 URL 失败，改为下载后截帧: {}".format(str(e)[:200]), file=sys.stderr)
+    os.makedirs(TMP_DIR, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(suffix=".mp4", dir=TMP_DIR)
+    os.close(fd)
+    try:
+        download_from_url(source, temp_path)
+        return _first_frame_to_stdout(temp_path, ext, ffmpeg_cmd, width, height)
+    finally:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+
+
+def collect_sources(list_or_dir):
+    """
+    批量输入，返回 ManifestEntry 的可迭代对象：目录则收集其中视频文件（按文件名排序），
+    否则逐行流式解析列表文件（manifest.iter_entries，不整体载入内存）。
+    """
+    if os.path.isdir(list_or_dir):
+        names = sorted(n for n in os.listdir(list_or_dir) if n.lower().endswith(VIDEO_EXTS))
+        return manifest.as_entries(os.path.join(list_or_dir, n) for n in names)
+    if not os.path.isfile(list_or_dir):
+        raise FileNotFoundError("列表文件或目录不存在: {}".format(list_or_dir))
+    return manifest.iter_entries(list_or_dir)
+
+
+def batch_output_path(source, out_dir, ext):
+    """批量输出文件名：<源文件名>_<源 md5 前 8 位>.<ext>，同一来源每次得到相同路径，不同来源同名也不冲突。"""
+    is_url = source.startswith("http://") or source.startswith("https://")
+    name = source.split("?")[0].rstrip("/") if is_url else source
+    base = os.path.splitext(os.path.basename(name))[0] or "frame"
+    digest = hashlib.md5(source.encode("utf-8")).hexdigest()[:8]
+    return os.path.join(out_dir, "{}_{}.{}".format(base, digest, ext))
+
+
+def _batch_task(args):
+    """进程池任务：截取一个来源的第一帧，返回清单记录。"""
+    source, output_path, ext, ffmpeg_cmd, direct, cache = args
+    t0 = time.time()
+    record = {"source": source, "image": os.path.abspath(output_path), "status": "ok", "error": ""}
+    try:
+        capture_first_frame(
+            source, output_path=output_path, format=ext, ffmpeg_cmd=ffmpeg_cmd, direct=direct, cache=cache
+        )
+    except Exception as e:
+        record["status"] = "error"
+        record["error"] = str(e)[:500]
+    record["seconds"] = round(time.time() - t0, 3)
+    record["bytes"] = os.path.getsize(output_path) if os.path.isfile(output_path) else 0
+    return record
+
+
+def write_manifest(records, manifest_path):
+    """按扩展名写 JSON（.json）或 CSV（.csv）清单。"""
+    parent = os.path.dirname(manifest_path)
+    if parent:
+        os.makedirs(parent, exist_ok=True)
+    if manifest_path.lower().endswith(".csv"):
+        fields = ["source", "image", "status", "bytes", "seconds", "error"]
+        with open(manifest_path, "w", encoding="utf-8", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=fields)
+            writer.writeheader()
+            for r in records:
+                writer.writerow(dict((k, r.get(k, "")) for k in fields))
+    else:
+        with open(manifest_path, "w", encoding="utf-8") as f:
+            json.dump(records, f, ensure_ascii=False, indent=2)
+    return os.path.abspath(manifest_path)
+
+
+def capture_first_frames_batch(
+    sources,
+    out_dir=None,
+    format="png",
+    ffmpeg_cmd="ffmpeg",
+    workers=BATCH_WORKERS,
+    manifest_path=None,
+    direct=True,
+    skip_existing=True,
+    cache=False,
+):
+    """
+    批量截取第一帧：有界进程池并发执行 capture_first_frame，按输入顺序返回清单记录并写出清单文件。
+    sources 按需取用，已提交未完成的任务不超过 2 * workers，列表再长也不会一次展开成任务列表。
+    :param sources: 视频 URL / 本地路径的可迭代对象，或 ManifestEntry（如 collect_sources 的结果，可为生成器）
+    :param out_dir: 输出目录（默认 tmp/）
+    :param workers: 并发进程数
+    :param manifest_path: 清单路径，.json 或 .csv（默认 <out_dir>/manifest.json）
+    :param skip_existing: 输出图片已存在时跳过（status 为 skipped）
+    :param cache: 各进程使用默认缩略图缓存（thumb_cache.CACHE_DIR）
+    :return: 清单记录列表，每项含 source、image、status（ok / skipped / error）、bytes、seconds、error
+    """
+    ext = "png" if format.lower() not in ("jpg", "jpeg") else "jpg"
+    out_dir = out_dir or TMP_DIR
+    os.makedirs(out_dir, exist_ok=True)
+    manifest_path = manifest_path or os.path.join(out_dir, "manifest.json")
+
+    workers = max(1, workers)
+    records = []
+    # (记录下标, Future)，按提交顺序取结果
+    pending = deque()
+
+    def _collect(i, future):
+        records[i] = future.result()
+        print("[{}] {} {} ({}s)".format(i + 1, records[i]["status"], records[i]["source"][:80], records[i]["seconds"]))
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for entry in manifest.as_entries(sources):
+            source = entry.source
+            output_path = batch_output_path(source, out_dir, ext)
+            records.append(None)
+            if skip_existing and os.path.isfile(output_path):
+                records[-1] = {
+                    "source": source, "image": os.path.abspath(output_path), "status": "skipped",
+                    "bytes": os.path.getsize(output_path), "seconds": 0, "error": "",
+                }
+                continue
+            task = (source, output_path, ext, ffmpeg_cmd, direct, bool(cache))
+            pending.append((len(records) - 1, pool.submit(_batch_task, task)))
+            while len(pending) >= workers * 2:
+                _collect(*pending.popleft())
+        while pending:
+            _collect(*pending.popleft())
+    write_manifest(records, manifest_path)
+    return records
+
+
 def main():
     parser = argparse.ArgumentParser(
         description="高效截取 MP4 第一帧（依赖系统 ffmpeg）"
     )
-    parser.add_argument("source", help="视频 URL 或本地文件路径")
-    parser.add_argument("-o", "--output", default=None, help="输出图片路径（默认自动生成）")
+    parser.add_argument("source", help="视频 URL 或本地文件路径；--batch 时为列表文件或目录")
+    parser.add_argument("-o", "--output", default=None, help="输出图片路径（默认自动生成）；--batch 时为输出目录（默认 tmp/）")
     parser.add_argument("-f", "--format", default="png", help="图片格式 png|jpg（默认 png）")
     parser.add_argument("--ffmpeg", default="ffmpeg", help="ffmpeg 可执行路径（默认 ffmpeg）")
+    parser.add_argument("--download", action="store_true", help="URL 时先下载整个文件再截帧（默认 ffmpeg 直接读取，失败才下载）")
+    parser.add_argument("--batch", action="store_true", help="批量模式：source 为列表文件（每行 file '...'）或目录")
+    parser.add_argument("--workers", type=int, default=BATCH_WORKERS, help="批量模式并发进程数（默认 {}）".format(BATCH_WORKERS))
+    parser.add_argument("--manifest", default=None, help="批量模式清单路径，.json 或 .csv（默认 <输出目录>/manifest.json）")
+    parser.add_argument("--no-skip", action="store_true", help="批量模式下不跳过已存在的输出")
+    parser.add_argument("--cache", action="store_true", help="使用缩略图缓存（tmp/thumb_cache，按来源标识+格式，LRU 淘汰）")
     args = parser.parse_args()
 
+    if args.batch:
+        try:
+            records = capture_first_frames_batch(
+                collect_sources(args.source),
+                out_dir=args.output,
+                format=args.format,
+                ffmpeg_cmd=args.ffmpeg,
+                workers=args.workers,
+                manifest_path=args.manifest,
+                direct=not args.download,
+                skip_existing=not args.no_skip,
+                cache=args.cache,
+            )
+        except Exception as e:
+            print("错误: {}".format(e), file=sys.stderr)
+            sys.exit(1)
+        failed = sum(1 for r in records if r["status"] == "error")
+        print("共 {} 个，成功 {}，跳过 {}，失败 {}".format(
+            len(records), sum(1 for r in records if r["status"] == "ok"),
+            sum(1 for r in records if r["status"] == "skipped"), failed,
+        ))
+        if failed:
+            sys.exit(1)
+        return
+
     try:
         out = capture_first_frame(
             args.source,
             output_path=args.output,
             format=args.format,
             ffmpeg_cmd=args.ffmpeg,
+            direct=not args.download,
+            cache=args.cache or None,
         )
         print("第一帧已保存: {}".format(out))
     except FileNotFoundError as e:
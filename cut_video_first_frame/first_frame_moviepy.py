@@ -3,6 +3,7 @@
 """
 从远程 OSS 的 mp4 视频资源截取第一帧为图片。
 支持：HTTP(S) URL、本地文件路径。
+URL 默认由 MoviePy 内部的 ffmpeg 直接读取（HTTP Range 按需取数据，不下载整个文件），失败时回退为先下载再截帧。
 """
 
 import os
@@ -28,38 +29,48 @@ def download_from_url(url, save_path, timeout=60):
                 f.write(chunk)
 
 
-def capture_first_frame(source, output_path=None, format="png"):
+def _save_first_frame(video_path, output_path):
+    clip = VideoFileClip(video_path)
+    try:
+        clip.save_frame(output_path, t=0)
+    finally:
+        clip.close()
+    return os.path.abspath(output_path)
+
+
+def capture_first_frame(source, output_path=None, format="png", direct=True):
     """
     截取视频第一帧。
     :param source: 视频来源，可为 HTTP(S) URL 或本地文件路径
     :param output_path: 输出图片路径，不传则根据 source 自动生成
     :param format: 图片格式，如 png、jpg
+    :param direct: URL 时先直接读取（只取所需字节），失败再下载整个文件；False 则总是先下载
     :return: 输出图片的绝对路径
     """
     is_url = source.startswith("http://") or source.startswith("https://")
     temp_path = None
 
     try:
-        if is_url:
-            fd, temp_path = tempfile.mkstemp(suffix=".mp4")
-            os.close(fd)
-            download_from_url(source, temp_path)
-            video_path = temp_path
-        else:
-            if not os.path.isfile(source):
-                raise FileNotFoundError("本地文件不存在: {}".format(source))
-            video_path = source
+        if not is_url and not os.path.isfile(source):
+            raise FileNotFoundError("本地文件不存在: {}".format(source))
 
         if output_path is None:
-            base = os.path.splitext(os.path.basename(video_path))[0]
+            base = os.path.splitext(os.path.basename(source.split("?")[0] if is_url else source))[0]
             if not base or base.endswith(".mp4"):
                 base = "frame"
             output_path = base + "_first_frame." + format.lstrip(".")
 
-        clip = VideoFileClip(video_path)
-        clip.save_frame(output_path, t=0)
-        clip.close()
-        return os.path.abspath(output_path)
+        if not is_url:
+            return _save_first_frame(source, output_path)
+        if direct:
+            try:
+                return _save_first_frame(source, output_path)
+            except Exception as e:
+                print("直接读取 URL 失败，改为下载后截帧: {}".format(str(e)[:200]), file=sys.stderr)
+        fd, temp_path = tempfile.mkstemp(suffix=".mp4")
+        os.close(fd)
+        download_from_url(source, temp_path)
+        return _save_first_frame(temp_path, output_path)
     finally:
         if temp_path and os.path.isfile(temp_path):
             try:
@@ -73,10 +84,11 @@ def main():
     parser.add_argument("source", help="视频 URL 或本地文件路径")
     parser.add_argument("-o", "--output", default=None, help="输出图片路径（默认自动生成）")
     parser.add_argument("-f", "--format", default="png", help="图片格式，如 png、jpg（默认 png）")
+    parser.add_argument("--download", action="store_true", help="URL 时先下载整个文件再截帧（默认直接读取，失败才下载）")
     args = parser.parse_args()
 
     try:
-        out = capture_first_frame(args.source, args.output, args.format)
+        out = capture_first_frame(args.source, args.output, args.format, direct=not args.download)
         print("第一帧已保存: {}".format(out))
     except Exception as e:
         print("错误: {}".format(e), file=sys.stderr)
@@ -0,0 +1,209 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+首帧缩略图持久缓存。
+- 键：来源标识 + 输出格式 + 缩放参数。URL 用 HEAD 得到的 ETag / Content-Length / Last-Modified（进程内按 URL 记忆，有时长与条数上限），
+  本地文件用绝对路径 + mtime + 大小；内容变化即键变化，不会取到旧图
+- 按总字节数 LRU 淘汰：命中时更新文件 mtime 作为最近使用时间，写入后超出上限则从最久未用的开始删除
+- 命中只做字典查找与一次 utime，不调用 ffmpeg
+"""
+
+import hashlib
+import os
+from collections import OrderedDict
+import shutil
+import threading
+import time
+
+import url_guard
+
+try:
+    import requests
+except ImportError:
+    requests = None
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CACHE_DIR = os.path.join(BASE_DIR, "tmp", "thumb_cache")
+# 缓存总大小上限（字节）
+CACHE_MAX_BYTES = 512 * 1024 * 1024
+# URL 的 HEAD 结果在进程内的记忆时长（秒）与最多记忆的 URL 数
+HEAD_MEMO_TTL = 300
+HEAD_MEMO_MAX_ENTRIES = 4096
+HEAD_TIMEOUT = 10
+
+# 按写入时间排序：写入时先删掉开头已过期的条目，再按条数上限删除最早写入的
+_head_memo = OrderedDict()
+_head_lock = threading.Lock()
+
+
+def _url_identity(url, public_only=False):
+    """
+    HEAD 请求取 ETag / Content-Length / Last-Modified；都取不到或请求失败返回 None（不缓存）。
+    public_only 时经 url_guard 请求（逐跳校验重定向、直连公网 IP），非公网地址同样返回 None。
+    """
+    now = time.time()
+    memo_key = (url, public_only)
+    with _head_lock:
+        memo = _head_memo.get(memo_key)
+        if memo and now - memo[0] < HEAD_MEMO_TTL:
+            return memo[1]
+    if requests is None:
+        return None
+    try:
+        if public_only:
+            r = url_guard.open_public(url, method="HEAD", timeout=HEAD_TIMEOUT)
+            r.close()
+        else:
+            r = requests.head(url, allow_redirects=True, timeout=HEAD_TIMEOUT)
+        r.raise_for_status()
+    except Exception:
+        return None
+    etag = r.headers.get("ETag", "")
+    length = r.headers.get("Content-Length", "")
+    modified = r.headers.get("Last-Modified", "")
+    identity = None
+    if etag or length:
+        identity = "url|{}|{}|{}|{}".format(url, etag, length, modified)
+    with _head_lock:
+        _head_memo.pop(memo_key, None)
+        _head_memo[memo_key] = (now, identity)
+        while _head_memo:
+            oldest = next(iter(_head_memo.values()))
+            if now - oldest[0] < HEAD_MEMO_TTL and len(_head_memo) <= HEAD_MEMO_MAX_ENTRIES:
+                break
+            _head_memo.popitem(last=False)
+    return identity
+
+
+def source_identity(source, public_only=False):
+    """来源标识字符串；无法确定（URL 无 ETag/大小、本地文件不存在）时返回 None。public_only 见 _url_identity。"""
+    if source.startswith("http://") or source.startswith("https://"):
+        return _url_identity(source, public_only)
+    try:
+        st = os.stat(source)
+    except OSError:
+        return None
+    return "file|{}|{}|{}".format(os.path.abspath(source), st.st_mtime_ns, st.st_size)
+
+
+class ThumbCache(object):
+    """
+    缓存目录下每个键一个图片文件 <sha1>.<ext>。索引（键 -> 大小、最近使用时间）首次使用时扫描目录建立，
+    多进程共用同一目录时写入为临时文件 + os.replace，淘汰时文件已被删除则忽略。
+    """
+
+    def __init__(self, cache_dir=None, max_bytes=CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir or CACHE_DIR
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._index = None  # name -> [size, last_used]
+        self._total = 0
+
+    def key_for(self, source, fmt, scale=None, public_only=False):
+        """缓存键（sha1 十六进制）；来源标识不可得时返回 None。public_only 见 _url_identity。"""
+        identity = source_identity(source, public_only)
+        if identity is None:
+            return None
+        raw = "{}|{}|{}".format(identity, fmt.lower(), scale or "")
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    def _path(self, key, fmt):
+        return os.path.join(self.cache_dir, "{}.{}".format(key, fmt.lower()))
+
+    def _load_index(self):
+        """需持有 _lock。"""
+        if self._index is not None:
+            return
+        self._index = {}
+        self._total = 0
+        if not os.path.isdir(self.cache_dir):
+            return
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(".tmp"):
+                continue
+            try:
+                st = os.stat(os.path.join(self.cache_dir, name))
+            except OSError:
+                continue
+            self._index[name] = [st.st_size, st.st_mtime]
+            self._total += st.st_size
+
+    def get(self, key, fmt):
+        """命中返回缓存图片路径并标记为最近使用，未命中返回 None。"""
+        path = self._path(key, fmt)
+        name = os.path.basename(path)
+        now = time.time()
+        with self._lock:
+            self._load_index()
+            entry = self._index.get(name)
+            if entry is None:
+                # 可能由其他进程写入
+                if not os.path.isfile(path):
+                    return None
+                entry = self._index[name] = [os.path.getsize(path), now]
+                self._total += entry[0]
+            entry[1] = now
+        try:
+            os.utime(path, (now, now))
+        except OSError:
+            with self._lock:
+                self._forget(name)
+            return None
+        return path
+
+    def put(self, key, fmt, image_path):
+        """复制 image_path 到缓存，必要时淘汰；返回缓存图片路径。"""
+        return self._store(key, fmt, lambda tmp_path: shutil.copyfile(image_path, tmp_path))
+
+    def put_bytes(self, key, fmt, data):
+        """把图片字节写入缓存，必要时淘汰；返回缓存图片路径。"""
+        def _write(tmp_path):
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+        return self._store(key, fmt, _write)
+
+    def _store(self, key, fmt, write):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._path(key, fmt)
+        tmp_path = "{}.{}.{}.tmp".format(path, os.getpid(), threading.get_ident())
+        write(tmp_path)
+        os.replace(tmp_path, path)
+        size = os.path.getsize(path)
+        with self._lock:
+            self._load_index()
+            name = os.path.basename(path)
+            self._forget(name)
+            self._index[name] = [size, time.time()]
+            self._total += size
+            self._evict()
+        return path
+
+    def _forget(self, name):
+        """需持有 _lock。"""
+        entry = self._index.pop(name, None)
+        if entry is not None:
+            self._total -= entry[0]
+
+    def _evict(self):
+        """总大小超过 max_bytes 时按最近使用时间从旧到新删除（需持有 _lock）。"""
+        if self._total <= self.max_bytes:
+            return
+        for name, _ in sorted(self._index.items(), key=lambda kv: kv[1][1]):
+            if self._total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+            except OSError:
+                pass
+            self._forget(name)
+
+
+_default_cache = None
+
+
+def default_cache():
+    """进程内共享的默认缓存（CACHE_DIR、CACHE_MAX_BYTES）。"""
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = ThumbCache()
+    return _default_cache
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+对外接口（如 /frame/first）访问用户给出的 URL 时的 SSRF 防护。
+- 只允许 http(s)；主机解析出的每个地址都须是公网地址（ipaddress.is_global），否则拒绝
+- 请求直连校验过的 IP：URL 主机换成该 IP，Host 头与 HTTPS 的 SNI / 证书校验仍用原主机名，
+  校验之后 DNS 再变化（DNS rebinding）也连不到其他地址；不走环境变量代理
+- 不自动跟随重定向：每一跳的 Location 都重新校验、重新解析后再请求，最多 MAX_REDIRECTS 跳
+"""
+
+import ipaddress
+import socket
+from urllib.parse import urljoin, urlsplit, urlunsplit
+
+try:
+    import requests
+    from requests.adapters import HTTPAdapter
+except ImportError:
+    requests = None
+    HTTPAdapter = object
+
+MAX_REDIRECTS = 5
+
+
+class UnsafeURLError(ValueError):
+    """URL 不是可访问的公网 http(s) 地址。"""
+
+
+def _is_public(ip):
+    return ip.is_global
+
+
+def resolve_public(url):
+    """
+    校验 url 并解析主机。
+    :return: (urlsplit 结果, 校验过的 ipaddress 对象)
+    :raises UnsafeURLError: 非 http(s)、无法解析或解析出非公网地址
+    """
+    parts = urlsplit(url)
+    if parts.scheme.lower() not in ("http", "https") or not parts.hostname:
+        raise UnsafeURLError("只支持 http(s) URL")
+    try:
+        port = parts.port or (443 if parts.scheme.lower() == "https" else 80)
+        infos = socket.getaddrinfo(parts.hostname, port, proto=socket.IPPROTO_TCP)
+    except (socket.gaierror, UnicodeError, ValueError) as e:
+        raise UnsafeURLError("无法解析主机 {}: {}".format(parts.hostname, e))
+    ips = [ipaddress.ip_address(info[4][0].split("%", 1)[0]) for info in infos]
+    if not ips or not all(_is_public(ip) for ip in ips):
+        raise UnsafeURLError("不允许访问内网地址: {}".format(parts.hostname))
+    return parts, ips[0]
+
+
+class _PinnedHTTPSAdapter(HTTPAdapter):
+    """连接 URL 中的 IP，TLS 的 SNI 与证书主机名校验使用原主机名。"""
+
+    def __init__(self, hostname):
+        self._hostname = hostname
+        super(_PinnedHTTPSAdapter, self).__init__(max_retries=0)
+
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs["server_hostname"] = self._hostname
+        kwargs["assert_hostname"] = self._hostname
+        super(_PinnedHTTPSAdapter, self).init_poolmanager(*args, **kwargs)
+
+
+def open_public(url, method="GET", timeout=30, headers=None, max_redirects=MAX_REDIRECTS):
+    """
+    以流式方式请求公网 URL（逐跳校验重定向、直连校验过的 IP），返回最终的 requests 响应（未校验状态码），
+    调用方读取完后 close()。
+    :raises UnsafeURLError: 任一跳不是公网 http(s) 地址，或重定向次数超过 max_redirects
+    """
+    if requests is None:
+        raise RuntimeError("访问 URL 需安装 requests: pip install requests")
+    for _ in range(max_redirects + 1):
+        parts, ip = resolve_public(url)
+        host = "[{}]".format(ip) if ip.version == 6 else str(ip)
+        netloc = host if parts.port is None else "{}:{}".format(host, parts.port)
+        pinned_url = urlunsplit((parts.scheme, netloc, parts.path or "/", parts.query, ""))
+        session = requests.Session()
+        session.trust_env = False
+        if parts.scheme.lower() == "https":
+            session.mount("https://", _PinnedHTTPSAdapter(parts.hostname))
+        request_headers = dict(headers or {})
+        request_headers["Host"] = parts.netloc.rsplit("@", 1)[-1]
+        r = session.request(
+            method, pinned_url, headers=request_headers, timeout=timeout, stream=True, allow_redirects=False
+        )
+        if not r.is_redirect:
+            return r
+        location = r.headers.get("Location", "")
+        r.close()
+        session.close()
+        url = urljoin(url, location)
+    raise UnsafeURLError("重定向次数超过 {}".format(max_redirects))
@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+合并列表（mapbinlist）解析：各脚本共用。
+- 列表可为本地文件或公网 URL，逐行读取（URL 流式下载），iter_entries 以生成器逐条产出 ManifestEntry，
+  十万行的列表也不必整体载入内存；需要随机访问的调用方才用 load_paths 展开
+- ManifestDigest 增量计算列表 MD5，结果与 md5("\\n".join(paths)) 完全一致，
+  用作合并结果的默认文件名（同列表同文件名）；track() 在流式消费条目的同时计算
+
+列表格式（每行一个，空行与非 file 开头的行忽略）：
+  file 'path/to/a.mp4'
+  file "http://cdn.example.com/b.mp4"
+  file path/to/c.mp4
+"""
+
+import hashlib
+import os
+from collections import namedtuple
+
+try:
+    import requests
+except ImportError:
+    requests = None
+
+LIST_FETCH_TIMEOUT = 30
+
+
+class ManifestEntry(namedtuple("ManifestEntry", ["index", "source", "line_no"])):
+    """
+    列表中的一条：index 为条目序号（从 0 开始，即合并顺序），source 为去掉引号后的路径/URL，
+    line_no 为在列表中的行号（从 1 开始，便于报错定位）。
+    """
+
+    __slots__ = ()
+
+    @property
+    def is_url(self):
+        return self.source.startswith("http://") or self.source.startswith("https://")
+
+
+def parse_line(line):
+    """解析一行：file 'path' / file "path" / file path，返回路径/URL；非条目行返回 None。"""
+    ln = line.strip()
+    if not ln.startswith("file "):
+        return None
+    rest = ln[5:].strip()
+    if (rest.startswith("'") and rest.endswith("'")) or (rest.startswith('"') and rest.endswith('"')):
+        rest = rest[1:-1]
+    return rest or None
+
+
+def _is_url(list_source):
+    return list_source.startswith("http://") or list_source.startswith("https://")
+
+
+def iter_lines(list_source, timeout=LIST_FETCH_TIMEOUT):
+    """逐行读取列表：本地文件按行迭代，URL 流式下载按行产出。"""
+    if _is_url(list_source):
+        if requests is None:
+            raise RuntimeError("从 URL 读取列表需安装 requests: pip install requests")
+        r = requests.get(list_source, stream=True, timeout=timeout)
+        try:
+            r.raise_for_status()
+            # 未声明 charset 时按 UTF-8 解码（requests 对 text/* 默认 ISO-8859-1，中文路径会乱码）
+            if "charset" not in r.headers.get("Content-Type", "").lower():
+                r.encoding = "utf-8"
+            for line in r.iter_lines(decode_unicode=True):
+                yield line
+        finally:
+            r.close()
+        return
+    if not os.path.isfile(list_source):
+        raise IOError("列表文件不存在: {}".format(list_source))
+    with open(list_source, "r", encoding="utf-8") as f:
+        for line in f:
+            yield line
+
+
+def iter_entries_from_lines(lines):
+    """从可迭代的文本行产出 ManifestEntry。"""
+    index = 0
+    for line_no, line in enumerate(lines, 1):
+        source = parse_line(line)
+        if source is not None:
+            yield ManifestEntry(index, source, line_no)
+            index += 1
+
+
+def iter_entries(list_source, timeout=LIST_FETCH_TIMEOUT):
+    """逐条产出列表条目（ManifestEntry）；list_source 为本地路径或 URL。"""
+    return iter_entries_from_lines(iter_lines(list_source, timeout=timeout))
+
+
+def load_paths(list_source, timeout=LIST_FETCH_TIMEOUT):
+    """读取整个列表，返回路径/URL 列表（需要随机访问或多次遍历时使用）。"""
+    return [e.source for e in iter_entries(list_source, timeout=timeout)]
+
+
+def as_entries(items):
+    """
+    把调用方传入的条目统一为 ManifestEntry 生成器：已是 ManifestEntry 的原样产出，
+    路径/URL 字符串按顺序编号（line_no 为 None）。items 可为生成器。
+    """
+    for index, item in enumerate(items):
+        if isinstance(item, ManifestEntry):
+            yield item
+        else:
+            yield ManifestEntry(index, item, None)
+
+
+class ManifestDigest(object):
+    """增量 MD5：逐条 update(source)，hexdigest() 等于 md5("\\n".join(sources))。"""
+
+    def __init__(self):
+        self._md5 = hashlib.md5()
+        self.count = 0
+
+    def update(self, source):
+        if self.count:
+            self._md5.update(b"\n")
+        self._md5.update(source.encode("utf-8"))
+        self.count += 1
+
+    def hexdigest(self):
+        return self._md5.hexdigest()
+
+    def track(self, entries):
+        """原样产出 entries（ManifestEntry），同时逐条计入摘要；消费完后 hexdigest() 即整个列表的 MD5。"""
+        for entry in entries:
+            self.update(entry.source)
+            yield entry
+
+
+def digest_paths(paths):
+    """路径/URL 序列（可为生成器）的列表 MD5。"""
+    digest = ManifestDigest()
+    for source in paths:
+        digest.update(source)
+    return digest.hexdigest()
+
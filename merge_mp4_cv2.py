@@ -3,100 +3,58 @@
 """
 通过 cv2 (OpenCV) 按 mapbinlist.txt 列表高效合并视频，并保留音频。
 - 列表格式与 ffmpeg concat 一致：每行 file 'path' 或 file 'url'
-- 支持本地路径与 http(s) URL（URL 会先下载到临时目录）
+- 支持本地路径与 http(s) URL（URL 由 segment_prefetch 并发预取到临时目录，首段就绪即开始解码，用完即删）
 - 不丢帧，按首段分辨率与 fps 统一输出；分辨率不一致时自动缩放
-- 画质适度压缩（H.264/mp4v），音频由 ffmpeg 按顺序拼接后混流到最终文件
+- 默认写入后端为 cv2.VideoWriter（H.264/mp4v）；--writer ffmpeg 改为帧以 rawvideo（bgr24）管道交给 ffmpeg 多线程 libx264 编码。
+  两种后端都先输出仅视频文件，各段音频解码时逐段转为 aac，全部就绪后再拼接并混流（-c:v copy）
+- --parallel N：分段级多进程模式，各段独立编码为参数一致的中间文件（含音频，无音轨的段补静音），再 -c copy 拼接
+- 解码 / 缩放 / 编码分级流水线：每段一个解码线程（最多 decode_ahead 段同时解码）、缩放线程池、
+  单个按序写入线程，各级之间用有界队列连接，内存占用有上限
 """
 
 import os
 import sys
 import time
+import queue
 import tempfile
 import argparse
 import shutil
 import subprocess
+import threading
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
 
 try:
     import cv2
+    import numpy as np
 except ImportError:
     print("请先安装依赖: pip install opencv-python")
     sys.exit(1)
 
-try:
-    import requests
-except ImportError:
-    requests = None
+import manifest
+from segment_prefetch import PREFETCH_AHEAD, SegmentPrefetcher
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 TMP_DIR = os.path.join(BASE_DIR, "tmp")
 DEFAULT_LIST_PATH = os.path.join(BASE_DIR, "mapbinlist.txt")
+# 默认写入后端（cv2 / ffmpeg）与 ffmpeg 写入后端的默认编码参数
+DEFAULT_WRITER = "cv2"
+DEFAULT_CRF = 23
+DEFAULT_PRESET = "veryfast"
+# 流水线参数：同时解码的分段数、每段解码队列的帧数上限
+DECODE_AHEAD = 2
+FRAME_QUEUE_SIZE = 32
+# 队列轮询间隔（秒），用于在出错停止时及时退出阻塞
+_QUEUE_POLL_SEC = 0.2
+_END = object()
 
 
 def parse_concat_list(list_path):
     """
     解析 concat 列表文件，每行格式：file 'path' 或 file "path" 或 file path。
     返回路径/URL 列表（已去掉引号）。
+    这里需要完整列表：预取器按序号随机访问分段、按分段总数建立解码线程，因此用 load_paths 而非流式 iter_entries。
     """
-    with open(list_path, "r", encoding="utf-8") as f:
-        lines = [ln.strip() for ln in f if ln.strip()]
-    paths = []
-    for ln in lines:
-        if not ln.startswith("file "):
-            continue
-        rest = ln[5:].strip()
-        if (rest.startswith("'") and rest.endswith("'")) or (
-            rest.startswith('"') and rest.endswith('"')
-        ):
-            rest = rest[1:-1]
-        if rest:
-            paths.append(rest)
-    return paths
-
-def download_from_url(url, save_path, timeout=120, verify_ssl=True, max_retries=3):
-    """
-    从 URL 下载文件到本地路径。
-    遇 SSL 不稳定（如 SSLEOFError）时自动重试；仍失败时可配合 --no-verify-ssl 使用。
-    """
-    if requests is None:
-        raise RuntimeError("支持 URL 需安装 requests: pip install requests")
-    last_err = None
-    for attempt in range(max_retries):
-        try:
-            r = requests.get(
-                url, stream=True, timeout=timeout, verify=verify_ssl
-            )
-            r.raise_for_status()
-            with open(save_path, "wb") as f:
-                for chunk in r.iter_content(chunk_size=8192):
-                    if chunk:
-                        f.write(chunk)
-            return
-        except (requests.exceptions.SSLError, requests.exceptions.ConnectionError) as e:
-            last_err = e
-            if attempt < max_retries - 1:
-                time.sleep(1 + attempt)
-            else:
-                if verify_ssl:
-                    raise RuntimeError(
-                        "下载失败(SSL/连接): {}。可尝试加参数: --no-verify-ssl（仅用于可信源）".format(e)
-                    )
-                raise
-    if last_err is not None:
-        raise last_err
-
-
-def resolve_path(item, temp_dir, verify_ssl=True):
-    """若为 URL 则下载到 temp_dir 并返回本地路径，否则校验本地文件存在后返回。"""
-    if item.startswith("http://") or item.startswith("https://"):
-        name = os.path.basename(item.split("?")[0]) or "video_{}.mp4".format(
-            abs(hash(item)) % 100000
-        )
-        local_path = os.path.join(temp_dir, name)
-        download_from_url(item, local_path, verify_ssl=verify_ssl)
-        return local_path
-    if not os.path.isfile(item):
-        raise FileNotFoundError("本地文件不存在: {}".format(item))
-    return item
+    return manifest.load_paths(list_path)
 
 
 def get_video_props(cap):
@@ -124,13 +82,349 @@ def _fourcc_mp4():
     return cv2.VideoWriter_fourcc(*"mp4v")
 
 
-def _mux_audio_with_ffmpeg(video_only_path, local_paths, output_path, audio_bitrate="128k", ffmpeg_bin="ffmpeg"):
+class _FfmpegPipeWriter(object):
+    """
+    ffmpeg 写入后端：帧以 rawvideo（bgr24）经 stdin 管道交给 ffmpeg 子进程，libx264 多线程编码（threads，默认 0 即自动），
+    传入 audio_input（音频输入的 ffmpeg 参数，如单个文件或 anullsrc 静音，须在启动前已完整存在）时作为第二输入，
+    同一进程混入第一条音轨（-map 1:a:0? 无音轨时忽略；统一为 44100Hz 双声道 aac，各段输出可直接拼接；
+    音频以 apad 补齐到视频长度，输出时长总是等于视频时长）。接口与 cv2.VideoWriter 一致：isOpened / write / release。
+    """
+
+    def __init__(
+        self,
+        output_path,
+        size,
+        fps,
+        ffmpeg_bin="ffmpeg",
+        crf=DEFAULT_CRF,
+        preset=DEFAULT_PRESET,
+        lossless=False,
+        audio_input=None,
+        audio_bitrate="128k",
+        threads=0,
+    ):
+        self.output_path = output_path
+        self.returncode = None
+        self._proc = None
+        cmd = [
+            ffmpeg_bin, "-y", "-loglevel", "error",
+            "-f", "rawvideo", "-pix_fmt", "bgr24",
+            "-s", "{}x{}".format(size[0], size[1]),
+            "-r", "{:.6f}".format(fps),
+            "-i", "pipe:0",
+        ]
+        if audio_input:
+            cmd += list(audio_input)
+            cmd += [
+                "-map", "0:v:0", "-map", "1:a:0?",
+                "-c:a", "aac", "-b:a", audio_bitrate, "-ar", "44100", "-ac", "2",
+                # 音频不足时补静音，-shortest 只会在视频结束时截断，输出时长由视频决定，不丢帧
+                "-af", "apad", "-shortest",
+            ]
+        if lossless:
+            cmd += ["-c:v", "ffv1", "-threads", str(threads)]
+        else:
+            cmd += [
+                "-c:v", "libx264", "-preset", preset, "-crf", str(crf),
+                "-pix_fmt", "yuv420p", "-threads", str(threads),
+                "-movflags", "+faststart",
+            ]
+        cmd.append(output_path)
+        self._cmd = cmd
+        self._stderr = tempfile.TemporaryFile()
+        self._proc = subprocess.Popen(
+            self._cmd, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=self._stderr
+        )
+
+    def isOpened(self):
+        return self._proc.poll() is None
+
+    def write(self, frame):
+        try:
+            self._proc.stdin.write(np.ascontiguousarray(frame).data)
+        except (BrokenPipeError, OSError):
+            self.release()
+            raise RuntimeError("ffmpeg 编码进程已退出: {}".format(self.error_text()))
+
+    def release(self):
+        """关闭管道并等待 ffmpeg 结束，返回退出码（可重复调用）。"""
+        if self.returncode is None:
+            try:
+                self._proc.stdin.close()
+            except (BrokenPipeError, OSError):
+                pass
+            self.returncode = self._proc.wait()
+        return self.returncode
+
+    def error_text(self):
+        """ffmpeg stderr 的末尾部分。"""
+        self._stderr.seek(0)
+        return self._stderr.read().decode("utf-8", "replace").strip()[-2000:]
+
+
+def _put_until_stopped(q, item, stop):
+    """放入有界队列，队列满时等待；stop 被设置则放弃并返回 False。"""
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=_QUEUE_POLL_SEC)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _get_until_stopped(q, stop):
+    """从队列取出一项，队列空时等待；stop 被设置则返回 None。"""
+    while not stop.is_set():
+        try:
+            return q.get(timeout=_QUEUE_POLL_SEC)
+        except queue.Empty:
+            continue
+    return None
+
+
+class _FramePool(object):
+    """
+    预分配帧缓冲的环形池：acquire() 取出一块空闲缓冲（全部在用时等待），用完 release() 归还。
+    帧路径复用固定的几块内存，不再每帧分配新 ndarray；池大小同时限制了在途帧数。
+    """
+
+    def __init__(self, shape, count):
+        self.shape = tuple(shape)
+        self._free = queue.Queue()
+        for _ in range(max(1, count)):
+            self._free.put(np.empty(self.shape, dtype=np.uint8))
+
+    def acquire(self, stop):
+        """取出空闲缓冲；stop 被设置时返回 None。"""
+        return _get_until_stopped(self._free, stop)
+
+    def release(self, buf):
+        if buf is not None and buf.shape == self.shape:
+            self._free.put(buf)
+
+
+class _SegmentDecoder(threading.Thread):
+    """
+    单个分段的解码线程：从预取器取得第 index 段的本地路径，按顺序读帧放入有界队列 frames，
+    结束放入 _END，出错放入异常对象。
+    队列元素为 (帧, 所属缓冲池)；启用缓冲池时用 cap.read(image=buf) 直接解码到池中缓冲，
+    帧尺寸与池不符（分辨率中途变化）时 OpenCV 会另行分配，此时该帧不属于任何池（池为 None）。
+    传入 audio_job 时与解码并行在另一线程处理本段音频（audio_ok 记录是否成功），
+    解码与音频都结束后 release 该段（预取器可删除其下载文件）并释放 slots（限制同时解码的分段数）。
+    """
+
+    def __init__(self, prefetcher, index, slots, queue_size, stop, pool_frames=True, audio_job=None):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.index = index
+        self.frames = queue.Queue(maxsize=queue_size)
+        self.audio_ok = False
+        self._prefetcher = prefetcher
+        self._slots = slots
+        self._stop_event = stop
+        self._pool_frames = pool_frames
+        self._audio_job = audio_job
+
+    def _run_audio(self, path, frame_count):
+        try:
+            self.audio_ok = bool(self._audio_job(self.index, path, frame_count))
+        except Exception:
+            self.audio_ok = False
+
+    def run(self):
+        audio_thread = None
+        try:
+            path = self._prefetcher.get(self.index)
+            cap = cv2.VideoCapture(path)
+            try:
+                if not cap.isOpened():
+                    raise RuntimeError("无法打开视频: {}".format(path))
+                if self._audio_job is not None:
+                    frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
+                    audio_thread = threading.Thread(target=self._run_audio, args=(path, frame_count))
+                    audio_thread.daemon = True
+                    audio_thread.start()
+                pool = None
+                if self._pool_frames:
+                    w, h, _ = get_video_props(cap)
+                    # 队列可存满 + 正在解码的一块；其余在途帧由下游归还后复用
+                    pool = _FramePool((h, w, 3), self.frames.maxsize + 2)
+                while not self._stop_event.is_set():
+                    buf = pool.acquire(self._stop_event) if pool is not None else None
+                    if pool is not None and buf is None:
+                        break
+                    ret, frame = cap.read(image=buf) if buf is not None else cap.read()
+                    if not ret:
+                        if pool is not None:
+                            pool.release(buf)
+                        break
+                    owner = pool
+                    if buf is not None and frame is not buf:
+                        pool.release(buf)
+                        owner = None
+                    if not _put_until_stopped(self.frames, (frame, owner), self._stop_event):
+                        break
+            finally:
+                cap.release()
+            _put_until_stopped(self.frames, _END, self._stop_event)
+        except Exception as e:
+            _put_until_stopped(self.frames, e, self._stop_event)
+        finally:
+            if audio_thread is not None:
+                # 音频处理仍在读源文件，结束后才能 release
+                audio_thread.join()
+            self._prefetcher.release(self.index)
+            self._slots.release()
+
+
+def _resize_into(frame, owner, out_size, dst):
+    """在缩放线程中执行：缩放到 dst（为 None 时新分配），源帧缓冲归还其所属池。"""
+    try:
+        if dst is None:
+            return cv2.resize(frame, out_size, interpolation=cv2.INTER_LINEAR)
+        return cv2.resize(frame, out_size, dst=dst, interpolation=cv2.INTER_LINEAR)
+    finally:
+        if owner is not None:
+            owner.release(frame)
+
+
+def _write_frames_pipelined(
+    prefetcher,
+    writer,
+    out_size,
+    threads=None,
+    decode_ahead=DECODE_AHEAD,
+    queue_size=FRAME_QUEUE_SIZE,
+    pool_frames=True,
+    audio_job=None,
+):
+    """
+    分级流水线写帧：解码线程（每段一个，按顺序启动，最多 decode_ahead 个同时运行）-> 缩放线程池 -> 按序写入线程。
+    分段按顺序启动解码，当前消费的分段一定已在解码，不会因预读占满名额而死锁。
+    帧数上限约为 decode_ahead * queue_size + 3 * threads，与视频长度无关。
+    pool_frames 为 True 时解码与缩放输出都复用 _FramePool 中的预分配缓冲（cap.read(image=) / cv2.resize(dst=)），
+    写入后归还；缩放输出缓冲由分发线程按帧顺序取得，保证最早待写的帧总能拿到缓冲。
+    :param prefetcher: segment_prefetch.SegmentPrefetcher，按序号提供各段本地路径
+    :param out_size: (宽, 高)，尺寸不同的帧在线程池中缩放（cv2.resize 释放 GIL，可多核并行）
+    :param threads: 缩放线程数，默认 CPU 核数
+    :param audio_job: 可选 (序号, 本地路径, 帧数) -> bool，解码时并行处理该段音频（见 _segment_audio_job）
+    :return: 各段音频是否处理成功的列表（未传 audio_job 时全为 False）
+    """
+    threads = max(1, threads or os.cpu_count() or 1)
+    stop = threading.Event()
+    slots = threading.Semaphore(max(1, decode_ahead))
+    decoders = [
+        _SegmentDecoder(prefetcher, i, slots, queue_size, stop, pool_frames, audio_job)
+        for i in range(len(prefetcher))
+    ]
+    # 按序写入队列：元素为 (帧或缩放任务的 Future, 写入后归还的池)，保持帧顺序
+    pending = queue.Queue(maxsize=threads * 2)
+    # 缩放输出池：pending 存满 + 缩放中 + 写入中
+    out_pool = _FramePool((out_size[1], out_size[0], 3), threads * 3 + 2) if pool_frames else None
+    errors = []
+
+    def _launch():
+        for d in decoders:
+            slots.acquire()
+            if stop.is_set():
+                slots.release()
+                return
+            d.start()
+
+    def _write_loop():
+        try:
+            while True:
+                item = _get_until_stopped(pending, stop)
+                if item is None or item is _END:
+                    return
+                frame, owner = item
+                if isinstance(frame, Future):
+                    frame = frame.result()
+                writer.write(frame)
+                if owner is not None:
+                    owner.release(frame)
+        except Exception as e:
+            errors.append(e)
+            stop.set()
+
+    launcher = threading.Thread(target=_launch)
+    launcher.daemon = True
+    write_thread = threading.Thread(target=_write_loop)
+    write_thread.daemon = True
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        launcher.start()
+        write_thread.start()
+        try:
+            for d in decoders:
+                while True:
+                    item = _get_until_stopped(d.frames, stop)
+                    if item is None or item is _END:
+                        break
+                    if isinstance(item, Exception):
+                        raise item
+                    frame, owner = item
+                    if (frame.shape[1], frame.shape[0]) != out_size:
+                        dst = None
+                        if out_pool is not None:
+                            dst = out_pool.acquire(stop)
+                            if dst is None:
+                                break
+                        item = (pool.submit(_resize_into, frame, owner, out_size, dst), out_pool)
+                    if not _put_until_stopped(pending, item, stop):
+                        break
+                if stop.is_set():
+                    break
+            _put_until_stopped(pending, _END, stop)
+            write_thread.join()
+        except BaseException:
+            stop.set()
+            raise
+        finally:
+            stop.set()
+            write_thread.join()
+            launcher.join()
+            for d in decoders:
+                if d.is_alive():
+                    d.join()
+    if errors:
+        raise errors[0]
+    return [d.audio_ok for d in decoders]
+
+
+def _segment_audio_job(temp_dir, fps, audio_bitrate="128k", ffmpeg_bin="ffmpeg"):
+    """
+    返回 (序号, 本地路径, 帧数) -> bool：把该段音频编码为 temp_dir/audio_<序号>.m4a（aac 44100Hz 双声道，各段可直接 concat），
+    时长按该段在输出中的视频时长（帧数 / 输出 fps）补静音或截断；无音轨（或抽取失败）时写入同样时长的静音，
+    后续分段的音频不会因此提前。帧数未知（<= 0）时只抽取原音轨。
     """
-    用 ffmpeg 按 local_paths 顺序拼接各段音频，再与无音轨视频混流为最终 mp4。
+    def _job(index, path, frame_count):
+        out = _segment_audio_path(temp_dir, index)
+        duration = ["-t", "{:.6f}".format(frame_count / float(fps))] if frame_count > 0 else []
+        encode = ["-c:a", "aac", "-b:a", audio_bitrate, "-ar", "44100", "-ac", "2", out]
+        if _has_audio_stream(path, ffmpeg_bin):
+            cmd = [ffmpeg_bin, "-y", "-loglevel", "error", "-i", path, "-map", "0:a:0", "-vn"]
+            if duration:
+                cmd += ["-af", "apad"] + duration
+            if subprocess.run(cmd + encode, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL).returncode == 0:
+                return True
+        if not duration:
+            return False
+        cmd = [ffmpeg_bin, "-y", "-loglevel", "error", "-f", "lavfi", "-i", "anullsrc=r=44100:cl=stereo"] + duration
+        return subprocess.run(cmd + encode, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL).returncode == 0
+    return _job
+
+
+def _segment_audio_path(temp_dir, index):
+    return os.path.join(temp_dir, "audio_{:04d}.m4a".format(index))
+
+
+def _mux_audio_with_ffmpeg(video_only_path, audio_paths, output_path, ffmpeg_bin="ffmpeg"):
+    """
+    用 ffmpeg 按顺序拼接各段音频（解码时已逐段抽取为 aac，源分段可能已删除），再与无音轨视频混流为最终 mp4。
     :param video_only_path: cv2 输出的仅视频文件
-    :param local_paths: 各段源视频路径（与 cv2 合并顺序一致）
+    :param audio_paths: 各段音频文件路径（与 cv2 合并顺序一致）
     :param output_path: 最终带音轨的输出路径
-    :param audio_bitrate: 音频码率
     :param ffmpeg_bin: ffmpeg 命令
     :return: 成功返回 output_path，无音轨或失败时返回 None
     """
@@ -139,17 +433,17 @@ def _mux_audio_with_ffmpeg(video_only_path, local_paths, output_path, audio_bitr
     audio_m4a_path = os.path.join(temp_dir, "audio_concat.m4a")
 
     with open(audio_list_path, "w", encoding="utf-8") as f:
-        for p in local_paths:
+        for p in audio_paths:
             # ffmpeg concat 要求路径转义单引号
             escaped = p.replace("'", "'\\''")
             f.write("file '{}'\n".format(escaped))
 
-    # 从各段按顺序只取音频并 concat 成一条 aac
+    # 各段音频编码参数一致，按顺序直接 concat 成一条 aac
     cmd_audio = [
         ffmpeg_bin, "-y",
         "-f", "concat", "-safe", "0",
         "-i", audio_list_path,
-        "-vn", "-c:a", "aac", "-b:a", audio_bitrate,
+        "-c:a", "copy",
         audio_m4a_path,
     ]
     ret = subprocess.run(cmd_audio, capture_output=True, text=True)
@@ -171,6 +465,137 @@ def _mux_audio_with_ffmpeg(video_only_path, local_paths, output_path, audio_bitr
     return output_path
 
 
+def _has_audio_stream(path, ffmpeg_bin="ffmpeg"):
+    """解析 ffmpeg -i 的输出判断文件是否含音轨。"""
+    ret = subprocess.run([ffmpeg_bin, "-hide_banner", "-i", path], capture_output=True)
+    return b"Audio:" in ret.stderr
+
+
+def _encode_segment(
+    path,
+    part_path,
+    size,
+    fps,
+    ffmpeg_bin="ffmpeg",
+    crf=DEFAULT_CRF,
+    preset=DEFAULT_PRESET,
+    lossless=False,
+    with_audio=True,
+    audio_bitrate="128k",
+    threads=0,
+):
+    """
+    进程池任务：把单个分段按统一尺寸 / fps / 编码参数编码为中间文件 part_path（音频取自该段，无音轨时补 anullsrc 静音），
+    所有中间文件参数一致，可直接 -c copy 拼接。本进程内复用解码与缩放缓冲。
+    :param threads: 本任务 ffmpeg 编码与 OpenCV 使用的线程数（0 为自动），多进程时按进程数分摊 CPU 核
+    :return: 写入的帧数
+    """
+    if threads:
+        cv2.setNumThreads(threads)
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        raise RuntimeError("无法打开视频: {}".format(path))
+    audio_input = None
+    if with_audio:
+        if _has_audio_stream(path, ffmpeg_bin):
+            audio_input = ["-i", path]
+        else:
+            audio_input = ["-f", "lavfi", "-i", "anullsrc=r=44100:cl=stereo"]
+    writer = _FfmpegPipeWriter(
+        part_path, size, fps, ffmpeg_bin=ffmpeg_bin, crf=crf, preset=preset, lossless=lossless,
+        audio_input=audio_input, audio_bitrate=audio_bitrate, threads=threads,
+    )
+    frames = 0
+    try:
+        buf = None
+        dst = None
+        while True:
+            ret, frame = cap.read(image=buf) if buf is not None else cap.read()
+            if not ret:
+                break
+            buf = frame
+            if (frame.shape[1], frame.shape[0]) != size:
+                if dst is None:
+                    dst = cv2.resize(frame, size, interpolation=cv2.INTER_LINEAR)
+                else:
+                    cv2.resize(frame, size, dst=dst, interpolation=cv2.INTER_LINEAR)
+                frame = dst
+            writer.write(frame)
+            frames += 1
+    finally:
+        cap.release()
+        returncode = writer.release()
+    if returncode != 0:
+        raise RuntimeError("分段编码失败 {}: {}".format(path, writer.error_text()))
+    return frames
+
+
+def _merge_segments_parallel(
+    prefetcher,
+    temp_dir,
+    output_path,
+    size,
+    fps,
+    workers,
+    ffmpeg_bin="ffmpeg",
+    crf=DEFAULT_CRF,
+    preset=DEFAULT_PRESET,
+    lossless=False,
+    with_audio=True,
+    audio_bitrate="128k",
+):
+    """
+    分段级多进程模式：按列表顺序把已就绪的分段提交到进程池独立编码（在途任务不超过 2 * workers），
+    每段编码完即 release（预取器可删除其下载文件）；全部完成后用 concat 分离器 -c copy 拼接中间文件。
+    每个任务的编码线程数为 CPU 核数 / workers（至少 1），避免多个 ffmpeg 各自占满所有核。
+    :return: 输出文件的绝对路径
+    """
+    parts_dir = os.path.join(temp_dir, "parts")
+    os.makedirs(parts_dir, exist_ok=True)
+    part_ext = ".avi" if lossless else ".mp4"
+    part_paths = [os.path.join(parts_dir, "part_{:04d}{}".format(i, part_ext)) for i in range(len(prefetcher))]
+    running = {}
+    encode_threads = max(1, (os.cpu_count() or 1) // workers)
+
+    def _collect(futures):
+        for future in futures:
+            index = running.pop(future)
+            future.result()
+            prefetcher.release(index)
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        try:
+            for i in range(len(prefetcher)):
+                while len(running) >= workers * 2:
+                    done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+                    _collect(done)
+                future = pool.submit(
+                    _encode_segment, prefetcher.get(i), part_paths[i], size, fps,
+                    ffmpeg_bin, crf, preset, lossless, with_audio, audio_bitrate, encode_threads,
+                )
+                running[future] = i
+            while running:
+                done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+                _collect(done)
+        except BaseException:
+            for future in running:
+                future.cancel()
+            raise
+
+    list_path = os.path.join(parts_dir, "parts_list.txt")
+    with open(list_path, "w", encoding="utf-8") as f:
+        for p in part_paths:
+            f.write("file '{}'\n".format(p.replace("'", "'\\''")))
+    cmd = [ffmpeg_bin, "-y", "-f", "concat", "-safe", "0", "-i", list_path, "-c", "copy"]
+    if not lossless:
+        cmd += ["-movflags", "+faststart"]
+    cmd.append(output_path)
+    ret = subprocess.run(cmd, capture_output=True)
+    if ret.returncode != 0:
+        raise RuntimeError("拼接中间文件失败: {}".format(ret.stderr.decode("utf-8", "replace").strip()[-2000:]))
+    return os.path.abspath(output_path)
+
+
 def merge_mp4_cv2(
     list_path,
     output_path,
@@ -180,9 +605,18 @@ def merge_mp4_cv2(
     add_audio=True,
     audio_bitrate="128k",
     ffmpeg_bin="ffmpeg",
+    threads=None,
+    decode_ahead=DECODE_AHEAD,
+    pool_frames=True,
+    prefetch_ahead=PREFETCH_AHEAD,
+    writer_backend=DEFAULT_WRITER,
+    crf=DEFAULT_CRF,
+    preset=DEFAULT_PRESET,
+    parallel=0,
 ):
     """
     使用 cv2 按列表顺序合并视频，不丢帧；可选无损或压缩编码；可选用 ffmpeg 混入音频。
+    解码、缩放、编码分级并行（见 _write_frames_pipelined）。
     :param list_path: 列表文件路径（每行 file 'path_or_url'）
     :param output_path: 输出 mp4 路径
     :param lossless: True 使用 FFV1 无损，False 使用 H.264/mp4v 适度压缩
@@ -191,6 +625,14 @@ def merge_mp4_cv2(
     :param add_audio: 是否用 ffmpeg 按顺序拼接各段音频并混流到最终文件
     :param audio_bitrate: 混流时音频码率
     :param ffmpeg_bin: ffmpeg 命令
+    :param threads: 缩放线程数，默认 CPU 核数
+    :param decode_ahead: 同时解码（预读）的分段数
+    :param pool_frames: 是否复用预分配帧缓冲（解码与缩放不再每帧分配内存）
+    :param prefetch_ahead: 远程分段最多领先下载的段数（临时目录占用上限约为该段数）
+    :param writer_backend: "cv2"（cv2.VideoWriter，默认）或 "ffmpeg"（管道交给 ffmpeg libx264 编码）
+    :param crf: ffmpeg 后端 libx264 的 CRF（越小画质越高）
+    :param preset: ffmpeg 后端 libx264 的 preset
+    :param parallel: 大于 0 时使用分段级多进程模式（进程数），各段由 ffmpeg 独立编码后 -c copy 拼接（不看 writer_backend）
     :return: 输出文件的绝对路径
     """
     if not os.path.isfile(list_path):
@@ -206,74 +648,87 @@ def merge_mp4_cv2(
     if temp_dir is None:
         temp_dir = tempfile.mkdtemp()
 
+    if writer_backend not in ("ffmpeg", "cv2"):
+        raise ValueError("未知写入后端: {}（可选 ffmpeg / cv2）".format(writer_backend))
+    prefetcher = None
     try:
-        local_paths = []
-        for p in paths:
-            local_paths.append(resolve_path(p, temp_dir, verify_ssl=verify_ssl))
+        # 各模式的音频都在分段用完前处理好（解码时转为小文件或分段编码时混入），分段用完即删
+        prefetcher = SegmentPrefetcher(
+            paths, temp_dir, max_ahead=max(prefetch_ahead, decode_ahead, 2 * parallel), verify_ssl=verify_ssl,
+        )
 
-        # 用第一个视频确定输出尺寸和 fps
-        cap0 = cv2.VideoCapture(local_paths[0])
+        # 用第一个视频确定输出尺寸和 fps（其余分段仍在后台下载）
+        first_path = prefetcher.get(0)
+        cap0 = cv2.VideoCapture(first_path)
         if not cap0.isOpened():
-            raise RuntimeError("无法打开视频: {}".format(local_paths[0]))
+            raise RuntimeError("无法打开视频: {}".format(first_path))
         out_w, out_h, out_fps = get_video_props(cap0)
         cap0.release()
 
-        fourcc = _fourcc_lossless() if lossless else _fourcc_mp4()
         ext = os.path.splitext(output_path)[1].lower()
         if ext not in (".mp4", ".avi", ".mkv"):
             output_path = os.path.splitext(output_path)[0] + ".mp4"
         if lossless and not output_path.lower().endswith(".avi"):
             output_path = os.path.splitext(output_path)[0] + "_lossless.avi"
 
-        # 需要混音时先写到临时视频，再与音频混流；否则直接写最终路径
-        if add_audio and not lossless:
+        if parallel:
+            return _merge_segments_parallel(
+                prefetcher, temp_dir, output_path, (out_w, out_h), out_fps, parallel,
+                ffmpeg_bin=ffmpeg_bin, crf=crf, preset=preset, lossless=lossless,
+                with_audio=add_audio and not lossless, audio_bitrate=audio_bitrate,
+            )
+        # 需要混音时先写到临时视频，全部分段的音频就绪后再混流；否则直接写最终路径
+        with_audio = add_audio and not lossless
+        if with_audio:
             video_only_path = os.path.join(temp_dir, "video_only.mp4")
             write_path = video_only_path
         else:
             write_path = output_path
 
-        writer = cv2.VideoWriter(
-            write_path, fourcc, out_fps, (out_w, out_h)
-        )
+        if writer_backend == "ffmpeg":
+            writer = _FfmpegPipeWriter(
+                write_path, (out_w, out_h), out_fps, ffmpeg_bin=ffmpeg_bin, crf=crf, preset=preset, lossless=lossless,
+            )
+        else:
+            fourcc = _fourcc_lossless() if lossless else _fourcc_mp4()
+            writer = cv2.VideoWriter(
+                write_path, fourcc, out_fps, (out_w, out_h)
+            )
         if not writer.isOpened():
             raise RuntimeError(
                 "无法创建输出文件（可能不支持所选编码）: {}".format(write_path)
             )
 
-        for path in local_paths:
-            cap = cv2.VideoCapture(path)
-            if not cap.isOpened():
-                writer.release()
-                raise RuntimeError("无法打开视频: {}".format(path))
-            w, h, _ = get_video_props(cap)
-            need_resize = w != out_w or h != out_h
-            while True:
-                ret, frame = cap.read()
-                if not ret:
-                    break
-                if need_resize:
-                    frame = cv2.resize(
-                        frame, (out_w, out_h), interpolation=cv2.INTER_LINEAR
-                    )
-                writer.write(frame)
-            cap.release()
-
-        writer.release()
-
-        if add_audio and not lossless and write_path != output_path:
-            muxed = _mux_audio_with_ffmpeg(
-                write_path, local_paths, output_path,
-                audio_bitrate=audio_bitrate, ffmpeg_bin=ffmpeg_bin
+        # 分段用完即被预取器删除，音频须在解码时逐段处理
+        audio_job = _segment_audio_job(temp_dir, out_fps, audio_bitrate, ffmpeg_bin) if with_audio else None
+        try:
+            audio_ok = _write_frames_pipelined(
+                prefetcher, writer, (out_w, out_h),
+                threads=threads, decode_ahead=decode_ahead, pool_frames=pool_frames, audio_job=audio_job,
             )
+        finally:
+            returncode = writer.release()
+        if writer_backend == "ffmpeg" and returncode != 0:
+            raise RuntimeError("ffmpeg 编码失败: {}".format(writer.error_text()))
+
+        if with_audio:
+            muxed = None
+            if all(audio_ok):
+                muxed = _mux_audio_with_ffmpeg(
+                    write_path, [_segment_audio_path(temp_dir, i) for i in range(len(paths))], output_path,
+                    ffmpeg_bin=ffmpeg_bin,
+                )
             if muxed:
                 return os.path.abspath(muxed)
-            # 混音失败（如某段无音轨）则用仅视频作为输出
+            # 混音失败（某段音频处理或 ffmpeg 失败）则用仅视频作为输出
             shutil.copy2(write_path, output_path)
             if sys.stderr:
-                print("警告: 未混入音频（可能某段无音轨或 ffmpeg 失败），已输出仅视频: {}".format(output_path), file=sys.stderr)
+                print("警告: 未混入音频（某段音频处理或 ffmpeg 失败），已输出仅视频: {}".format(output_path), file=sys.stderr)
 
         return os.path.abspath(output_path)
     finally:
+        if prefetcher is not None:
+            prefetcher.close()
         if created_temp and os.path.isdir(temp_dir):
             try:
                 shutil.rmtree(temp_dir)
@@ -320,7 +775,53 @@ def main():
     parser.add_argument(
         "--ffmpeg",
         default="ffmpeg",
-        help="ffmpeg 命令路径（混音时使用，默认 ffmpeg）",
+        help="ffmpeg 命令路径（ffmpeg 写入后端与混音时使用，默认 ffmpeg）",
+    )
+    parser.add_argument(
+        "--writer",
+        choices=("ffmpeg", "cv2"),
+        default=DEFAULT_WRITER,
+        help="写入后端：cv2（cv2.VideoWriter）或 ffmpeg（管道交给 ffmpeg 多线程 libx264 编码），默认 {}".format(DEFAULT_WRITER),
+    )
+    parser.add_argument(
+        "--crf",
+        type=int,
+        default=DEFAULT_CRF,
+        help="ffmpeg 后端 libx264 CRF，越小画质越高（默认 {}）".format(DEFAULT_CRF),
+    )
+    parser.add_argument(
+        "--preset",
+        default=DEFAULT_PRESET,
+        help="ffmpeg 后端 libx264 preset（默认 {}）".format(DEFAULT_PRESET),
+    )
+    parser.add_argument(
+        "--parallel",
+        type=int,
+        default=0,
+        help="分段级多进程编码的进程数：各段独立编码为参数一致的中间文件后 -c copy 拼接（默认 0 不启用）",
+    )
+    parser.add_argument(
+        "--threads",
+        type=int,
+        default=None,
+        help="缩放线程数（默认: CPU 核数）",
+    )
+    parser.add_argument(
+        "--decode-ahead",
+        type=int,
+        default=DECODE_AHEAD,
+        help="同时解码（预读）的分段数（默认 {}）".format(DECODE_AHEAD),
+    )
+    parser.add_argument(
+        "--no-frame-pool",
+        action="store_true",
+        help="不复用预分配帧缓冲（每帧新分配内存，用于对比测试）",
+    )
+    parser.add_argument(
+        "--prefetch",
+        type=int,
+        default=PREFETCH_AHEAD,
+        help="远程分段最多领先下载的段数，已解码的分段随即删除（默认 {}）".format(PREFETCH_AHEAD),
     )
     args = parser.parse_args()
 
@@ -342,6 +843,14 @@ def main():
             add_audio=not args.no_audio,
             audio_bitrate=args.audio_bitrate,
             ffmpeg_bin=args.ffmpeg,
+            threads=args.threads,
+            decode_ahead=args.decode_ahead,
+            pool_frames=not args.no_frame_pool,
+            prefetch_ahead=args.prefetch,
+            writer_backend=args.writer,
+            crf=args.crf,
+            preset=args.preset,
+            parallel=max(0, args.parallel),
         )
         print("合并完成: {}".format(out))
     except Exception as e:
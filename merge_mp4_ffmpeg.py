@@ -15,18 +15,12 @@ import argparse
 import os
 import time
 
+import manifest
+
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 TMP_DIR = os.path.join(BASE_DIR, "tmp")
 
 
-def _read_concat_list(list_path):
-    """读取列表文件，每行应为 file 'path' 或 file path，返回有效行列表。"""
-    with open(list_path, "r", encoding="utf-8") as f:
-        lines = [ln.strip() for ln in f if ln.strip()]
-    valid = [ln for ln in lines if ln.startswith("file ")]
-    return valid
-
-
 def merge_by_concat_list(list_path, output_path, ffmpeg_bin="ffmpeg"):
     """
     用 ffmpeg concat 解复用器按列表文件合并，-c copy 不重编码。
@@ -38,8 +32,7 @@ def merge_by_concat_list(list_path, output_path, ffmpeg_bin="ffmpeg"):
     if not os.path.isfile(list_path):
         raise FileNotFoundError("列表文件不存在: {}".format(list_path))
 
-    valid_lines = _read_concat_list(list_path)
-    if not valid_lines:
+    if next(manifest.iter_entries(list_path), None) is None:
         raise ValueError(
             "列表文件为空或格式错误。每行应为: file 'path/to/video.mp4' 或 file 'http://...'，例如：\n"
             "  file '/path/to/a.mp4'\n"
@@ -4,7 +4,9 @@
 python3.7
 工程化流程：
 - 列表来源：mapbinlist 可为本地文件路径或公网 URL（自动拉取内容）。
-- 工作目录：每次运行在 tmp/ 下新建 merge_YYYYMMDD_HHMMSS/，内含下载分片、合并结果。
+- 工作目录：每次运行在 tmp/ 下新建 merge_YYYYMMDD_HHMMSS_<随机>/，内含下载分片、合并结果（见 workspace.py）。
+- 磁盘配额：tmp/ 下合并目录与组缓存总大小超过 --tmp-quota 时按最近使用时间淘汰旧的合并结果。
+- 树形合并（--tree-group N）：每 N 段并发合并为中间文件并按组缓存，再合并中间文件；命中缓存的组不下载。
 - 临时文件：分片视频、concat 列表、merged_raw 在合并结束后自动删除，仅保留最终合并视频。
 
 流程：读取 mapbinlist（本地/URL）-> 在 tmp/<run_id>/ 下载分片 -> 生成 concat 列表 ->
@@ -21,16 +23,37 @@ import argparse
 import os
 import time
 import shutil
-import hashlib
-from multiprocessing.dummy import Pool as ThreadPool
+import tempfile
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain
+
+import manifest
+import mp4_index
+from staging import RAM_STAGE_MAX_FILE, StagingArea
+from workspace import GROUP_CACHE_SUBDIR, TMP_SUBDIR_NAME, WORKSPACE_QUOTA_BYTES, workspace_for
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 TMP_DIR = os.path.join(BASE_DIR, "tmp")
-# 与合并结果同层级，存放分片、concat 列表、merged_raw 等临时文件
-TMP_SUBDIR_NAME = "_tmp"
 
 # 并发下载数量（保持 mapbinlist 顺序，仅并发执行下载/复制）
 DOWNLOAD_CONCURRENCY = 4
+# 边合并边上传时每次从 ffmpeg 管道读取的字节数
+STREAM_PIPE_BLOCK = 1024 * 1024
+# 边合并边上传的预估大小 = 输入总大小 * (1 + STREAM_SIZE_MARGIN) + STREAM_SIZE_PAD（分片 MP4 的 moof 等开销），
+# 实际输出仍超出时改为合并完成后整文件上传
+STREAM_SIZE_MARGIN = 0.05
+STREAM_SIZE_PAD = 4 * 1024 * 1024
+# 树形合并：组中间结果缓存在工作区根目录的 GROUP_CACHE_SUBDIR 下（计入工作区配额），
+# 缓存总大小上限（字节）、同时合并的组数；最近 GROUP_CACHE_MIN_AGE 秒内用过的中间结果不淘汰（可能正被其他任务读取）
+GROUP_CACHE_MAX_BYTES = 20 * 1024 * 1024 * 1024
+GROUP_CACHE_MIN_AGE = 3600
+TREE_WORKERS = 4
+# 组缓存键取 URL 的 HEAD 响应头的超时（秒）
+GROUP_HEAD_TIMEOUT = 10
+# 合并结果时长与各分片视频轨时长之和相差超过该比例（且超过 1 秒）时告警
+DURATION_TOLERANCE = 0.01
 
 try:
     import requests
@@ -38,88 +61,41 @@ except ImportError:
     requests = None
 
 
-def _parse_concat_list_from_content(content):
-    """
-    从字符串解析列表，每行格式：file 'path' 或 file "path"。
-    返回路径/URL 列表（已去掉引号）。
-    """
-    lines = [ln.strip() for ln in content.splitlines() if ln.strip()]
-    paths = []
-    for ln in lines:
-        if not ln.startswith("file "):
-            continue
-        rest = ln[5:].strip()
-        if (rest.startswith("'") and rest.endswith("'")) or (
-            rest.startswith('"') and rest.endswith('"')
-        ):
-            rest = rest[1:-1]
-        if rest:
-            paths.append(rest)
-    return paths
-
-
-def _load_mapbinlist(list_source):
+def _peek_entries(items):
     """
-    读取 mapbinlist：list_source 可以是本地文件路径或公网 URL。
-    返回路径/URL 列表。
+    取出第一个条目检查列表非空，返回 (是否为空, 完整的 ManifestEntry 生成器)。
+    items 可为 manifest.iter_entries 的结果或路径/URL 列表；列表读取失败在此抛出。
     """
-    if list_source.startswith("http://") or list_source.startswith("https://"):
-        if requests is None:
-            raise RuntimeError("从 URL 读取列表需安装 requests: pip install requests")
-        r = requests.get(list_source, timeout=30)
-        r.raise_for_status()
-        content = r.text
-    else:
-        if not os.path.isfile(list_source):
-            raise IOError("列表文件不存在: {}".format(list_source))
-        with open(list_source, "r") as f:
-            content = f.read()
-    return _parse_concat_list_from_content(content)
+    entries = manifest.as_entries(items)
+    first = next(entries, None)
+    if first is None:
+        return True, iter(())
+    return False, chain([first], entries)
 
 
-def _parse_concat_list(list_path):
-    """
-    读取列表文件，每行格式：file 'path' 或 file "path"。
-    返回路径/URL 列表（已去掉引号）。
-    """
-    with open(list_path, "r") as f:
-        content = f.read()
-    return _parse_concat_list_from_content(content)
-
-
-def _default_output_basename(paths):
-    """
-    根据列表中的路径/URL 顺序生成唯一 MD5，用作默认输出文件名（不含扩展名）。
-    同一列表多次运行得到相同文件名，不同列表得到不同文件名。
-    """
-    raw = "\n".join(paths)
-    if not isinstance(raw, type(b"")):
-        raw = raw.encode("utf-8")
-    return hashlib.md5(raw).hexdigest()
-
-
-def _read_concat_list(list_path):
-    """读取列表文件，每行应为 file 'path' 或 file path，返回有效行列表。"""
-    with open(list_path, "r") as f:
-        lines = [ln.strip() for ln in f if ln.strip()]
-    valid = [ln for ln in lines if ln.startswith("file ")]
-    return valid
-
-
-def _download_from_url(url, save_path, timeout=120):
-    """
-    从 URL 下载文件到本地路径（使用 requests，与之前下载方式一致）。
-    """
+def _open_url(url, timeout=120):
+    """发起流式下载请求，返回已校验状态码的响应（可先读 Content-Length 再决定保存位置）。"""
     if requests is None:
         raise RuntimeError("下载 URL 需安装 requests: pip install requests")
     r = requests.get(url, stream=True, timeout=timeout)
     r.raise_for_status()
+    return r
+
+
+def _save_response(r, save_path):
     with open(save_path, "wb") as f:
         for chunk in r.iter_content(chunk_size=8192):
             if chunk:
                 f.write(chunk)
 
 
+def _download_from_url(url, save_path, timeout=120):
+    """
+    从 URL 下载文件到本地路径（使用 requests，与之前下载方式一致）。
+    """
+    _save_response(_open_url(url, timeout), save_path)
+
+
 def _basename_from_path(path_or_url):
     """从本地路径或 URL 取文件名（用于 序号_原文件名.mp4）。"""
     if path_or_url.startswith("http://") or path_or_url.startswith("https://"):
@@ -128,57 +104,102 @@ def _basename_from_path(path_or_url):
     return os.path.basename(path_or_url) or "video.mp4"
 
 
-def _fetch_one(item, dest):
-    """下载或复制单个文件到 dest（供并发调用）。"""
+def _fetch_one(item, name, stage):
+    """
+    下载或复制单个文件（供并发调用）。按大小由 stage 决定放内存层还是磁盘：
+    本地文件用文件大小，URL 用响应的 Content-Length（缺失时放磁盘）。
+    :return: 本地文件绝对路径
+    """
     if item.startswith("http://") or item.startswith("https://"):
-        _download_from_url(item, dest)
+        r = _open_url(item)
+        length = r.headers.get("Content-Length", "")
+        dest = stage.path_for(name, int(length) if length.isdigit() else None)
+        _save_response(r, dest)
     else:
         if not os.path.isfile(item):
             raise IOError("本地文件不存在: {}".format(item))
+        dest = stage.path_for(name, os.path.getsize(item))
         shutil.copy2(item, dest)
+    return dest
+
+
+def _local_name(entry):
+    """分片本地名：<序号>_原文件名.mp4，序号保证不同 URL 同名文件不冲突。"""
+    base = _basename_from_path(entry.source)
+    if not base.lower().endswith(".mp4"):
+        base = base + ".mp4"
+    return "{}_{}".format(entry.index, base)
+
+
+def _video_duration(path):
+    """本地 mp4 的视频轨时长（秒），只读 moov（见 mp4_index）；无法解析时返回 None。"""
+    try:
+        index = mp4_index.build_index(path)
+    except Exception:
+        return None
+    track = mp4_index.video_track(index)
+    return (track or {}).get("duration") or index.get("duration") or None
 
 
-def _fetch_one_task(args):
-    """(item, dest) -> 调用 _fetch_one，供 Pool.map 使用。"""
-    item, dest = args
-    _fetch_one(item, dest)
+def _add_duration(totals, duration):
+    """totals["duration"] 累加一个文件的视频时长（_video_duration 的结果）；任一文件无法解析则置为 None（不再校验时长）。"""
+    if totals.get("duration") is not None:
+        totals["duration"] = None if duration is None else totals["duration"] + duration
 
 
-def _prepare_videos_to_dir(paths, work_dir):
+def _iter_prepared(entries, work_dir, stage=None, concurrency=None, totals=None):
     """
-    将列表中每个路径/URL 并发下载或复制到 work_dir。
-    命名为 000_原文件名.mp4, 001_原文件名.mp4, ... 严格按 mapbinlist 顺序。
-    返回生成的本地文件名列表（相对 work_dir），顺序与 paths 一致。
+    将列表条目并发下载或复制到 work_dir（传 stage 时小分片放内存层，见 staging.py），按列表顺序产出本地文件绝对路径。
+    entries 为 ManifestEntry 的可迭代对象（可为 manifest.iter_entries 的生成器），按需取用：
+    最多 concurrency 个同时下载、2 * concurrency 个已提交未产出，列表再长也不会整体展开。
+    :param concurrency: 并发下载数，不传用 DOWNLOAD_CONCURRENCY
+    :param totals: 可选 dict，累计 count（条目数）、bytes（本地文件总字节数）与 duration（视频轨总时长，见 _add_duration）
     """
     if not os.path.isdir(work_dir):
         os.makedirs(work_dir)
-    # 按 mapbinlist 顺序预先生成所有目标路径和本地名
-    tasks = []
-    local_names = []
-    for i, item in enumerate(paths):
-        base = _basename_from_path(item)
-        if not base.lower().endswith(".mp4"):
-            base = base + ".mp4"
-        name = "{}_{}".format(i, base)
-        dest = os.path.join(work_dir, name)
-        tasks.append((item, dest))
-        local_names.append(name)
-    # 并发执行下载/复制，完成顺序不定，但文件名和 local_names 已按顺序（Python 2.7 用 multiprocessing.dummy）
-    workers = min(DOWNLOAD_CONCURRENCY, len(tasks))
-    if workers <= 0:
-        return local_names
-    pool = ThreadPool(workers)
+    stage = stage or StagingArea(work_dir, None, enabled=False)
+    totals = {} if totals is None else totals
+    totals.setdefault("count", 0)
+    totals.setdefault("bytes", 0)
+    totals.setdefault("duration", 0.0)
+    workers = max(1, concurrency or DOWNLOAD_CONCURRENCY)
+    pending = deque()
+    executor = ThreadPoolExecutor(max_workers=workers)
+
+    def _fetch(entry):
+        # 解析 moov 取时长也在下载线程中进行，与其他分片的下载并行
+        local_path = _fetch_one(entry.source, _local_name(entry), stage)
+        return local_path, _video_duration(local_path)
+
+    def _done(future):
+        local_path, duration = future.result()
+        totals["count"] += 1
+        totals["bytes"] += os.path.getsize(local_path)
+        _add_duration(totals, duration)
+        return local_path
+
     try:
-        pool.map(_fetch_one_task, tasks)
+        for entry in entries:
+            pending.append(executor.submit(_fetch, entry))
+            if len(pending) >= workers * 2:
+                yield _done(pending.popleft())
+        while pending:
+            yield _done(pending.popleft())
     finally:
-        pool.close()
-        pool.join()
-    return local_names
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=True)
+
+
+def _prepare_videos_to_dir(entries, work_dir, stage=None, concurrency=None, totals=None):
+    """_iter_prepared 的列表版本（组内分片等需要完整列表时使用），返回本地文件绝对路径列表，顺序与 entries 一致。"""
+    return list(_iter_prepared(manifest.as_entries(entries), work_dir, stage, concurrency, totals))
 
 
 def _write_local_concat_list(work_dir, local_names, list_filename="concat_list.txt"):
     """
-    在 work_dir 下生成 concat 列表文件。
+    在 work_dir 下生成 concat 列表文件。local_names 为相对 work_dir 的文件名或绝对路径（内存层的分片），
+    可为生成器（如 _iter_prepared，边下载边写入）。
     使用绝对路径写入每个视频路径，避免 ffmpeg 在不同 CWD 下（如服务器与本机）解析相对路径失败。
     行格式：file '/abs/path/merge_mp4_xxx/583_原文件名.mp4'
     返回该列表文件的绝对路径。
@@ -205,8 +226,7 @@ def merge_by_concat_list(list_path, output_path, ffmpeg_bin="ffmpeg"):
     if not os.path.isfile(list_path):
         raise IOError("列表文件不存在: {}".format(list_path))
 
-    valid_lines = _read_concat_list(list_path)
-    if not valid_lines:
+    if next(manifest.iter_entries(list_path), None) is None:
         raise ValueError(
             "列表文件为空或格式错误。每行应为: file 'path/to/video.mp4' 或 file 'http://...'"
         )
@@ -228,6 +248,177 @@ def merge_by_concat_list(list_path, output_path, ffmpeg_bin="ffmpeg"):
     return os.path.abspath(output_path)
 
 
+def _url_identity(url):
+    """URL 的来源标识：URL + HEAD 得到的 ETag / Content-Length；都取不到或请求失败返回 None。"""
+    if requests is None:
+        return None
+    try:
+        r = requests.head(url, allow_redirects=True, timeout=GROUP_HEAD_TIMEOUT)
+        r.raise_for_status()
+    except requests.RequestException:
+        return None
+    etag = r.headers.get("ETag", "")
+    length = r.headers.get("Content-Length", "")
+    if not etag and not length:
+        return None
+    return "{}|{}|{}".format(url, etag, length)
+
+
+def _group_key(items):
+    """
+    组缓存键：组内各来源标识的列表 MD5。本地文件为绝对路径 + mtime + 大小；
+    URL 为 URL + HEAD 的 ETag / Content-Length（同一 URL 内容被覆盖时不会命中旧结果）。
+    任一 URL 无法确定标识时返回 None，该组不使用缓存。
+    """
+    identities = []
+    for item in items:
+        if item.startswith("http://") or item.startswith("https://"):
+            identity = _url_identity(item)
+            if identity is None:
+                return None
+        else:
+            st = os.stat(item)
+            identity = "{}|{}|{}".format(os.path.abspath(item), st.st_mtime_ns, st.st_size)
+        identities.append(identity)
+    return manifest.digest_paths(identities)
+
+
+def _trim_group_cache(cache_dir, max_bytes=GROUP_CACHE_MAX_BYTES, min_age=GROUP_CACHE_MIN_AGE):
+    """组缓存总大小超过 max_bytes 时按 mtime（最近使用时间）从旧到新删除，跳过 min_age 内用过的。"""
+    entries = []
+    for name in os.listdir(cache_dir):
+        if not name.endswith(".mp4"):
+            continue
+        try:
+            st = os.stat(os.path.join(cache_dir, name))
+        except OSError:
+            continue
+        entries.append((st.st_mtime, st.st_size, name))
+    total = sum(e[1] for e in entries)
+    now = time.time()
+    for mtime, size, name in sorted(entries):
+        if total <= max_bytes:
+            break
+        if now - mtime < min_age:
+            continue
+        try:
+            os.remove(os.path.join(cache_dir, name))
+            total -= size
+        except OSError:
+            pass
+
+
+def _prepare_tree_groups(
+    entries,
+    temp_dir,
+    job_id,
+    group_size,
+    ffmpeg_bin="ffmpeg",
+    workers=TREE_WORKERS,
+    ram_stage=True,
+    cache_dir=None,
+    download_concurrency=None,
+):
+    """
+    树形合并的第一层：entries（ManifestEntry 的可迭代对象，可为生成器）按 group_size 逐组取出，
+    每组 concat -c copy 为一个中间文件并按组缓存，只下载未命中缓存的组，最多 workers 组同时下载与合并
+    （已取出未完成的组不超过 2 * workers）；每组合并完立即删除其分片。
+    缓存键（含 URL 的 HEAD 请求）在组任务内计算；无法确定键的组合并到 temp_dir，不进缓存。
+    :param cache_dir: 组缓存目录，不传用默认工作区（tmp/）的 GROUP_CACHE_SUBDIR
+    :param download_concurrency: 每组内的并发下载数，不传用 DOWNLOAD_CONCURRENCY
+    返回中间文件绝对路径列表（按组顺序），可直接交给 _write_local_concat_list 做第二层合并。
+    """
+    cache_dir = cache_dir or workspace_for(TMP_DIR).cache_dir(GROUP_CACHE_SUBDIR)
+    workers = max(1, workers)
+    outputs = []
+    running = deque()
+    built = 0
+
+    def _build(g, items, out):
+        group_dir = os.path.join(temp_dir, "group_{}".format(g))
+        stage = StagingArea(group_dir, "{}_g{}".format(job_id, g), enabled=ram_stage)
+        try:
+            local_paths = _prepare_videos_to_dir(items, group_dir, stage, concurrency=download_concurrency)
+            list_path = _write_local_concat_list(group_dir, local_paths)
+            part_path = "{}.{}.part.mp4".format(out, job_id)
+            try:
+                merge_by_concat_list(list_path, part_path, ffmpeg_bin)
+                os.replace(part_path, out)
+            finally:
+                if os.path.isfile(part_path):
+                    os.remove(part_path)
+        finally:
+            stage.close()
+            shutil.rmtree(group_dir, ignore_errors=True)
+
+    def _group(g, items):
+        key = _group_key([e.source for e in items])
+        if key is None:
+            out = os.path.join(temp_dir, "group_{}.mp4".format(g))
+        else:
+            out = os.path.join(cache_dir, key + ".mp4")
+            if os.path.isfile(out):
+                # 刷新使用时间，避免在本次合并读取前被淘汰
+                os.utime(out, None)
+                return out, False
+        _build(g, items, out)
+        return out, True
+
+    def _groups():
+        items = []
+        for entry in entries:
+            items.append(entry)
+            if len(items) == group_size:
+                yield items
+                items = []
+        if items:
+            yield items
+
+    executor = ThreadPoolExecutor(max_workers=workers)
+    try:
+        for g, items in enumerate(_groups()):
+            running.append(executor.submit(_group, g, items))
+            while len(running) >= workers * 2:
+                out, was_built = running.popleft().result()
+                outputs.append(out)
+                built += was_built
+        while running:
+            out, was_built = running.popleft().result()
+            outputs.append(out)
+            built += was_built
+    finally:
+        for future in running:
+            future.cancel()
+        executor.shutdown(wait=True)
+    print("树形合并：共 {} 组，缓存命中 {} 组，合并 {} 组".format(len(outputs), len(outputs) - built, built))
+    if built:
+        _trim_group_cache(cache_dir)
+    return outputs
+
+
+def _check_output(output_path, expected_duration=None):
+    """
+    检查合并结果（mp4_index.load_index 只读 moov，不调用 ffprobe）：moov 是否在前（faststart）、
+    时长是否与分片视频时长之和一致。只打印告警不报错，返回输出时长（秒，无法解析时 None）。
+    """
+    try:
+        index = mp4_index.load_index(output_path)
+    except Exception as e:
+        print("警告: 无法解析合并结果，跳过时长检查: {}".format(e))
+        return None
+    track = mp4_index.video_track(index)
+    duration = (track or {}).get("duration") or index.get("duration")
+    if not index.get("faststart"):
+        print("警告: 合并结果的 moov 在 mdat 之后（非 faststart），边下边播需完整下载")
+    if expected_duration and duration is not None:
+        diff = abs(duration - expected_duration)
+        if diff > max(1.0, expected_duration * DURATION_TOLERANCE):
+            print("警告: 合并结果时长 {:.2f} 秒，分片合计 {:.2f} 秒，相差 {:.2f} 秒（分片时间戳可能异常，可尝试 --reencode）".format(
+                duration, expected_duration, diff
+            ))
+    return duration
+
+
 def fix_timestamps_remux(input_path, output_path, ffmpeg_bin="ffmpeg"):
     """
     对合并后的 mp4 做一次 remux：重新生成 PTS，使时间戳连续。
@@ -359,17 +550,6 @@ def fix_timestamps_reencode(input_path, output_path, ffmpeg_bin="ffmpeg"):
     return os.path.abspath(output_path)
 
 
-def _cleanup_temp_dir(temp_dir):
-    """
-    删除临时文件目录（与合并结果同层级的 _tmp），只保留外层的合成视频。
-    """
-    if temp_dir and os.path.isdir(temp_dir):
-        try:
-            shutil.rmtree(temp_dir)
-        except OSError:
-            pass
-
-
 def merge_paths_to_one(
     paths,
     output_path=None,
@@ -377,51 +557,196 @@ def merge_paths_to_one(
     reencode=False,
     ffmpeg_bin="ffmpeg",
     keep_tmp=False,
+    workspace=None,
+    ram_stage=True,
+    tree_group=0,
+    download_concurrency=None,
+    stats=None,
 ):
     """
     将 paths（本地路径或 URL 列表）按 merge_mp4_ffmpeg2 逻辑合并为一个 mp4。
     供 API 或其它脚本调用，与命令行流程一致：下载/复制 -> concat -> remux 或 reencode。
-    :param paths: 列表，每项为本地路径或 http(s) URL
-    :param output_path: 最终输出 mp4 路径，不传则生成到 tmp/merge_api_xxx/<md5>.mp4
+    :param paths: 本地路径或 http(s) URL 的序列，或 manifest.iter_entries 产出的条目（可为生成器，边读边下载）
+    :param output_path: 最终输出 mp4 路径，不传则生成到 tmp/merge_api_<时间>_<随机>/<列表 md5>.mp4
     :param base_dir: 工作目录根，不传用 BASE_DIR
     :param reencode: 是否重编码（B 站时间戳严格时可传 True）
     :param ffmpeg_bin: ffmpeg 命令
     :param keep_tmp: 是否保留临时目录
+    :param workspace: workspace.WorkspaceManager，不传则使用 <base_dir>/tmp 的共享实例（默认配额）
+    :param ram_stage: 小分片暂存到 /dev/shm（受全局内存预算限制，超出落磁盘）
+    :param tree_group: 大于 0 时树形合并：每 tree_group 段先并发合并为中间文件（按组缓存），再合并中间文件
+    :param download_concurrency: 并发下载数，不传用 DOWNLOAD_CONCURRENCY
+    :param stats: 传入 dict 时写入各阶段耗时（秒）：download（树形合并时含组合并）、concat、remux 或 reencode、total，
+        以及 segments、input_bytes（暂存后的分片或中间文件总字节数）、output_bytes、
+        output_duration（合并结果时长，见 _check_output，时长与分片合计不符时打印告警）
     :return: 合并后的视频绝对路径
     """
-    if not paths:
+    empty, entries = _peek_entries(paths)
+    if empty:
         raise ValueError("paths 不能为空")
     base_dir = base_dir or BASE_DIR
-    tmp_dir = os.path.join(base_dir, "tmp")
-    if not os.path.exists(tmp_dir):
-        os.makedirs(tmp_dir)
-    run_id = time.strftime("%Y%m%d_%H%M%S", time.localtime())
-    work_dir = os.path.join(tmp_dir, "merge_api_{}".format(run_id))
-    temp_dir = os.path.join(work_dir, TMP_SUBDIR_NAME)
-    os.makedirs(work_dir)
-    os.makedirs(temp_dir)
-
-    if output_path is None:
-        output_path = os.path.join(work_dir, _default_output_basename(paths) + ".mp4")
-    else:
-        output_path = os.path.abspath(output_path)
-
+    workspace = workspace or workspace_for(os.path.join(base_dir, "tmp"))
+    job = workspace.new_job("merge_api")
+    work_dir, temp_dir = job.work_dir, job.temp_dir
+    # 默认输出名为列表 MD5，随下载逐条计算，不必先展开列表
+    digest = manifest.ManifestDigest()
+    entries = digest.track(entries)
+
+    stats = {} if stats is None else stats
+    t_start = time.time()
+    stage = StagingArea(temp_dir, job.job_id, enabled=ram_stage)
     try:
-        local_names = _prepare_videos_to_dir(paths, temp_dir)
+        t0 = time.time()
+        totals = {}
+        if tree_group > 0:
+            local_names = _prepare_tree_groups(
+                entries, temp_dir, job.job_id, tree_group, ffmpeg_bin=ffmpeg_bin, ram_stage=ram_stage,
+                cache_dir=workspace.cache_dir(GROUP_CACHE_SUBDIR), download_concurrency=download_concurrency,
+            )
+            totals["bytes"] = sum(os.path.getsize(p) for p in local_names)
+            totals["duration"] = 0.0
+            for p in local_names:
+                _add_duration(totals, _video_duration(p))
+        else:
+            local_names = _iter_prepared(entries, temp_dir, stage, concurrency=download_concurrency, totals=totals)
         list_path = _write_local_concat_list(temp_dir, local_names)
+        stats["segments"] = digest.count
+        stats["download"] = round(time.time() - t0, 3)
+        stats["input_bytes"] = totals["bytes"]
+        if output_path is None:
+            output_path = os.path.join(work_dir, digest.hexdigest() + ".mp4")
+        else:
+            output_path = os.path.abspath(output_path)
         merged_raw = os.path.join(temp_dir, "merged_raw.mp4")
+        t0 = time.time()
         merge_by_concat_list(list_path, merged_raw, ffmpeg_bin)
+        stats["concat"] = round(time.time() - t0, 3)
+        stage.close()
+        t0 = time.time()
         if reencode:
             fix_timestamps_reencode(merged_raw, output_path, ffmpeg_bin)
+            stats["reencode"] = round(time.time() - t0, 3)
         else:
             fix_timestamps_remux(merged_raw, output_path, ffmpeg_bin)
-        if not keep_tmp:
-            _cleanup_temp_dir(temp_dir)
+            stats["remux"] = round(time.time() - t0, 3)
+        stats["output_bytes"] = os.path.getsize(output_path)
+        stats["output_duration"] = _check_output(output_path, totals.get("duration"))
+        stats["total"] = round(time.time() - t_start, 3)
         return os.path.abspath(output_path)
+    finally:
+        stage.close()
+        job.finish(keep_tmp=keep_tmp)
+
+
+def merge_and_upload_streaming(list_path, output_path, upload_fn, ffmpeg_bin="ffmpeg"):
+    """
+    边合并边上传：ffmpeg concat 一步完成合并与时间戳修复，输出分片 MP4（frag_keyframe+empty_moov）到管道，
+    本进程按顺序追加写入 output_path（已写出的字节不再改动），同时由 upload_fn 把已写满的分片上传。
+    只有依赖最终大小的步骤（complete、投稿）在写入结束后进行，总耗时趋近 max(合并, 上传)。
+    输出超出上传时预估的大小（upload_fn 抛 SizeHintExceeded）时不中断合并，写入结束后以 growing=None 再调用一次 upload_fn 整文件上传。
+    :param list_path: 本地 concat 列表文件路径
+    :param output_path: 输出 mp4 路径
+    :param upload_fn: 上传回调 (output_path, growing) -> 结果；growing 为 push.bilibili.chunks.GrowingFile，
+        回退整文件上传时为 None
+    :param ffmpeg_bin: ffmpeg 命令
+    :return: (输出文件绝对路径, upload_fn 的返回值)
+    """
+    if BASE_DIR not in sys.path:
+        sys.path.insert(0, BASE_DIR)
+    from push.bilibili.chunks import GrowingFile
+    from push.bilibili.upload import SizeHintExceeded
+
+    cmd = [
+        ffmpeg_bin,
+        "-f", "concat",
+        "-safe", "0",
+        "-protocol_whitelist", "file,http,https,tcp,tls,crypto,data,httpproxy,httpsproxy",
+        "-i", os.path.abspath(list_path),
+        "-c", "copy",
+        "-fflags", "+genpts",
+        "-avoid_negative_ts", "make_zero",
+        "-movflags", "+frag_keyframe+empty_moov+default_base_moof",
+        "-f", "mp4",
+        "pipe:1",
+    ]
+    growing = GrowingFile(output_path)
+    out_f = open(output_path, "wb")
+    err_f = tempfile.TemporaryFile()
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=err_f)
+
+    def _pump():
+        error = None
+        try:
+            with out_f:
+                while True:
+                    block = proc.stdout.read(STREAM_PIPE_BLOCK)
+                    if not block:
+                        break
+                    out_f.write(block)
+                    out_f.flush()
+                    growing.advance(len(block))
+            if proc.wait() != 0:
+                err_f.seek(0)
+                error = RuntimeError("ffmpeg 合并失败:\n{}".format(_ffmpeg_stderr_text(err_f.read())))
+        except Exception as e:
+            error = e
+        finally:
+            growing.finish(error)
+
+    pump = threading.Thread(target=_pump)
+    pump.daemon = True
+    pump.start()
+    exceeded = None
+    try:
+        result = upload_fn(output_path, growing)
+    except SizeHintExceeded as e:
+        exceeded = e
     except Exception:
-        if not keep_tmp:
-            _cleanup_temp_dir(temp_dir)
+        if proc.poll() is None:
+            proc.kill()
         raise
+    finally:
+        pump.join()
+        err_f.close()
+    if growing.error is not None:
+        raise growing.error
+    if exceeded is not None:
+        print("{}，合并完成后整文件上传".format(exceeded))
+        result = upload_fn(output_path, None)
+    return os.path.abspath(output_path), result
+
+
+def _get_api_pusher(args):
+    """
+    按命令行参数获取 API 推送客户端并确保已登录，登录失败直接退出。
+    使用池化实例：同一进程内重复调用（其他脚本循环调用 main、多线程推送）复用同一 Session 连接池与登录校验缓存。
+    """
+    if BASE_DIR not in sys.path:
+        sys.path.insert(0, BASE_DIR)
+    from push import get_pusher
+    cookie_path = args.push_cookie
+    if args.push == "bilibili" and not cookie_path:
+        cookie_path = os.path.join(BASE_DIR, "push", "bilibili", "cookie.json")
+    pusher = get_pusher(args.push, pooled=True, cookie_path=cookie_path)
+    if args.push_login:
+        if not pusher.login(use_qrcode=True, save_cookie_path=cookie_path):
+            print("错误: 扫码登录失败")
+            sys.exit(1)
+    if not pusher.is_logged_in():
+        print("错误: 未登录或 Cookie 已失效，请提供有效 Cookie 或使用 --push-login 扫码登录")
+        sys.exit(1)
+    return pusher
+
+
+def _api_upload_kwargs(args):
+    """命令行参数 -> pusher.upload 的投稿参数。"""
+    return {
+        "title": args.title.strip(),
+        "desc": args.desc or "",
+        "tid": args.tid,
+        "tag": args.tag.strip().split(",") if args.tag else None,
+        "concurrency": args.push_concurrency,
+    }
 
 
 def main():
@@ -435,7 +760,7 @@ def main():
     parser.add_argument(
         "-o", "--output",
         default=None,
-        help="输出 mp4 路径（不传则按列表内容 MD5 命名：tmp/<run_id>/<md5>.mp4）",
+        help="输出 mp4 路径（不传则按列表内容 MD5 命名：tmp/<任务目录>/<md5>.mp4）",
     )
     parser.add_argument(
         "--ffmpeg",
@@ -447,6 +772,33 @@ def main():
         action="store_true",
         help="合并完成后保留临时分片与中间文件（默认会删除，仅保留合并结果）",
     )
+    parser.add_argument(
+        "--tree-group",
+        type=int,
+        default=0,
+        help="树形合并：每 N 段先合并为中间文件（按组缓存到 tmp/{}，计入 --tmp-quota，命中的组不再下载），再合并中间文件；适合上千段的列表（默认 0 不启用）".format(
+            GROUP_CACHE_SUBDIR
+        ),
+    )
+    parser.add_argument(
+        "--tree-workers",
+        type=int,
+        default=TREE_WORKERS,
+        help="树形合并时同时下载并合并的组数（默认 {}）".format(TREE_WORKERS),
+    )
+    parser.add_argument(
+        "--no-ram-stage",
+        action="store_true",
+        help="分片全部暂存到磁盘（默认不超过 {}MB 的分片在内存预算内放 /dev/shm）".format(RAM_STAGE_MAX_FILE // (1024 * 1024)),
+    )
+    parser.add_argument(
+        "--tmp-quota",
+        type=float,
+        default=None,
+        help="tmp/ 下合并目录的磁盘配额（GB），超出时按最近使用时间删除旧的合并结果（默认 {:.0f}，0 不限制）".format(
+            WORKSPACE_QUOTA_BYTES / 1024.0 ** 3
+        ),
+    )
     parser.add_argument(
         "--no-fix-timestamps",
         action="store_true",
@@ -474,6 +826,17 @@ def main():
         action="store_true",
         help="推送前进行扫码登录（无 Cookie 或失效时）",
     )
+    parser.add_argument(
+        "--push-concurrency",
+        type=int,
+        default=None,
+        help="B 站 API 投稿时分片上传的初始并发数（默认 3，上传中按实测吞吐自适应）",
+    )
+    parser.add_argument(
+        "--stream-upload",
+        action="store_true",
+        help="与 --push bilibili 同用：合并输出分片 MP4 并边合并边上传，总耗时趋近 max(合并, 上传)",
+    )
     parser.add_argument(
         "--title",
         default=None,
@@ -497,42 +860,82 @@ def main():
     )
     args = parser.parse_args()
 
+    if args.stream_upload and (args.push != "bilibili" or args.reencode):
+        print("错误: --stream-upload 仅用于 --push bilibili，且不能与 --reencode 同用")
+        sys.exit(1)
+
     try:
-        paths = _load_mapbinlist(args.list_source)
+        # 列表逐行流式读取：条目边读边下载，不整体载入内存
+        empty, entries = _peek_entries(manifest.iter_entries(args.list_source))
     except (IOError, RuntimeError) as e:
         print("错误: {}".format(e))
         sys.exit(1)
 
-    if not paths:
+    if empty:
         print("错误: 列表为空或格式错误，每行应为: file 'path_or_url'")
         sys.exit(1)
 
-    if not os.path.exists(TMP_DIR):
-        os.makedirs(TMP_DIR)
-    run_id = time.strftime("%Y%m%d_%H%M%S", time.localtime())
-    work_dir = os.path.join(TMP_DIR, "merge_{}".format(run_id))
-    temp_dir = os.path.join(work_dir, TMP_SUBDIR_NAME)
-    os.makedirs(work_dir)
-    os.makedirs(temp_dir)
-
-    output_path = args.output
-    if output_path is None:
-        output_path = os.path.join(work_dir, _default_output_basename(paths) + ".mp4")
-    else:
-        output_path = os.path.abspath(output_path)
+    quota = None if args.tmp_quota is None else int(args.tmp_quota * 1024 ** 3)
+    workspace = workspace_for(TMP_DIR, quota_bytes=quota)
+    job = workspace.new_job("merge")
+    work_dir, temp_dir = job.work_dir, job.temp_dir
+    stage = StagingArea(temp_dir, job.job_id, enabled=not args.no_ram_stage)
+    digest = manifest.ManifestDigest()
+    entries = digest.track(entries)
 
-    local_names = []
     try:
         print("开始时间: {}".format(time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())))
         print("工作目录: {}（临时文件在 {}）".format(work_dir, TMP_SUBDIR_NAME))
-        print("正在下载/复制 {} 个视频到临时目录...".format(len(paths)))
-        local_names = _prepare_videos_to_dir(paths, temp_dir)
-        print("下载完成时间: {}".format(time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())))
-        print("已就绪，生成临时 concat 列表...")
+        totals = {}
+        if args.tree_group > 0:
+            local_names = _prepare_tree_groups(
+                entries, temp_dir, job.job_id, args.tree_group, ffmpeg_bin=args.ffmpeg,
+                workers=args.tree_workers, ram_stage=not args.no_ram_stage,
+                cache_dir=workspace.cache_dir(GROUP_CACHE_SUBDIR),
+            )
+            totals["bytes"] = sum(os.path.getsize(p) for p in local_names)
+            totals["duration"] = 0.0
+            for p in local_names:
+                _add_duration(totals, _video_duration(p))
+        else:
+            print("正在下载/复制列表中的视频到临时目录（边读列表边下载）...")
+            local_names = _iter_prepared(entries, temp_dir, stage, totals=totals)
+        # 边下载边写 concat 列表
         list_path = _write_local_concat_list(temp_dir, local_names)
+        print("共 {} 个视频，下载完成时间: {}".format(digest.count, time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())))
+        if stage.ram_files:
+            print("其中 {} 个分片暂存在内存（{}）".format(stage.ram_files, stage.ram_dir))
+
+        output_path = args.output
+        if output_path is None:
+            output_path = os.path.join(work_dir, digest.hexdigest() + ".mp4")
+        else:
+            output_path = os.path.abspath(output_path)
+        if args.stream_upload:
+            try:
+                pusher = _get_api_pusher(args)
+                size_hint = int(totals["bytes"] * (1 + STREAM_SIZE_MARGIN)) + STREAM_SIZE_PAD
+                print("开始合并，同时推送到 {}（分片 MP4，边合并边上传）...".format(args.push))
+                out, result = merge_and_upload_streaming(
+                    list_path,
+                    output_path,
+                    lambda path, growing: pusher.upload(
+                        path, growing=growing, size_hint=size_hint, **_api_upload_kwargs(args)
+                    ),
+                    args.ffmpeg,
+                )
+            except Exception as e:
+                print("边合并边推送失败: {}".format(e))
+                sys.exit(1)
+            print("合并完成: {}，结束时间: {}".format(out, time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())))
+            print("投稿成功: {}".format(result.get("data", result)))
+            if result.get("upload_stats"):
+                print("投稿耗时统计: {}".format(result["upload_stats"]))
+            return
         print("开始合并...")
         merged_raw = os.path.join(temp_dir, "merged_raw.mp4")
         merge_by_concat_list(list_path, merged_raw, args.ffmpeg)
+        stage.close()
         if args.reencode:
             print("合并完成，正在重新压制（重编码）以兼容 B 站等平台...")
             out = fix_timestamps_reencode(merged_raw, output_path, args.ffmpeg)
@@ -545,10 +948,11 @@ def main():
             print("合并并修复完成: {}，结束时间: {}".format(
                 out, time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
             ))
+        _check_output(out, totals.get("duration"))
 
         # 合并完成后立即删除 _tmp 临时目录，释放空间（推送前就删）
         if not args.keep_tmp:
-            _cleanup_temp_dir(temp_dir)
+            job.release_temp()
 
         # 可选：推送到 B 站等平台
         if args.push:
@@ -579,29 +983,12 @@ def main():
                     sys.exit(1)
             else:
                 try:
-                    if BASE_DIR not in sys.path:
-                        sys.path.insert(0, BASE_DIR)
-                    from push import get_pusher
-                    cookie_path = args.push_cookie
-                    if args.push == "bilibili" and not cookie_path:
-                        cookie_path = os.path.join(BASE_DIR, "push", "bilibili", "cookie.json")
-                    pusher = get_pusher(args.push, cookie_path=cookie_path)
-                    if args.push_login:
-                        if not pusher.login(use_qrcode=True, save_cookie_path=cookie_path):
-                            print("错误: 扫码登录失败")
-                            sys.exit(1)
-                    if not pusher.is_logged_in():
-                        print("错误: 未登录或 Cookie 已失效，请提供有效 Cookie 或使用 --push-login 扫码登录")
-                        sys.exit(1)
+                    pusher = _get_api_pusher(args)
                     print("正在推送到 {}...".format(args.push))
-                    result = pusher.upload(
-                        out,
-                        title=args.title.strip(),
-                        desc=args.desc or "",
-                        tid=args.tid,
-                        tag=args.tag.strip().split(",") if args.tag else None,
-                    )
+                    result = pusher.upload(out, **_api_upload_kwargs(args))
                     print("投稿成功: {}".format(result.get("data", result)))
+                    if result.get("upload_stats"):
+                        print("投稿耗时统计: {}".format(result["upload_stats"]))
                 except Exception as e:
                     print("推送失败: {}".format(e))
                     sys.exit(1)
@@ -609,9 +996,9 @@ def main():
         print("错误: {}".format(e))
         sys.exit(1)
     finally:
-        # 合并完成后删除临时目录（仅保留最终视频）；传 --keep-tmp 则保留
-        if not args.keep_tmp:
-            _cleanup_temp_dir(temp_dir)
+        # 合并完成后删除临时目录（仅保留最终视频）；传 --keep-tmp 则保留（内存层分片总是删除）
+        stage.close()
+        job.finish(keep_tmp=args.keep_tmp)
 
 
 if __name__ == "__main__":
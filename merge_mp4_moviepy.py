@@ -3,6 +3,9 @@
 """
 从 mapbinlist.txt 读取视频列表（格式同 ffmpeg concat：每行 file 'path' 或 file 'url'），
 按顺序合并并压缩输出为一个 mp4。清晰度可降低以减小体积，不丢帧（保持原 fps 逐帧编码）。
+远程分段由 segment_prefetch 并发下载（复用连接），首段就绪即开始打开，不必等全部下载完。
+默认流式模式：逐段打开、缩放到首段尺寸（保持各段原 fps）编码为中间文件后立即关闭并删除已用分段，最后 -c copy 拼接，
+同一时刻只有一个 VideoFileClip，峰值内存与文件句柄数不随分段数增长。--no-stream 为一次性 concatenate_videoclips。
 """
 
 import os
@@ -10,59 +13,99 @@ import sys
 import tempfile
 import argparse
 import shutil
+import subprocess
 
 try:
-    import requests
-    from moviepy import VideoFileClip, concatenate_videoclips
+    import numpy as np
+    from moviepy import AudioClip, VideoFileClip, concatenate_videoclips
+    from moviepy.config import FFMPEG_BINARY
 except ImportError:
     print("请先安装依赖: pip install -r requirements.txt")
     sys.exit(1)
 
+import manifest
+from segment_prefetch import PREFETCH_AHEAD, PREFETCH_CONCURRENCY, SegmentPrefetcher
+
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 TMP_DIR = os.path.join(BASE_DIR, "tmp")
 DEFAULT_LIST_PATH = os.path.join(BASE_DIR, "mapbinlist.txt")
+DEFAULT_PRESET = "medium"
+# 流式模式中间文件统一的音频采样率（MoviePy 读取音频默认双声道）
+AUDIO_FPS = 44100
+# 流式模式中间文件统一的视频轨时间刻度：各段 fps 不同时 concat -c copy 仍得到一致的时间基
+VIDEO_TRACK_TIMESCALE = 90000
 
 
 def parse_concat_list(list_path):
     """
     解析 concat 列表文件，每行格式：file 'path' 或 file "path" 或 file path。
     返回路径/URL 列表（已去掉引号）。
+    这里需要完整列表：预取器按序号随机访问分段，非流式模式还要同时打开全部分段，因此用 load_paths 而非流式 iter_entries。
+    """
+    return manifest.load_paths(list_path)
+
+
+def _silence(duration):
+    """与 MoviePy 默认音频格式一致（双声道）的静音，供无音轨分段补齐，保证各中间文件流结构相同。"""
+    def frame_function(t):
+        return np.zeros((len(t), 2)) if np.ndim(t) else np.zeros(2)
+    return AudioClip(frame_function, duration=duration, fps=AUDIO_FPS)
+
+
+def _merge_streaming(prefetcher, temp_dir, output_path, bitrate, audio_bitrate, threads, preset):
+    """
+    流式合并：逐段打开 VideoFileClip，缩放到首段尺寸、按该段自身 fps 编码为中间文件（编码参数与时间刻度一致，
+    不丢帧也不补帧），编码完立即关闭该段并 release（预取器删除已下载的分段）；最后用 ffmpeg concat -c copy 拼接。
+    MoviePy 的临时音频文件写在 parts 目录，不落到当前工作目录。
+    :return: 输出文件的绝对路径
     """
-    with open(list_path, "r", encoding="utf-8") as f:
-        lines = [ln.strip() for ln in f if ln.strip()]
-    paths = []
-    for ln in lines:
-        if not ln.startswith("file "):
-            continue
-        rest = ln[5:].strip()
-        if (rest.startswith("'") and rest.endswith("'")) or (rest.startswith('"') and rest.endswith('"')):
-            rest = rest[1:-1]
-        if rest:
-            paths.append(rest)
-    return paths
-
-
-def download_from_url(url, save_path, timeout=120):
-    """从 URL 下载文件到本地路径。"""
-    r = requests.get(url, stream=True, timeout=timeout)
-    r.raise_for_status()
-    with open(save_path, "wb") as f:
-        for chunk in r.iter_content(chunk_size=8192):
-            if chunk:
-                f.write(chunk)
-
-
-def resolve_path(item, temp_dir):
-    """若为 URL 则下载到 temp_dir 并返回本地路径，否则校验本地文件存在后返回。"""
-    if item.startswith("http://") or item.startswith("https://"):
-        name = os.path.basename(item.split("?")[0]) or "video_{}.mp4".format(abs(hash(item)) % 100000)
-        local_path = os.path.join(temp_dir, name)
-        download_from_url(item, local_path)
-        return local_path
-    if not os.path.isfile(item):
-        raise FileNotFoundError("本地文件不存在: {}".format(item))
-    return item
+    first = VideoFileClip(prefetcher.get(0))
+    size = tuple(first.size)
+    first.close()
+
+    parts_dir = os.path.join(temp_dir, "parts")
+    os.makedirs(parts_dir, exist_ok=True)
+    part_paths = []
+    for i in range(len(prefetcher)):
+        part_path = os.path.join(parts_dir, "part_{:04d}.mp4".format(i))
+        clip = VideoFileClip(prefetcher.get(i))
+        try:
+            part = clip
+            if tuple(clip.size) != size:
+                part = part.resized(new_size=size)
+            if clip.audio is None:
+                part = part.with_audio(_silence(clip.duration))
+            part.write_videofile(
+                part_path,
+                fps=clip.fps or 25,
+                codec="libx264",
+                audio_codec="aac",
+                bitrate=bitrate,
+                audio_bitrate=audio_bitrate,
+                audio_fps=AUDIO_FPS,
+                preset=preset,
+                threads=threads,
+                temp_audiofile=os.path.join(parts_dir, "part_{:04d}_audio.m4a".format(i)),
+                ffmpeg_params=["-video_track_timescale", str(VIDEO_TRACK_TIMESCALE)],
+            )
+        finally:
+            clip.close()
+            prefetcher.release(i)
+        part_paths.append(part_path)
+
+    list_path = os.path.join(parts_dir, "parts_list.txt")
+    with open(list_path, "w", encoding="utf-8") as f:
+        for p in part_paths:
+            f.write("file '{}'\n".format(p.replace("'", "'\\''")))
+    cmd = [
+        FFMPEG_BINARY, "-y", "-f", "concat", "-safe", "0", "-i", list_path,
+        "-c", "copy", "-movflags", "+faststart", output_path,
+    ]
+    ret = subprocess.run(cmd, capture_output=True)
+    if ret.returncode != 0:
+        raise RuntimeError("拼接中间文件失败: {}".format(ret.stderr.decode("utf-8", "replace").strip()[-2000:]))
+    return os.path.abspath(output_path)
 
 
 def merge_mp4_from_list(
@@ -71,14 +114,21 @@ def merge_mp4_from_list(
     bitrate="800k",
     audio_bitrate="128k",
     temp_dir=None,
+    stream=True,
+    threads=None,
+    preset=DEFAULT_PRESET,
 ):
     """
-    从列表文件读取视频，合并并压缩输出。不丢帧（保持各段原 fps，逐帧编码）。
+    从列表文件读取视频，合并并压缩输出。不丢帧（逐帧编码）。
     :param list_path: 列表文件路径（每行 file 'path_or_url'）
     :param output_path: 输出 mp4 路径
     :param bitrate: 视频码率，越小体积越小、清晰度越低，如 800k、500k
     :param audio_bitrate: 音频码率
     :param temp_dir: 下载远程文件用的临时目录，不传则自动创建并清理
+    :param stream: True 流式逐段编码后拼接（内存不随分段数增长，各段缩放到首段尺寸，保持各自 fps）；
+        False 一次性打开全部分段 concatenate_videoclips（保持各段原 fps）
+    :param threads: 传给 write_videofile 的编码线程数，默认 CPU 核数
+    :param preset: 传给 write_videofile 的 libx264 preset
     :return: 输出文件的绝对路径
     """
     if not os.path.isfile(list_path):
@@ -94,15 +144,21 @@ def merge_mp4_from_list(
     if temp_dir is None:
         temp_dir = tempfile.mkdtemp()
 
+    threads = threads or os.cpu_count() or 1
     try:
-        local_paths = []
-        for i, p in enumerate(paths):
-            local_paths.append(resolve_path(p, temp_dir))
-
-        clips = []
-        for path in local_paths:
-            clip = VideoFileClip(path)
-            clips.append(clip)
+        if stream:
+            with SegmentPrefetcher(paths, temp_dir, max_ahead=PREFETCH_AHEAD) as prefetcher:
+                return _merge_streaming(
+                    prefetcher, temp_dir, output_path, bitrate, audio_bitrate, threads, preset
+                )
+
+        # concatenate_videoclips 编码时同时读取全部分段，故不删除已用分段；预取窗口覆盖整个列表
+        with SegmentPrefetcher(
+            paths, temp_dir, max_ahead=len(paths), concurrency=PREFETCH_CONCURRENCY, evict=False
+        ) as prefetcher:
+            clips = []
+            for i in range(len(paths)):
+                clips.append(VideoFileClip(prefetcher.get(i)))
 
         final = concatenate_videoclips(clips)
         # 不丢帧：不设 fps，保持原时间轴；压缩：降低码率
@@ -112,6 +168,9 @@ def merge_mp4_from_list(
             audio_codec="aac",
             bitrate=bitrate,
             audio_bitrate=audio_bitrate,
+            preset=preset,
+            threads=threads,
+            temp_audiofile=os.path.join(temp_dir, "merged_audio.m4a"),
             ffmpeg_params=["-movflags", "+faststart"],
         )
         for c in clips:
@@ -151,6 +210,22 @@ def main():
         default="128k",
         help="音频码率（默认 128k）",
     )
+    parser.add_argument(
+        "--threads",
+        type=int,
+        default=None,
+        help="编码线程数（默认: CPU 核数）",
+    )
+    parser.add_argument(
+        "--preset",
+        default=DEFAULT_PRESET,
+        help="libx264 preset，越快体积越大（默认 {}）".format(DEFAULT_PRESET),
+    )
+    parser.add_argument(
+        "--no-stream",
+        action="store_true",
+        help="一次性打开全部分段合并（旧方式，分段多时内存与文件句柄占用大）；默认流式模式把各段缩放到首段尺寸，保持各段原 fps",
+    )
     args = parser.parse_args()
 
     output_path = args.output
@@ -164,6 +239,9 @@ def main():
             output_path,
             bitrate=args.bitrate,
             audio_bitrate=args.audio_bitrate,
+            stream=not args.no_stream,
+            threads=args.threads,
+            preset=args.preset,
         )
         print("合并完成: {}".format(out))
     except Exception as e:
@@ -0,0 +1,471 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+MP4 / ISO-BMFF 轻量索引：不调用 ffmpeg/ffprobe，只读顶层 box 头与整个 moov。
+- 本地文件 mmap 读取；URL 用 HTTP Range 请求，通常 3~5 次请求即可（ftyp、mdat 头、moov）
+- 索引内容：时长、moov 是否在 mdat 之前（faststart）、各轨道编码/分辨率/声道/采样率/样本数，
+  视频轨关键帧表（样本号、解码时间、文件偏移）
+- 索引以 JSON 存放在 tmp/mp4_index/<来源标识 sha1>.json；本地文件按路径 + mtime + 大小、
+  URL 按 URL + ETag + 大小区分，内容变化即重新解析
+- 命中缓存时刷新文件 mtime；写入新索引时（每进程最多每 INDEX_PRUNE_INTERVAL 秒一次）删除 INDEX_CACHE_MAX_AGE 内未用过的索引，
+  该目录同时计入 workspace 配额（workspace.CACHE_SUBDIRS）
+不处理 edit list（elst），关键帧时间为解码时间；分片 MP4（moof）只给出轨道信息，不含关键帧表。
+
+用法：
+  python mp4_index.py /path/to/a.mp4
+  python mp4_index.py "https://cdn.example.com/b.mp4" --refresh
+"""
+
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+
+try:
+    import requests
+except ImportError:
+    requests = None
+
+from workspace import INDEX_CACHE_SUBDIR, TMP_DIR
+
+INDEX_CACHE_DIR = os.path.join(TMP_DIR, INDEX_CACHE_SUBDIR)
+# 超过该时长（秒）未用过的索引被删除、两次清理的最小间隔（秒）
+INDEX_CACHE_MAX_AGE = 7 * 24 * 3600
+INDEX_PRUNE_INTERVAL = 3600
+# 索引结构变化时递增，旧缓存自动失效
+INDEX_VERSION = 1
+HTTP_TIMEOUT = 30
+# moov 超过该大小视为异常文件，不读取
+MAX_MOOV_BYTES = 64 * 1024 * 1024
+
+# 需要向下解析的容器 box
+_CONTAINERS = (b"moov", b"trak", b"mdia", b"minf", b"stbl", b"mvex")
+
+
+def _is_url(source):
+    return source.startswith("http://") or source.startswith("https://")
+
+
+class _LocalReader(object):
+    """本地文件：mmap 只读映射，按需切片。"""
+
+    def __init__(self, path):
+        self._f = open(path, "rb")
+        self.size = os.fstat(self._f.fileno()).st_size
+        if self.size == 0:
+            self._f.close()
+            raise ValueError("空文件: {}".format(path))
+        self._map = mmap.mmap(self._f.fileno(), 0, access=mmap.ACCESS_READ)
+        st = os.stat(path)
+        self.identity = "file|{}|{}|{}".format(os.path.abspath(path), st.st_mtime_ns, st.st_size)
+
+    def read(self, offset, length):
+        return self._map[offset:offset + length]
+
+    def close(self):
+        self._map.close()
+        self._f.close()
+
+
+class _HttpReader(object):
+    """远程文件：每次 read 发一个 Range 请求；首个请求同时得到文件大小与 ETag。"""
+
+    def __init__(self, url, session=None):
+        if requests is None:
+            raise RuntimeError("读取 URL 需安装 requests: pip install requests")
+        self.url = url
+        self._own_session = session is None
+        self._session = session or requests.Session()
+        self.size = None
+        self._etag = ""
+        self._head = self.read(0, 64 * 1024)
+        self.identity = "url|{}|{}|{}".format(url, self._etag, self.size)
+
+    def read(self, offset, length):
+        if self.size is not None:
+            length = min(length, self.size - offset)
+            if length <= 0:
+                return b""
+        if offset == 0 and self.size is not None and length <= len(self._head):
+            return self._head[:length]
+        headers = {"Range": "bytes={}-{}".format(offset, offset + length - 1)}
+        r = self._session.get(self.url, headers=headers, timeout=HTTP_TIMEOUT)
+        r.raise_for_status()
+        if r.status_code != 206:
+            raise RuntimeError("服务端不支持 Range 请求: {}".format(self.url))
+        if self.size is None:
+            content_range = r.headers.get("Content-Range", "")
+            self.size = int(content_range.rsplit("/", 1)[-1])
+            self._etag = r.headers.get("ETag", "")
+        return r.content
+
+    def close(self):
+        if self._own_session:
+            self._session.close()
+
+
+def _open_reader(source, session=None):
+    if _is_url(source):
+        return _HttpReader(source, session=session)
+    if not os.path.isfile(source):
+        raise FileNotFoundError("本地文件不存在: {}".format(source))
+    return _LocalReader(source)
+
+
+def _top_level_boxes(reader):
+    """遍历顶层 box，只读每个 box 的头部。yield (type, offset, size)。"""
+    offset = 0
+    while offset + 8 <= reader.size:
+        header = reader.read(offset, 16)
+        if len(header) < 8:
+            break
+        size, box_type = struct.unpack(">I4s", header[:8])
+        if size == 1:
+            if len(header) < 16:
+                break
+            size = struct.unpack(">Q", header[8:16])[0]
+        elif size == 0:
+            size = reader.size - offset
+        if size < 8:
+            raise ValueError("box 大小非法 @{}: {}".format(offset, size))
+        yield box_type, offset, size
+        offset += size
+
+
+def _child_boxes(buf, start, end):
+    """遍历 buf[start:end] 内的子 box。yield (type, payload_start, box_end)。"""
+    pos = start
+    while pos + 8 <= end:
+        size, box_type = struct.unpack(">I4s", buf[pos:pos + 8])
+        header = 8
+        if size == 1:
+            size = struct.unpack(">Q", buf[pos + 8:pos + 16])[0]
+            header = 16
+        elif size == 0:
+            size = end - pos
+        if size < header or pos + size > end:
+            break
+        yield box_type, pos + header, pos + size
+        pos += size
+
+
+def _u32_table(buf, pos, count, width=1):
+    """从 pos 起读取 count 行、每行 width 个 uint32。"""
+    values = struct.unpack(">{}I".format(count * width), buf[pos:pos + 4 * count * width])
+    if width == 1:
+        return list(values)
+    return [values[i:i + width] for i in range(0, len(values), width)]
+
+
+def _parse_track(buf, start, end):
+    """解析一个 trak，返回轨道信息 dict 与内部样本表（stts/stss/stsc/stsz/stco）。"""
+    track = {}
+    tables = {}
+
+    def walk(s, e):
+        for box_type, p, box_end in _child_boxes(buf, s, e):
+            if box_type in _CONTAINERS:
+                walk(p, box_end)
+            elif box_type == b"tkhd":
+                base = p + (88 if buf[p] == 1 else 76)
+                width, height = struct.unpack(">II", buf[base:base + 8])
+                id_pos = p + (20 if buf[p] == 1 else 12)
+                track["track_id"] = struct.unpack(">I", buf[id_pos:id_pos + 4])[0]
+                track["width"] = width >> 16
+                track["height"] = height >> 16
+            elif box_type == b"mdhd":
+                if buf[p] == 1:
+                    timescale, duration = struct.unpack(">IQ", buf[p + 20:p + 32])
+                else:
+                    timescale, duration = struct.unpack(">II", buf[p + 12:p + 20])
+                track["timescale"] = timescale
+                track["duration"] = round(float(duration) / timescale, 6) if timescale else 0
+            elif box_type == b"hdlr":
+                handler = buf[p + 8:p + 12].decode("latin-1")
+                track["type"] = {"vide": "video", "soun": "audio"}.get(handler, handler)
+            elif box_type == b"stsd":
+                entry = p + 8
+                if entry + 8 <= box_end:
+                    track["codec"] = buf[entry + 4:entry + 8].decode("latin-1")
+                    tables["stsd_entry"] = entry
+            elif box_type == b"stts":
+                tables["stts"] = _u32_table(buf, p + 8, struct.unpack(">I", buf[p + 4:p + 8])[0], 2)
+            elif box_type == b"stss":
+                tables["stss"] = _u32_table(buf, p + 8, struct.unpack(">I", buf[p + 4:p + 8])[0])
+            elif box_type == b"stsc":
+                tables["stsc"] = _u32_table(buf, p + 8, struct.unpack(">I", buf[p + 4:p + 8])[0], 3)
+            elif box_type == b"stsz":
+                sample_size, count = struct.unpack(">II", buf[p + 4:p + 12])
+                tables["sample_size"] = sample_size
+                tables["sample_count"] = count
+                tables["sizes"] = _u32_table(buf, p + 12, count) if sample_size == 0 else None
+            elif box_type == b"stco":
+                tables["chunks"] = _u32_table(buf, p + 8, struct.unpack(">I", buf[p + 4:p + 8])[0])
+            elif box_type == b"co64":
+                count = struct.unpack(">I", buf[p + 4:p + 8])[0]
+                tables["chunks"] = list(struct.unpack(">{}Q".format(count), buf[p + 8:p + 8 + 8 * count]))
+
+    walk(start, end)
+    entry = tables.get("stsd_entry")
+    if entry is not None:
+        if track.get("type") == "video" and not track.get("width"):
+            track["width"], track["height"] = struct.unpack(">HH", buf[entry + 32:entry + 36])
+        elif track.get("type") == "audio":
+            track["channels"] = struct.unpack(">H", buf[entry + 24:entry + 26])[0]
+            track["sample_rate"] = struct.unpack(">I", buf[entry + 32:entry + 36])[0] >> 16
+    if track.get("type") != "video":
+        track.pop("width", None)
+        track.pop("height", None)
+    track["sample_count"] = tables.get("sample_count", 0)
+    return track, tables
+
+
+def _sample_times(samples, stts):
+    """升序样本号（从 1 开始） -> 解码时间（timescale 单位）。"""
+    out = []
+    it = iter(samples)
+    target = next(it, None)
+    sample, t = 1, 0
+    for count, delta in stts:
+        while target is not None and target < sample + count:
+            out.append(t + (target - sample) * delta)
+            target = next(it, None)
+        sample += count
+        t += count * delta
+    return out
+
+
+def _sample_offsets(samples, stsc, chunks, sample_size, sizes):
+    """升序样本号 -> 文件偏移：按 stsc 逐 chunk 推进，只对包含目标样本的 chunk 累加样本大小。"""
+    out = []
+    it = iter(samples)
+    target = next(it, None)
+    sample = 1
+    runs = list(stsc) + [(len(chunks) + 1, 0, 0)]
+    for r in range(len(stsc)):
+        first_chunk, per_chunk = runs[r][0], runs[r][1]
+        for chunk in range(first_chunk, min(runs[r + 1][0], len(chunks) + 1)):
+            if target is None:
+                return out
+            end = sample + per_chunk
+            while target is not None and target < end:
+                offset = chunks[chunk - 1]
+                if sample_size:
+                    offset += (target - sample) * sample_size
+                else:
+                    offset += sum(sizes[sample - 1:target - 1])
+                out.append(offset)
+                target = next(it, None)
+            sample = end
+    return out
+
+
+def _keyframes(track, tables):
+    """视频轨关键帧表 [[样本号, 秒, 文件偏移], ...]；无 stss 时所有样本都是关键帧，返回 None。"""
+    stss = tables.get("stss")
+    if stss is None:
+        return None
+    timescale = track.get("timescale") or 1
+    times = _sample_times(stss, tables.get("stts", []))
+    offsets = []
+    if tables.get("chunks") and tables.get("stsc"):
+        offsets = _sample_offsets(stss, tables["stsc"], tables["chunks"], tables.get("sample_size"), tables.get("sizes"))
+    rows = []
+    for i, sample in enumerate(stss):
+        rows.append([
+            sample,
+            round(float(times[i]) / timescale, 6) if i < len(times) else None,
+            offsets[i] if i < len(offsets) else None,
+        ])
+    return rows
+
+
+def build_index(source, session=None, reader=None):
+    """
+    解析 source（本地路径或 URL），返回索引 dict：
+      source, size, identity, faststart, moov_offset, moov_size, mdat_offset, mdat_size, fragmented,
+      duration（秒）, tracks: [{track_id, type, codec, timescale, duration, sample_count,
+      width/height（视频）, channels/sample_rate（音频）, keyframes（视频）}]
+    :param reader: 已打开的 source 读取器（如 load_index 确认 URL 标识时打开的），由调用方关闭；不传则自行打开并关闭
+    """
+    own_reader = reader is None
+    reader = reader or _open_reader(source, session=session)
+    try:
+        index = {
+            "version": INDEX_VERSION,
+            "source": source,
+            "size": reader.size,
+            "identity": reader.identity,
+            "moov_offset": None,
+            "moov_size": None,
+            "mdat_offset": None,
+            "mdat_size": None,
+        }
+        for box_type, offset, size in _top_level_boxes(reader):
+            if box_type == b"moov" and index["moov_offset"] is None:
+                index["moov_offset"], index["moov_size"] = offset, size
+            elif box_type == b"mdat" and index["mdat_offset"] is None:
+                index["mdat_offset"], index["mdat_size"] = offset, size
+            if index["moov_offset"] is not None and index["mdat_offset"] is not None:
+                break
+        if index["moov_offset"] is None:
+            raise ValueError("未找到 moov: {}".format(source))
+        if index["moov_size"] > MAX_MOOV_BYTES:
+            raise ValueError("moov 过大（{} 字节）: {}".format(index["moov_size"], source))
+        index["faststart"] = index["mdat_offset"] is None or index["moov_offset"] < index["mdat_offset"]
+
+        buf = reader.read(index["moov_offset"], index["moov_size"])
+        header = 16 if struct.unpack(">I", buf[:4])[0] == 1 else 8
+        duration = 0.0
+        fragmented = False
+        tracks = []
+        for box_type, p, box_end in _child_boxes(buf, header, len(buf)):
+            if box_type == b"mvhd":
+                if buf[p] == 1:
+                    timescale, mv_duration = struct.unpack(">IQ", buf[p + 20:p + 32])
+                else:
+                    timescale, mv_duration = struct.unpack(">II", buf[p + 12:p + 20])
+                duration = round(float(mv_duration) / timescale, 6) if timescale else 0.0
+            elif box_type == b"mvex":
+                fragmented = True
+            elif box_type == b"trak":
+                track, tables = _parse_track(buf, p, box_end)
+                if track.get("type") == "video" and not fragmented:
+                    track["keyframes"] = _keyframes(track, tables)
+                tracks.append(track)
+        index["fragmented"] = fragmented
+        index["duration"] = duration or max([t.get("duration", 0) for t in tracks] or [0])
+        index["tracks"] = tracks
+        return index
+    finally:
+        if own_reader:
+            reader.close()
+
+
+def _cache_path(identity, cache_dir):
+    return os.path.join(cache_dir, hashlib.sha1(identity.encode("utf-8")).hexdigest() + ".json")
+
+
+_pruned_at = {}
+_prune_lock = threading.Lock()
+
+
+def prune_cache(cache_dir=None, max_age=INDEX_CACHE_MAX_AGE):
+    """删除 cache_dir 中 max_age 秒内未用过（mtime 未刷新）的索引，返回删除的文件数。"""
+    cache_dir = cache_dir or INDEX_CACHE_DIR
+    if not os.path.isdir(cache_dir):
+        return 0
+    cutoff = time.time() - max_age
+    removed = 0
+    for name in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+                removed += 1
+        except OSError:
+            pass
+    return removed
+
+
+def _maybe_prune(cache_dir):
+    now = time.time()
+    with _prune_lock:
+        if now - _pruned_at.get(cache_dir, 0) < INDEX_PRUNE_INTERVAL:
+            return
+        _pruned_at[cache_dir] = now
+    prune_cache(cache_dir)
+
+
+def load_index(source, cache_dir=None, refresh=False, session=None):
+    """
+    读取 source 的索引，优先使用缓存。本地文件由 stat 得到来源标识，命中时不打开文件；
+    URL 需一次 Range 请求确认 ETag 与大小，未命中时沿用该读取器解析（首个 Range 响应复用，不重复请求）。
+    :param refresh: 忽略缓存重新解析
+    """
+    cache_dir = cache_dir or INDEX_CACHE_DIR
+    reader = None
+    try:
+        if _is_url(source):
+            reader = _HttpReader(source, session=session)
+            identity = reader.identity
+        else:
+            if not os.path.isfile(source):
+                raise FileNotFoundError("本地文件不存在: {}".format(source))
+            st = os.stat(source)
+            identity = "file|{}|{}|{}".format(os.path.abspath(source), st.st_mtime_ns, st.st_size)
+        path = _cache_path(identity, cache_dir)
+        if not refresh and os.path.isfile(path):
+            try:
+                with open(path, "r") as f:
+                    index = json.load(f)
+                if index.get("version") == INDEX_VERSION and index.get("identity") == identity:
+                    os.utime(path)
+                    return index
+            except (IOError, OSError, ValueError):
+                pass
+        index = build_index(source, session=session, reader=reader)
+    finally:
+        if reader is not None:
+            reader.close()
+    os.makedirs(cache_dir, exist_ok=True)
+    _maybe_prune(cache_dir)
+    tmp_path = "{}.{}.tmp".format(path, os.getpid())
+    with open(tmp_path, "w") as f:
+        json.dump(index, f)
+    os.replace(tmp_path, _cache_path(index["identity"], cache_dir))
+    return index
+
+
+def video_track(index):
+    """第一个视频轨，没有则返回 None。"""
+    for track in index.get("tracks", []):
+        if track.get("type") == "video":
+            return track
+    return None
+
+
+def keyframe_before(index, seconds):
+    """不晚于 seconds 的最近关键帧时间（秒），供切割工具对齐 -ss；无关键帧表时原样返回 seconds。"""
+    track = video_track(index)
+    rows = (track or {}).get("keyframes")
+    if not rows:
+        return seconds
+    best = rows[0][1] or 0.0
+    for _, t, _ in rows:
+        if t is None or t > seconds:
+            break
+        best = t
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MP4 轻量索引：时长、轨道、关键帧表（不调用 ffmpeg）")
+    parser.add_argument("source", help="mp4 本地路径或 URL")
+    parser.add_argument("--refresh", action="store_true", help="忽略缓存重新解析")
+    parser.add_argument("--no-cache", action="store_true", help="只解析不读写缓存")
+    parser.add_argument("--keyframes", action="store_true", help="输出完整关键帧表（默认只输出数量）")
+    args = parser.parse_args()
+
+    try:
+        if args.no_cache:
+            index = build_index(args.source)
+        else:
+            index = load_index(args.source, refresh=args.refresh)
+    except Exception as e:
+        print("错误: {}".format(e), file=sys.stderr)
+        sys.exit(1)
+    if not args.keyframes:
+        for track in index["tracks"]:
+            if track.get("keyframes") is not None:
+                track["keyframes"] = len(track["keyframes"])
+    print(json.dumps(index, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
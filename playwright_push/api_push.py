@@ -2,6 +2,7 @@
 """
 Playwright B 站投稿 POST 接口：接收 mp4 地址数组，先按 merge_mp4_ffmpeg2 逻辑合并成一个视频，
 再推送到 B 站。返回 code + data（审核状态、DedeUserID、视频名称、错误原因、耗时）。
+另提供 GET /frame/first：截取视频第一帧，直接返回 PNG/JPEG 字节（预览用，不落盘）。
 启动：python3 -m playwright_push.api_push  或  flask --app playwright_push.api_push run
 """
 from __future__ import print_function
@@ -15,7 +16,7 @@ _BASE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 if _BASE not in sys.path:
     sys.path.insert(0, _BASE)
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 
 app = Flask(__name__)
 
@@ -29,6 +30,39 @@ def _api_log(msg):
 # 接口使用的 cookie 文件：与 api_push 同目录的 cookie.json（绝对路径，避免 cwd 影响）
 _SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 _COOKIE_FILE = os.path.abspath(os.path.join(_SCRIPT_DIR, "cookie.json"))
+# 截帧脚本所在目录（非包，按脚本目录导入）
+_FIRST_FRAME_DIR = os.path.join(_BASE, "cut_video_first_frame")
+_IMAGE_MIMETYPES = {"png": "image/png", "jpg": "image/jpeg"}
+# /frame/first 允许读取的本地目录（逗号分隔，默认项目 tmp/，即合并结果所在目录）；其余本地路径一律拒绝
+FRAME_MEDIA_DIRS = [
+    os.path.realpath(d.strip())
+    for d in os.environ.get("FRAME_MEDIA_DIRS", os.path.join(_BASE, "tmp")).split(",")
+    if d.strip()
+]
+
+
+def _check_frame_src(src):
+    """
+    校验 /frame/first 的 src，返回 (交给截帧的 src, 不合法原因)；合法时原因为 None。
+    - URL 只允许 http(s)，且主机解析出的地址均不能是内网、回环、链路本地等非公网地址（防 SSRF）；
+      这里只做入口快速校验，截帧时 public_only 模式还会逐跳校验重定向并直连校验过的 IP
+    - 本地路径必须位于 FRAME_MEDIA_DIRS 之内（realpath 比较，防 ../ 与软链接越界），
+      交给 ffmpeg 的是 realpath 绝对路径，避免 "concat:" 等协议前缀被当作输入协议
+    """
+    if "://" in src:
+        if _FIRST_FRAME_DIR not in sys.path:
+            sys.path.insert(0, _FIRST_FRAME_DIR)
+        import url_guard
+        try:
+            url_guard.resolve_public(src)
+        except url_guard.UnsafeURLError as e:
+            return src, str(e)
+        return src, None
+    path = os.path.realpath(src)
+    for root in FRAME_MEDIA_DIRS:
+        if path == root or path.startswith(root + os.sep):
+            return path, None
+    return src, "本地路径不在允许的目录内"
 
 
 def _run_upload(video_path, title, gindex, guid, version=None):
@@ -168,6 +202,44 @@ def push_playwright_bilibili():
     return jsonify({"code": -200, "data": [data_item]}), 200
 
 
+@app.route("/frame/first", methods=["GET"])
+def first_frame():
+    """
+    截取视频第一帧，直接返回图片字节。
+    查询参数:
+      src: 视频 http(s) URL（公网地址）或 FRAME_MEDIA_DIRS 内的本地路径（必填）
+      format: png | jpg，默认 png
+      width, height: 可选，输出尺寸；只给一边时按比例缩放
+    成功：HTTP 200，Content-Type 为 image/png 或 image/jpeg
+    失败：HTTP 200，JSON {"code": -100, "data": null, "msg": ...}
+    """
+    src = (request.args.get("src") or "").strip()
+    if not src:
+        return jsonify({"code": -100, "data": None, "msg": "缺少参数 src（视频路径或 URL）"}), 200
+    src, reason = _check_frame_src(src)
+    if reason:
+        _api_log("截帧请求被拒绝 code=-100: {} ({})".format(reason, src[:120]))
+        return jsonify({"code": -100, "data": None, "msg": reason}), 200
+    ext = "jpg" if (request.args.get("format") or "png").lower() in ("jpg", "jpeg") else "png"
+    try:
+        width = int(request.args["width"]) if request.args.get("width") else None
+        height = int(request.args["height"]) if request.args.get("height") else None
+    except ValueError:
+        return jsonify({"code": -100, "data": None, "msg": "width/height 须为整数"}), 200
+
+    start = time.time()
+    try:
+        if _FIRST_FRAME_DIR not in sys.path:
+            sys.path.insert(0, _FIRST_FRAME_DIR)
+        from first_frame_ffmpeg import capture_first_frame_bytes
+        data = capture_first_frame_bytes(src, format=ext, width=width, height=height, public_only=True)
+    except Exception as e:
+        _api_log("截帧失败 code=-100，耗时 {:.2f} 秒: {}".format(time.time() - start, e))
+        return jsonify({"code": -100, "data": None, "msg": "截帧失败: {}".format(e)}), 200
+    _api_log("截帧完成，耗时 {:.2f} 秒，{} 字节: {}".format(time.time() - start, len(data), src[:120]))
+    return Response(data, mimetype=_IMAGE_MIMETYPES[ext])
+
+
 if __name__ == "__main__":
     COOKIE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cookie.json")
     print("cookie_file: {}".format(COOKIE_FILE))
@@ -5,7 +5,14 @@
 """
 from __future__ import absolute_import
 
+import threading
+
 _REGISTRY = {}
+# 池化实例：(平台名, 凭据键) -> 推送客户端，供多次推送/多线程复用
+_POOL = {}
+_POOL_LOCK = threading.Lock()
+# 每个池键一把构造锁：构造（含网络登录校验）在全局锁外进行，同一凭据只构造一次，不同凭据互不阻塞
+_KEY_LOCKS = {}
 
 def register(name):
     """装饰器：将推送实现注册到 REGISTRY。"""
@@ -15,16 +22,51 @@ def register(name):
     return _wrap
 
 
-def get_pusher(name, **kwargs):
+def get_pusher(name, pooled=False, **kwargs):
     """
     根据平台名获取推送客户端。
     :param name: 平台标识，如 'bilibili'
+    :param pooled: True 时按凭据复用已创建的实例（连接池、登录校验缓存随之复用），可跨线程共享；
+        构造后未登录成功的实例不放入池，登录校验失败的实例会被移出池（见 evict）
     :param kwargs: 传给该平台构造函数的参数（如 cookie_path、config 等）
     :return: 该平台的 PusherBase 实例
     """
     if name not in _REGISTRY:
         raise ValueError("未知推送平台: {}，可选: {}".format(name, list(_REGISTRY.keys())))
-    return _REGISTRY[name](**kwargs)
+    cls = _REGISTRY[name]
+    if not pooled:
+        return cls(**kwargs)
+    key = (name, cls.pool_key(**kwargs))
+    with _POOL_LOCK:
+        pusher = _POOL.get(key)
+        if pusher is not None:
+            return pusher
+        key_lock = _KEY_LOCKS.setdefault(key, threading.Lock())
+    with key_lock:
+        with _POOL_LOCK:
+            pusher = _POOL.get(key)
+        if pusher is not None:
+            return pusher
+        pusher = cls(**kwargs)
+        if pusher.is_logged_in():
+            with _POOL_LOCK:
+                _POOL[key] = pusher
+    return pusher
+
+
+def evict(pusher):
+    """把 pusher 移出池（如登录校验失败），之后 get_pusher(pooled=True) 会新建实例。"""
+    with _POOL_LOCK:
+        for key in [k for k, v in _POOL.items() if v is pusher]:
+            del _POOL[key]
+
+
+def clear_pool(name=None):
+    """清空池化实例；传 name 则只清该平台。"""
+    with _POOL_LOCK:
+        for key in list(_POOL.keys()):
+            if name is None or key[0] == name:
+                del _POOL[key]
 
 
 def list_platforms():
@@ -8,6 +8,13 @@ from __future__ import absolute_import
 class PusherBase(object):
     """推送基类，各平台需实现 login / is_logged_in / upload。"""
 
+    @classmethod
+    def pool_key(cls, **kwargs):
+        """
+        get_pusher(pooled=True) 复用实例时的键，默认按构造参数区分；平台可覆盖为按凭据区分。
+        """
+        return repr(sorted(kwargs.items()))
+
     def login(self, **kwargs):
         """
         执行登录（Cookie、扫码、密码等由各平台实现）。
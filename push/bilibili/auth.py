@@ -90,15 +90,16 @@ def cookie_string_from_dict(cookie_dict):
     return "; ".join("{}={}".format(k, v) for k, v in cookie_dict.items() if v)
 
 
-def check_cookie_valid(cookie_dict):
+def check_cookie_valid(cookie_dict, session=None):
     """
     用 /x/web-interface/nav 检查 Cookie 是否有效。
+    :param session: 可选 requests.Session，传入则复用其连接（keep-alive）
     :return: (bool 是否有效, dict 或 None 用户信息)
     """
     _ensure_requests()
     if not cookie_dict or not cookie_dict.get("SESSDATA"):
         return False, None
-    r = requests.get(
+    r = (session or requests).get(
         NAV_URL,
         cookies=cookie_dict,
         headers={
@@ -116,12 +117,13 @@ def check_cookie_valid(cookie_dict):
         return False, None
 
 
-def login_with_cookie(cookie_dict):
+def login_with_cookie(cookie_dict, session=None):
     """
     使用已有 Cookie 字典完成“登录”（仅校验并提取 csrf/mid）。
+    :param session: 可选 requests.Session，校验请求复用其连接
     :return: (cookie_dict, csrf, mid) 或 (None, None, None) 表示失败
     """
-    ok, user = check_cookie_valid(cookie_dict)
+    ok, user = check_cookie_valid(cookie_dict, session=session)
     if not ok:
         return None, None, None
     csrf = cookie_dict.get("bili_jct") or ""
@@ -254,7 +256,7 @@ def login_with_qrcode(session, save_cookie_path=None, qrcode_image_path=None):
                     except Exception as e:
                         print("保存登录信息失败: {}".format(e))
                 
-                cookie_dict_ret, csrf, mid = login_with_cookie(cookie_dict)
+                cookie_dict_ret, csrf, mid = login_with_cookie(cookie_dict, session=session)
                 return cookie_dict_ret, csrf, mid, access_token
             if code == 86038:
                 print("二维码已过期，请重试。")
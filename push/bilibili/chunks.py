@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+"""
+分片数据源：按区间 mmap 文件，以 memoryview 切片直接作为 HTTP 请求体。
+每个分片不再 f.read() 出一份 bytes，在传分片再多，进程内存也基本不随之增长（数据走页缓存）。
+GrowingFile 描述仍在写入的文件，供边写边传时等待数据就绪。
+"""
+from __future__ import absolute_import
+
+import io
+import mmap
+import threading
+
+
+class FileSlice(object):
+    """
+    文件中 [start, start + length) 区间的只读请求体。
+    仅映射该区间（起点按 mmap.ALLOCATIONGRANULARITY 向下对齐），read() 返回 memoryview 切片，不复制数据。
+    实现 read / tell / seek / __len__：requests 据此设置 Content-Length，并由 urllib3 分块读取发送。
+    """
+
+    def __init__(self, fileobj, start, length):
+        self.length = length
+        self._pos = 0
+        self._map = None
+        self._view = memoryview(b"")
+        if length > 0:
+            aligned = start - start % mmap.ALLOCATIONGRANULARITY
+            self._map = mmap.mmap(
+                fileobj.fileno(), start - aligned + length, access=mmap.ACCESS_READ, offset=aligned
+            )
+            self._view = memoryview(self._map)[start - aligned:]
+
+    def __len__(self):
+        return self.length
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = self.length - self._pos
+        chunk = self._view[self._pos:self._pos + size]
+        self._pos += len(chunk)
+        return chunk
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence == io.SEEK_END:
+            offset += self.length
+        self._pos = max(0, min(offset, self.length))
+        return self._pos
+
+    def close(self):
+        self._view.release()
+        if self._map is not None:
+            try:
+                self._map.close()
+            except BufferError:
+                # 仍有切片未释放（如请求库持有引用），交给 GC 回收映射
+                pass
+            self._map = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ChunkSource(object):
+    """
+    整个文件的分片提供者：共享一个只读文件句柄，slice() 返回按区间 mmap 的 FileSlice。
+    多个线程可同时对同一 ChunkSource 取不同区间。
+    """
+
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self._f = open(filepath, "rb")
+
+    def slice(self, start, length):
+        return FileSlice(self._f, start, length)
+
+    def close(self):
+        self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class GrowingFile(object):
+    """
+    正在被顺序写入（仅追加）的文件，用于边写边传。
+    生产者每写出一段调用 advance(nbytes)，结束时调用 finish(error=None)；
+    上传方 wait_for(end) 阻塞到前 end 字节已写出或写入结束，返回当前已写出的字节数。
+    """
+
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self.size = 0
+        self.done = False
+        self.error = None
+        self._cond = threading.Condition()
+
+    def advance(self, nbytes):
+        with self._cond:
+            self.size += nbytes
+            self._cond.notify_all()
+
+    def finish(self, error=None):
+        with self._cond:
+            self.done = True
+            self.error = error
+            self._cond.notify_all()
+
+    def wait_for(self, end):
+        with self._cond:
+            while self.size < end and not self.done:
+                self._cond.wait()
+            if self.error is not None:
+                raise RuntimeError("文件写入失败，停止上传: {}".format(self.error))
+            return self.size
@@ -4,35 +4,56 @@ B 站推送客户端：组合登录与上传，实现 PusherBase。
 """
 from __future__ import absolute_import
 
+import hashlib
 import os
+import threading
+import time
 from pathlib import Path
 
 try:
     import requests
+    from requests.adapters import HTTPAdapter
 except ImportError:
     requests = None
 
 from ..base import PusherBase
 from . import auth
+from . import journal as upload_journal
 from . import upload
 
 
 # 默认 Cookie 路径（与  习惯一致可用 cookie.json）
 DEFAULT_COOKIE_PATH = "cookie.json"
+# 登录状态校验结果缓存时长（秒），期间 is_logged_in 不再请求 nav 接口
+LOGIN_CHECK_TTL = 300
+# 每个 host 保持的 keep-alive 连接数上限（member.bilibili.com、upos 节点等）
+HTTP_POOL_MAXSIZE = 16
+
+
+def _build_session():
+    """新建带连接池的 requests.Session，同一 host 的请求复用 keep-alive 连接。"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=8, pool_maxsize=HTTP_POOL_MAXSIZE)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
 
 
 class BilibiliPusher(PusherBase):
     """
     B 站投稿推送。支持 Cookie 文件登录、扫码登录；上传单 P 视频并提交稿件。
+    实例可被多线程共享（见 push.get_pusher(..., pooled=True)）：登录校验结果按 TTL 缓存，
+    上传时不修改 Session 的公共请求头。
     """
 
-    def __init__(self, cookie_path=None, cookie_dict=None, session=None):
+    def __init__(self, cookie_path=None, cookie_dict=None, session=None, login_check_ttl=None):
         """
         :param cookie_path: Cookie 文件路径（JSON 或 Netscape 格式），默认当前目录 cookie.json
         :param cookie_dict: 直接传入 Cookie 字典，若提供则优先于 cookie_path
-        :param session: 可传入已有 requests.Session，否则新建
+        :param session: 可传入已有 requests.Session，否则新建（带 keep-alive 连接池）
+        :param login_check_ttl: 登录校验缓存秒数，默认 LOGIN_CHECK_TTL；0 表示每次都校验
         """
-        self._session = session or (requests.Session() if requests else None)
+        self._session = session or (_build_session() if requests else None)
         # B 站请求直连，不走环境变量代理，避免 ProxyError（代理断开等）
         if self._session is not None:
             self._session.trust_env = False
@@ -43,22 +64,45 @@ class BilibiliPusher(PusherBase):
         self._mid = None
         self._logged_in = False
         self._access_token = None  #  格式 cookie 中的 token_info.access_token，有则用 APP 投稿
+        self._login_check_ttl = LOGIN_CHECK_TTL if login_check_ttl is None else login_check_ttl
+        self._login_checked_at = 0.0
+        self._lock = threading.RLock()
 
         if self._cookie_dict:
-            self._cookie_dict, self._csrf, self._mid = auth.login_with_cookie(self._cookie_dict)
+            self._cookie_dict, self._csrf, self._mid = auth.login_with_cookie(self._cookie_dict, session=self._session)
             if self._cookie_dict:
                 self._apply_cookie()
-                self._logged_in = True
+                self._mark_logged_in()
         elif self._cookie_path and os.path.isfile(self._cookie_path):
             loaded, token_info = auth.load_cookie_from_file(self._cookie_path)
             if loaded:
-                self._cookie_dict, self._csrf, self._mid = auth.login_with_cookie(loaded)
+                self._cookie_dict, self._csrf, self._mid = auth.login_with_cookie(loaded, session=self._session)
                 if self._cookie_dict:
                     self._apply_cookie()
-                    self._logged_in = True
+                    self._mark_logged_in()
                 if token_info and token_info.get("access_token"):
                     self._access_token = token_info.get("access_token")
 
+    @classmethod
+    def pool_key(cls, cookie_path=None, cookie_dict=None, **kwargs):
+        """
+        池化复用的键：按凭据区分。Cookie 字典按 DedeUserID + SESSDATA 的 sha256（池里不留明文凭据），
+        Cookie 文件按绝对路径 + 修改时间，文件更新后自动换新实例。
+        """
+        if cookie_dict:
+            raw = "{}\n{}".format(cookie_dict.get("DedeUserID") or "", cookie_dict.get("SESSDATA") or "")
+            return ("cookie", hashlib.sha256(raw.encode("utf-8")).hexdigest())
+        path = os.path.abspath(cookie_path or DEFAULT_COOKIE_PATH)
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            mtime = None
+        return ("file", path, mtime)
+
+    def _mark_logged_in(self):
+        self._logged_in = True
+        self._login_checked_at = time.time()
+
     def _apply_cookie(self):
         if not self._session or not self._cookie_dict:
             return
@@ -79,35 +123,48 @@ class BilibiliPusher(PusherBase):
         :param save_cookie_path: 扫码登录成功后保存 Cookie 的路径
         :return: True 成功
         """
-        if self.is_logged_in():
-            return True
-        if use_qrcode and self._session:
-            path = save_cookie_path or self._cookie_path
-            # 扫码时在 push/tmp 下生成二维码图片，便于用手机扫描
-            push_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-            qr_tmp_dir = os.path.join(push_dir, "tmp")
-            if not os.path.isdir(qr_tmp_dir):
-                os.makedirs(qr_tmp_dir)
-            qrcode_image_path = os.path.join(qr_tmp_dir, "bilibili_qrcode.png")
-            self._cookie_dict, self._csrf, self._mid, self._access_token = auth.login_with_qrcode(
-                self._session, save_cookie_path=path, qrcode_image_path=qrcode_image_path
-            )
-            if self._cookie_dict:
-                self._apply_cookie()
-                self._logged_in = True
+        with self._lock:
+            if self.is_logged_in():
                 return True
-        return False
-
-    def is_logged_in(self):
-        if not self._logged_in or not self._cookie_dict:
-            return False
-        ok, _ = auth.check_cookie_valid(self._cookie_dict)
-        if not ok:
-            self._logged_in = False
+            if use_qrcode and self._session:
+                path = save_cookie_path or self._cookie_path
+                # 扫码时在 push/tmp 下生成二维码图片，便于用手机扫描
+                push_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+                qr_tmp_dir = os.path.join(push_dir, "tmp")
+                if not os.path.isdir(qr_tmp_dir):
+                    os.makedirs(qr_tmp_dir)
+                qrcode_image_path = os.path.join(qr_tmp_dir, "bilibili_qrcode.png")
+                self._cookie_dict, self._csrf, self._mid, self._access_token = auth.login_with_qrcode(
+                    self._session, save_cookie_path=path, qrcode_image_path=qrcode_image_path
+                )
+                if self._cookie_dict:
+                    self._apply_cookie()
+                    self._mark_logged_in()
+                    return True
             return False
-        return True
 
-    def upload(self, video_path, title, desc="", tid=21, tag=None, source="", cover="", no_reprint=True, dynamic="", dtime=None, **kwargs):
+    def is_logged_in(self, force=False):
+        """
+        检查登录状态。最近一次校验在 TTL 内时直接返回缓存结果，不再请求 nav 接口。
+        未登录（构造时登录失败）或校验失败时把本实例移出 get_pusher 的池，失效凭据不再被复用。
+        :param force: True 时忽略缓存强制校验
+        """
+        from .. import evict
+        with self._lock:
+            if not self._logged_in or not self._cookie_dict:
+                evict(self)
+                return False
+            if not force and time.time() - self._login_checked_at < self._login_check_ttl:
+                return True
+            ok, _ = auth.check_cookie_valid(self._cookie_dict, session=self._session)
+            if not ok:
+                self._logged_in = False
+                evict(self)
+                return False
+            self._login_checked_at = time.time()
+            return True
+
+    def upload(self, video_path, title, desc="", tid=21, tag=None, source="", cover="", no_reprint=True, dynamic="", dtime=None, concurrency=None, resume=True, growing=None, size_hint=None, **kwargs):
         """
         上传单个视频并提交稿件。
         :param video_path: 本地 mp4 路径
@@ -120,7 +177,13 @@ class BilibiliPusher(PusherBase):
         :param no_reprint: 禁止转载
         :param dynamic: 粉丝动态
         :param dtime: 定时发布时间戳（10 位）
-        :return: 投稿结果 dict，含 code、data（如 aid、bvid）等
+        :param concurrency: 分片上传初始并发数（默认 upload.UPLOAD_CONCURRENCY，运行中按吞吐自适应）
+        :param resume: 是否启用续传日志（journal.py）：失败后重试只补传缺失分片，投稿成功后删除日志
+        :param growing: 可选 chunks.GrowingFile：video_path 仍在写入（如分片 MP4 合并中）时边写边传，
+            preupload 使用 size_hint 预估大小，complete 与投稿在写入结束后进行；此模式不续传
+        :param size_hint: growing 模式下的预估文件大小（字节）
+        :return: 投稿结果 dict，含 code、data（如 aid、bvid）等；另附 upload_stats（本次各阶段耗时，见下）
+            upload_seconds 上传阶段耗时，submit_attempts / submit_wait / submit_seconds 投稿请求次数、等待就绪耗时与投稿阶段耗时
         """
         if not self._session:
             raise RuntimeError("需要 requests: pip install requests")
@@ -137,25 +200,27 @@ class BilibiliPusher(PusherBase):
             tag = [t.strip() for t in tag.split(",") if t.strip()]
         tag_str = ",".join(tag[:12])  # B 站最多约 12 个标签
 
-        # 1. preupload（兼容服务端返回 snake_case / camelCase）
-        pre = upload.preupload(self._session, video_path)
-        endpoint = pre.get("endpoint") or pre.get("endpoint")
-        upos_uri = pre.get("upos_uri") or pre.get("uposUri")
-        auth_header = pre.get("auth")
-        biz_id = pre.get("biz_id") or pre.get("bizId")
-        chunk_size = pre.get("chunk_size") or pre.get("chunkSize") or 4194304
-        if not all([endpoint, upos_uri, auth_header, biz_id is not None]):
-            raise RuntimeError("preupload 返回缺少必要字段: {}".format(list(pre.keys())))
-        filename = os.path.basename(video_path)
-
-        # 2. init multipart
-        upload_id = upload.init_multipart(self._session, endpoint, upos_uri, auth_header)
-
-        # 3. upload chunks + complete（返回 complete 响应，用于提交时的 filename）
-        complete_resp = upload.upload_chunks(
-            self._session, endpoint, upos_uri, upload_id, video_path,
-            chunk_size, biz_id, filename,
-        )
+        # 1~3. preupload -> init multipart -> 分片上传 + complete；有续传日志时跳过已完成的步骤
+        journal = upload_journal.UploadJournal.for_file(video_path) if resume and growing is None else None
+        state = journal.load() if journal is not None else None
+        resumed = state is not None
+        if resumed:
+            print("[DEBUG] 发现续传日志: {}".format(journal.path))
+        else:
+            state = self._begin_upload(video_path, journal, filesize=size_hint if growing is not None else None)
+        stats = {}
+        upload_started = time.time()
+        try:
+            complete_resp = self._upload_parts(video_path, state, journal, concurrency, growing=growing)
+        except upload.UposSessionError as e:
+            if not resumed:
+                raise
+            print("[DEBUG] 续传会话已失效（{}），重新上传".format(e))
+            journal.discard()
+            state = self._begin_upload(video_path, journal)
+            complete_resp = self._upload_parts(video_path, state, journal, concurrency)
+        stats["upload_seconds"] = round(time.time() - upload_started, 3)
+        upos_uri = state["upos_uri"]
 
         # 4. videos 格式：filename 与  一致，取 upos_uri 路径的 file_stem（最后一段无扩展名）
         path_part = upos_uri.split("?")[0].replace("upos://", "")
@@ -174,12 +239,60 @@ class BilibiliPusher(PusherBase):
             result = upload.submit_add_by_app(
                 self._session, self._access_token,
                 videos, title, tid, tag_str, desc,
-                source=source, cover=cover, no_reprint=no_reprint, dynamic=dynamic, dtime=dtime,
+                source=source, cover=cover, no_reprint=no_reprint, dynamic=dynamic, dtime=dtime, stats=stats,
             )
         else:
             result = upload.submit_add(
                 self._session, self._csrf,
                 videos, title, tid, tag_str, desc,
-                source=source, cover=cover, no_reprint=no_reprint, dynamic=dynamic, dtime=dtime,
+                source=source, cover=cover, no_reprint=no_reprint, dynamic=dynamic, dtime=dtime, stats=stats,
             )
+        if journal is not None:
+            journal.discard()
+        print("[DEBUG] 投稿耗时: 上传 {}s，投稿 {}s（其中等待就绪 {}s，请求 {} 次）".format(
+            stats.get("upload_seconds"), stats.get("submit_seconds"), stats.get("submit_wait"), stats.get("submit_attempts")
+        ))
+        result["upload_stats"] = stats
         return result
+
+    def _begin_upload(self, video_path, journal=None, filesize=None):
+        """
+        preupload + init multipart，返回上传会话字段；传入 journal 时同时写入续传日志。
+        :param filesize: 上报的文件大小，不传取实际大小（边写边传时传预估值）
+        :return: dict 含 endpoint, upos_uri, auth, biz_id, chunk_size, upload_id, filesize
+        """
+        if filesize is None:
+            filesize = os.path.getsize(video_path)
+        # preupload（兼容服务端返回 snake_case / camelCase）
+        pre = upload.preupload(self._session, video_path, filesize=filesize)
+        endpoint = pre.get("endpoint") or pre.get("endpoint")
+        upos_uri = pre.get("upos_uri") or pre.get("uposUri")
+        auth_header = pre.get("auth")
+        biz_id = pre.get("biz_id") or pre.get("bizId")
+        chunk_size = pre.get("chunk_size") or pre.get("chunkSize") or 4194304
+        if not all([endpoint, upos_uri, auth_header, biz_id is not None]):
+            raise RuntimeError("preupload 返回缺少必要字段: {}".format(list(pre.keys())))
+
+        upload_id = upload.init_multipart(self._session, endpoint, upos_uri, auth_header)
+        state = {
+            "endpoint": endpoint,
+            "upos_uri": upos_uri,
+            "auth": auth_header,
+            "biz_id": biz_id,
+            "chunk_size": chunk_size,
+            "upload_id": upload_id,
+            "filesize": filesize,
+            "line": pre.get("line"),
+        }
+        if journal is not None:
+            journal.start(state)
+        return state
+
+    def _upload_parts(self, video_path, state, journal, concurrency, growing=None):
+        """按会话字段分片上传并 complete，返回 complete 响应（用于提交时的 filename）。"""
+        return upload.upload_chunks(
+            self._session, state["endpoint"], state["upos_uri"], state["upload_id"], video_path,
+            state["chunk_size"], state["biz_id"], os.path.basename(video_path),
+            auth=state["auth"], concurrency=concurrency, journal=journal, line=state.get("line"),
+            growing=growing, size_hint=state["filesize"],
+        )
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+"""
+分片上传续传日志：记录 upos 上传会话（endpoint、upos_uri、upload_id、auth 等）与已完成分片的 ETag。
+按文件指纹存放在 push/tmp/upload_journal/<指纹>.json，失败重试或重新运行时只补传缺失分片；
+分片齐全则直接 complete，complete 已成功则直接提交稿件。
+- 指纹只读文件头尾（大小 + 头尾各 FINGERPRINT_BLOCK 字节的 sha1），首次上传不必读完整个文件
+- 日志记录文件的 (realpath, mtime_ns, 大小)，并在上传的同时于后台计算全量 sha1 写入日志；
+  续传时前者一致即可沿用，不一致（如同一列表重新合并的文件）时才读全文件比对 sha1
+- 日志含 upos 的 auth，文件权限为 0600（目录 0700）
+"""
+from __future__ import absolute_import
+
+import hashlib
+import json
+import os
+import threading
+import time
+
+_PUSH_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+JOURNAL_DIR = os.path.join(_PUSH_DIR, "tmp", "upload_journal")
+# upos 上传会话的有效期有限，超过该时长（秒）的日志视为失效，重新 preupload
+JOURNAL_TTL = 24 * 3600
+# 文件指纹采样的头尾字节数；全量 sha1 的读块大小
+FINGERPRINT_BLOCK = 4 * 1024 * 1024
+HASH_READ_BLOCK = 4 * 1024 * 1024
+
+
+def file_fingerprint(filepath):
+    """
+    计算文件指纹（大小 + 头尾各 FINGERPRINT_BLOCK 字节的 sha1 十六进制），只用于定位日志。
+    内容相同的文件（如同一列表重新合并的结果）得到相同指纹；采样区域以外的差异由续传时的全量校验发现（见 UploadJournal.load）。
+    """
+    size = os.path.getsize(filepath)
+    h = hashlib.sha1(str(size).encode("utf-8"))
+    with open(filepath, "rb") as f:
+        h.update(f.read(FINGERPRINT_BLOCK))
+        if size > FINGERPRINT_BLOCK:
+            f.seek(max(FINGERPRINT_BLOCK, size - FINGERPRINT_BLOCK))
+            h.update(f.read(FINGERPRINT_BLOCK))
+    return h.hexdigest()
+
+
+def file_sha1(filepath):
+    """全量内容的 sha1 十六进制。"""
+    h = hashlib.sha1()
+    with open(filepath, "rb") as f:
+        for block in iter(lambda: f.read(HASH_READ_BLOCK), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _file_stat(filepath):
+    path = os.path.realpath(filepath)
+    st = os.stat(path)
+    return [path, st.st_mtime_ns, st.st_size]
+
+
+class UploadJournal(object):
+    """
+    单个文件的续传日志。字段：
+      endpoint, upos_uri, auth, biz_id, chunk_size, upload_id, filesize, created_at,
+      file: [realpath, mtime_ns, 大小], sha1: 全量内容 sha1（后台算完才有），
+      parts: {分片序号(str): etag}, complete: complete 接口响应（成功后才有）
+    分片完成可由多个上传线程并发记录，写盘采用临时文件 + os.replace 原子替换。
+    """
+
+    def __init__(self, path, filepath=None):
+        self.path = path
+        self.filepath = filepath
+        self.data = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def for_file(cls, filepath, journal_dir=None):
+        """按文件指纹定位日志文件（不读取内容，需再调用 load）。"""
+        journal_dir = journal_dir or JOURNAL_DIR
+        return cls(os.path.join(journal_dir, file_fingerprint(filepath) + ".json"), filepath)
+
+    def _same_file(self, data):
+        """日志是否属于当前文件：(realpath, mtime_ns, 大小) 一致，或全量 sha1 一致。"""
+        if self.filepath is None:
+            return True
+        if data.get("file") == _file_stat(self.filepath):
+            return True
+        return bool(data.get("sha1")) and file_sha1(self.filepath) == data["sha1"]
+
+    def load(self):
+        """
+        读取日志。不存在、损坏、超过 JOURNAL_TTL 或不属于当前文件（见 _same_file）时返回 None 并删除日志。
+        :return: 日志 dict 或 None
+        """
+        if not os.path.isfile(self.path):
+            return None
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+        except (IOError, OSError, ValueError):
+            self.discard()
+            return None
+        if not data.get("upload_id") or time.time() - data.get("created_at", 0) > JOURNAL_TTL:
+            self.discard()
+            return None
+        if not self._same_file(data):
+            print("[DEBUG] 续传日志与文件内容不一致，重新上传: {}".format(self.path))
+            self.discard()
+            return None
+        data.setdefault("parts", {})
+        self.data = data
+        return data
+
+    def start(self, session_fields):
+        """记录一次新的上传会话（覆盖旧日志），并在后台线程计算文件全量 sha1 供以后续传校验。"""
+        with self._lock:
+            self.data = dict(session_fields)
+            self.data["parts"] = {}
+            self.data["created_at"] = time.time()
+            if self.filepath is not None:
+                self.data["file"] = _file_stat(self.filepath)
+            self._save()
+        if self.filepath is not None:
+            t = threading.Thread(target=self._record_sha1, args=(self.data["upload_id"],))
+            t.daemon = True
+            t.start()
+
+    def _record_sha1(self, upload_id):
+        try:
+            digest = file_sha1(self.filepath)
+        except (IOError, OSError):
+            return
+        with self._lock:
+            # 期间已投稿成功（日志已删）或开始了新会话则不写
+            if self.data.get("upload_id") == upload_id:
+                self.data["sha1"] = digest
+                self._save()
+
+    def completed_parts(self):
+        """已完成分片 {分片序号(int): etag}。"""
+        with self._lock:
+            return dict((int(k), v) for k, v in self.data.get("parts", {}).items())
+
+    def record_part(self, part_number, etag):
+        with self._lock:
+            self.data.setdefault("parts", {})[str(part_number)] = etag
+            self._save()
+
+    def record_complete(self, complete_resp):
+        with self._lock:
+            self.data["complete"] = complete_resp
+            self._save()
+
+    def discard(self):
+        """删除日志文件（投稿成功或会话失效后调用）。"""
+        with self._lock:
+            self.data = {}
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+
+    def _save(self):
+        parent = os.path.dirname(self.path)
+        if parent and not os.path.isdir(parent):
+            os.makedirs(parent, mode=0o700, exist_ok=True)
+        tmp_path = "{}.{}.tmp".format(self.path, threading.get_ident())
+        # 日志含 upos auth，只允许属主读写
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w") as f:
+            json.dump(self.data, f)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""
+上传线路选择：并发测量各候选线路的 RTT 与小块上传吞吐，按吞吐排序并缓存（TTL）。
+preupload 按排序结果依次尝试；上传过程中若某线路的实测分片吞吐明显下降，则作废缓存，下次 preupload 重新测速。
+"""
+from __future__ import absolute_import
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# 线路探测接口：返回 lines 列表，每项含 query（preupload 查询串）与 probe_url（测速地址）
+LINE_PROBE_URL = "https://member.bilibili.com/preupload?r=probe"
+# 测速结果缓存时长（秒）
+LINE_CACHE_TTL = 1800
+# 每条线路上传测速的数据量与超时
+PROBE_SAMPLE_BYTES = 256 * 1024
+PROBE_TIMEOUT = 10
+# 分片吞吐的指数平均低于该线路峰值的此比例时重新测速（至少观测 REPROBE_MIN_SAMPLES 个分片后）
+REPROBE_RATIO = 0.5
+REPROBE_MIN_SAMPLES = 4
+_EWMA_ALPHA = 0.3
+
+
+def _fetch_candidates(session, default_lines):
+    """从探测接口获取候选线路 [(query, probe_url)]；接口不可用时退回 default_lines（无测速地址）。"""
+    candidates = []
+    try:
+        r = session.get(LINE_PROBE_URL, timeout=PROBE_TIMEOUT)
+        r.raise_for_status()
+        for item in r.json().get("lines") or []:
+            if isinstance(item, dict) and item.get("query"):
+                candidates.append((item["query"], item.get("probe_url")))
+    except Exception as e:
+        print("[DEBUG] 线路探测接口不可用，按默认顺序: {}".format(e))
+    known = set(q for q, _ in candidates)
+    candidates.extend((line, None) for line in default_lines if line not in known)
+    return candidates
+
+
+def _measure(session, probe_url):
+    """
+    测量单条线路：先 GET 一次得到 RTT，再 PUT PROBE_SAMPLE_BYTES 字节得到上传吞吐。
+    :return: (rtt 秒, 吞吐 字节/秒)；失败返回 (None, 0)
+    """
+    if not probe_url:
+        return None, 0
+    url = "https:" + probe_url if probe_url.startswith("//") else probe_url
+    try:
+        t0 = time.time()
+        session.get(url, timeout=PROBE_TIMEOUT)
+        rtt = time.time() - t0
+        t0 = time.time()
+        session.put(url, data=bytes(PROBE_SAMPLE_BYTES), timeout=PROBE_TIMEOUT)
+        return rtt, PROBE_SAMPLE_BYTES / max(time.time() - t0, 1e-6)
+    except Exception:
+        return None, 0
+
+
+class LineSelector(object):
+    """线路测速与缓存，可被多个上传线程共享。"""
+
+    def __init__(self, ttl=None):
+        self._ttl = LINE_CACHE_TTL if ttl is None else ttl
+        self._lock = threading.Lock()
+        self._ranked = None
+        self._expires_at = 0.0
+        self._stats = {}  # line -> {"ewma", "peak", "samples"}
+
+    def ranked_lines(self, session, default_lines):
+        """返回按实测吞吐从高到低排序的线路 query 列表（缓存有效时直接返回）。"""
+        with self._lock:
+            if self._ranked and time.time() < self._expires_at:
+                return list(self._ranked)
+        ranked = self.probe(session, default_lines)
+        with self._lock:
+            self._ranked = ranked
+            self._expires_at = time.time() + self._ttl
+            self._stats = {}
+        return list(ranked)
+
+    def probe(self, session, default_lines):
+        """并发测速所有候选线路，按吞吐降序（同吞吐按 RTT 升序）排序；未测速的线路保持原顺序排在最后。"""
+        candidates = _fetch_candidates(session, default_lines)
+        with ThreadPoolExecutor(max_workers=max(1, len(candidates))) as executor:
+            results = list(executor.map(lambda c: _measure(session, c[1]), candidates))
+        measured = []
+        for order, ((line, _), (rtt, rate)) in enumerate(zip(candidates, results)):
+            measured.append((-rate, rtt if rtt is not None else float("inf"), order, line))
+            if rtt is not None:
+                print("[DEBUG] 线路测速 {}: RTT {:.0f} ms，上传 {:.2f} MB/s".format(
+                    line, rtt * 1000, rate / 1048576.0
+                ))
+        measured.sort()
+        return [m[3] for m in measured]
+
+    def invalidate(self):
+        with self._lock:
+            self._ranked = None
+            self._expires_at = 0.0
+
+    def observe(self, line, bytes_per_sec):
+        """记录某线路一个分片的实测吞吐；指数平均跌破峰值的 REPROBE_RATIO 时作废缓存。"""
+        if not line or bytes_per_sec <= 0:
+            return
+        with self._lock:
+            st = self._stats.setdefault(line, {"ewma": bytes_per_sec, "peak": 0.0, "samples": 0})
+            st["ewma"] = _EWMA_ALPHA * bytes_per_sec + (1 - _EWMA_ALPHA) * st["ewma"]
+            st["peak"] = max(st["peak"], st["ewma"])
+            st["samples"] += 1
+            dropped = st["samples"] >= REPROBE_MIN_SAMPLES and st["ewma"] < st["peak"] * REPROBE_RATIO
+            if dropped and self._ranked:
+                print("[DEBUG] 线路 {} 吞吐下降至 {:.2f} MB/s（峰值 {:.2f} MB/s），下次 preupload 重新测速".format(
+                    line, st["ewma"] / 1048576.0, st["peak"] / 1048576.0
+                ))
+                self._ranked = None
+                self._expires_at = 0.0
+
+
+# 进程内共享的线路选择器
+SELECTOR = LineSelector()
@@ -8,7 +8,10 @@ from __future__ import absolute_import
 import hashlib
 import math
 import os
+import random
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from urllib import parse
 
 try:
@@ -16,13 +19,18 @@ try:
 except ImportError:
     requests = None
 
-# 投稿接口
+from . import lines as upload_lines
+from .chunks import ChunkSource
+
+# 投稿接口（模块级常量，调用时读取：基准/联调时可整体指向本地替身服务，见 bench/bili_stub_server.py）
 PREUPLOAD_URL = "https://member.bilibili.com/preupload"
 ADD_URL = "https://member.bilibili.com/x/vu/web/add/v3"
 APP_ADD_URL = "https://member.bilibili.com/x/vu/app/add"
 APP_KEY_BILITV = "4409e2ce8ffd12b8"
 APPSEC_BILITV = "59b43e04ad6965f34319062b478f83dd"
 UPOS_PROFILE = "ugcupos/bup"
+# upos 节点协议：preupload 返回的 endpoint 为 //host 形式，拼接为 <scheme>//host/...（本地替身服务用 "http:"）
+UPOS_SCHEME = "https:"
 PREUPLOAD_VERSION = "2.14.0"
 PREUPLOAD_BUILD = 2140000
 # 与  一致：probe_version 用当前  的 20250923，多线路回退
@@ -32,6 +40,24 @@ PREUPLOAD_LINES = [
     "probe_version=20250923&upcdn=bda2&zone=cs",
     "zone=cs&upcdn=bda2&probe_version=20250923",
 ]
+# 分片并发：初始并发数与上限，实际并发度在 [1, 上限] 内按实测吞吐自适应
+UPLOAD_CONCURRENCY = 3
+UPLOAD_MAX_CONCURRENCY = 8
+# 单个分片 PUT 的超时（秒）
+PART_TIMEOUT = 900
+# 投稿就绪等待：服务端未处理完分片时投稿返回 21015，按退避间隔重试直到总时限（秒）
+SUBMIT_READY_TIMEOUT = 180
+SUBMIT_BACKOFF_INITIAL = 0.5
+SUBMIT_BACKOFF_MAX = 10
+SUBMIT_NOT_READY_CODE = 21015
+
+
+class UposSessionError(RuntimeError):
+    """upos 上传会话已失效（upload_id/auth 过期或被服务端拒绝），需重新 preupload。"""
+
+
+class SizeHintExceeded(RuntimeError):
+    """边写边传时文件超出 preupload 上报的预估大小，已停止上传；需等文件写完后按实际大小重新上传。"""
 
 
 def _ensure_requests():
@@ -44,16 +70,20 @@ def _sign_app_query(params_str, appsec):
     return hashlib.md5((params_str + appsec).encode("utf-8")).hexdigest()
 
 
-def preupload(session, filepath, upos_profile=None):
+def preupload(session, filepath, upos_profile=None, lines=None, filesize=None):
     """
     获取上传凭证与分片参数。协议与  对齐（profile ugcupos/bup + version/build）。
-    :return: dict 含 endpoint, upos_uri, auth, biz_id, chunk_size 等；失败抛异常
+    线路默认按 lines.SELECTOR 的实测吞吐排序（结果缓存 LINE_CACHE_TTL），依次尝试直到成功。
+    :param lines: 指定线路 query 列表（按顺序尝试），不传则测速排序
+    :param filesize: 指定上报的文件大小（边写边传时为预估值），不传则取文件实际大小
+    :return: dict 含 endpoint, upos_uri, auth, biz_id, chunk_size 等，另附 line（实际使用的线路）；失败抛异常
     """
     _ensure_requests()
     if upos_profile is None:
         upos_profile = UPOS_PROFILE
     filename = os.path.basename(filepath)
-    filesize = os.path.getsize(filepath)
+    if filesize is None:
+        filesize = os.path.getsize(filepath)
     params = {
         "os": "upos",
         "name": filename,
@@ -64,8 +94,10 @@ def preupload(session, filepath, upos_profile=None):
         "version": PREUPLOAD_VERSION,
         "build": PREUPLOAD_BUILD,
     }
+    if lines is None:
+        lines = upload_lines.SELECTOR.ranked_lines(session, PREUPLOAD_LINES)
     last_err = None
-    for line in PREUPLOAD_LINES:
+    for line in lines:
         try:
             url = "{}?{}".format(PREUPLOAD_URL, line)
             print("[DEBUG] preupload 尝试线路: {}".format(line))
@@ -76,6 +108,7 @@ def preupload(session, filepath, upos_profile=None):
                 print("[DEBUG] preupload 成功，endpoint={}, biz_id={}".format(
                     j.get("endpoint"), j.get("biz_id") or j.get("bizId")
                 ))
+                j["line"] = line
                 return j
             last_err = j
         except Exception as e:
@@ -85,12 +118,14 @@ def preupload(session, filepath, upos_profile=None):
 
 
 def init_multipart(session, endpoint, upos_uri, auth):
-    """初始化分片上传，返回 upload_id。"""
+    """
+    初始化分片上传，返回 upload_id。
+    X-Upos-Auth 按请求传入，不写入 session 公共头，便于多个上传共享同一 Session。
+    """
     _ensure_requests()
-    session.headers["X-Upos-Auth"] = auth
     path = upos_uri.replace("upos://", "")
-    url = "https:{}/{}?uploads&output=json".format(endpoint, path)
-    r = session.post(url, timeout=30)
+    url = "{}{}/{}?uploads&output=json".format(UPOS_SCHEME, endpoint, path)
+    r = session.post(url, headers=_upos_headers(auth), timeout=30)
     r.raise_for_status()
     j = r.json()
     if not j.get("OK") and j.get("OK") != 1:
@@ -98,6 +133,11 @@ def init_multipart(session, endpoint, upos_uri, auth):
     return j.get("upload_id")
 
 
+def _upos_headers(auth):
+    """upos 请求头：auth 为 preupload 返回的 X-Upos-Auth；为空则沿用 session 上已有的头。"""
+    return {"X-Upos-Auth": auth} if auth else None
+
+
 def _get_etag_from_response(r):
     """从 PUT 响应中解析 ETag（响应头或 JSON body），去掉首尾引号。"""
     etag = r.headers.get("ETag") or r.headers.get("etag")
@@ -114,58 +154,228 @@ def _get_etag_from_response(r):
     return None
 
 
-def upload_chunks(session, endpoint, upos_uri, upload_id, filepath, chunk_size, biz_id, filename, max_retry=5):
+class _AdaptiveLimiter(object):
+    """
+    分片并发度控制：同时在传的分片数不超过 limit。
+    每完成 limit*2 个分片统计一次总吞吐：比上一轮高 10% 以上则并发 +1（不超过上限），
+    低 10% 以上则并发 -1（不低于 1），以此贴近上传节点能承受的最佳并发。
     """
-    分片上传文件，并完成 multipart。
+
+    def __init__(self, initial, maximum):
+        self.maximum = max(1, maximum)
+        self.limit = max(1, min(initial, self.maximum))
+        self._active = 0
+        self._cond = threading.Condition()
+        self._prev_rate = None
+        self._reset_epoch()
+
+    def _reset_epoch(self):
+        self._epoch_bytes = 0
+        self._epoch_parts = 0
+        self._epoch_start = time.time()
+
+    def acquire(self):
+        with self._cond:
+            while self._active >= self.limit:
+                self._cond.wait()
+            self._active += 1
+
+    def release(self, nbytes=0):
+        with self._cond:
+            self._active -= 1
+            if nbytes:
+                self._observe(nbytes)
+            self._cond.notify_all()
+
+    def _observe(self, nbytes):
+        self._epoch_bytes += nbytes
+        self._epoch_parts += 1
+        if self._epoch_parts < self.limit * 2:
+            return
+        rate = self._epoch_bytes / max(time.time() - self._epoch_start, 1e-6)
+        if self._prev_rate is None or rate > self._prev_rate * 1.1:
+            self.limit = min(self.limit + 1, self.maximum)
+        elif rate < self._prev_rate * 0.9:
+            self.limit = max(self.limit - 1, 1)
+        self._prev_rate = rate
+        self._reset_epoch()
+
+
+def _put_part(session, url, make_body, auth, max_retry, label):
+    """
+    PUT 单个分片，失败（非 200 或网络异常）按指数退避重试，返回 ETag。
+    :param make_body: 每次尝试调用一次，返回新的请求体（FileSlice），发送后关闭
+    """
+    last_err = None
+    for attempt in range(max_retry):
+        try:
+            with make_body() as body:
+                r = session.put(url, data=body, headers=_upos_headers(auth), timeout=PART_TIMEOUT)
+            if r.status_code == 200:
+                etag = _get_etag_from_response(r)
+                return etag if etag else "etag"
+            if r.status_code in (403, 404):
+                raise UposSessionError("分片 {} 被拒绝（HTTP {}），上传会话已失效".format(label, r.status_code))
+            last_err = "HTTP {}".format(r.status_code)
+        except requests.RequestException as e:
+            last_err = e
+        if attempt < max_retry - 1:
+            time.sleep(min(2 ** attempt, 30) + random.random())
+    raise RuntimeError("分片 {} 上传失败，已达最大重试: {}".format(label, last_err))
+
+
+def _iter_growing_parts(growing, chunk_size):
+    """按写入进度产出 (chunk_index, start, size)：写满一个分片即产出，写入结束后产出最后不足一片的余量。"""
+    index = 0
+    while True:
+        start = index * chunk_size
+        available = growing.wait_for(start + chunk_size)
+        size = min(chunk_size, available - start)
+        if size <= 0:
+            return
+        yield index, start, size
+        if size < chunk_size:
+            return
+        index += 1
+
+
+def upload_chunks(
+    session,
+    endpoint,
+    upos_uri,
+    upload_id,
+    filepath,
+    chunk_size,
+    biz_id,
+    filename,
+    max_retry=5,
+    auth=None,
+    concurrency=None,
+    max_concurrency=None,
+    journal=None,
+    line=None,
+    growing=None,
+    size_hint=None,
+):
+    """
+    分片上传文件，并完成 multipart。分片由有界线程池并发上传，每片独立重试，ETag 按分片序号收集。
+    分片数据以 mmap 区间（chunks.FileSlice）直接作为请求体，不为每片复制 bytes。
     :param session: 带 Cookie 的 requests.Session
-    :return: complete 接口返回的 dict，用于提交稿件时确定 filename；失败抛异常
+    :param auth: preupload 返回的 X-Upos-Auth，按请求携带
+    :param concurrency: 初始并发分片数，默认 UPLOAD_CONCURRENCY
+    :param max_concurrency: 并发上限，默认 UPLOAD_MAX_CONCURRENCY；并发度按实测吞吐在 [1, 上限] 内自适应
+    :param journal: 可选 journal.UploadJournal：跳过其中已完成的分片，每完成一片即记录；
+        complete 已记录过则直接返回记录的响应
+    :param line: preupload 使用的线路；每片实测吞吐上报给 lines.SELECTOR，吞吐明显下降时触发重新测速
+    :param growing: 可选 chunks.GrowingFile：文件仍在写入时边写边传，写满一个分片就上传；
+        分片 URL 中的 chunks/total 使用 size_hint 预估，complete 在写入结束后按实际分片提交（不支持 journal）；
+        数据超出 size_hint 时不再上传越界分片，等在传分片结束后抛 SizeHintExceeded
+    :param size_hint: growing 模式下的预估文件大小（须大于 0，宜留余量）
+    :return: complete 接口返回的 dict，用于提交稿件时确定 filename；失败抛异常（会话失效时抛 UposSessionError）
     """
     _ensure_requests()
     path = upos_uri.replace("upos://", "")
-    filesize = os.path.getsize(filepath)
-    chunks_num = int(math.ceil(filesize / float(chunk_size)))
-    etags = []
-
-    with open(filepath, "rb") as f:
-        for chunk_index in range(chunks_num):
-            chunk_data = f.read(chunk_size)
-            if not chunk_data:
+    concurrency = concurrency or UPLOAD_CONCURRENCY
+    limiter = _AdaptiveLimiter(concurrency, max(max_concurrency or UPLOAD_MAX_CONCURRENCY, concurrency))
+    etags = {}
+    if growing is not None:
+        if not size_hint or size_hint <= 0:
+            raise ValueError("边写边传需要预估文件大小 size_hint")
+        journal = None
+        filesize = size_hint
+        chunks_num = max(1, int(math.ceil(filesize / float(chunk_size))))
+        parts = _iter_growing_parts(growing, chunk_size)
+    else:
+        if journal is not None and journal.data.get("complete"):
+            print("[DEBUG] 续传：分片已全部完成并 complete，直接提交稿件")
+            return journal.data["complete"]
+        filesize = os.path.getsize(filepath)
+        chunks_num = int(math.ceil(filesize / float(chunk_size)))
+        done = journal.completed_parts() if journal is not None else {}
+        for part_number, etag in done.items():
+            if 1 <= part_number <= chunks_num:
+                etags[part_number - 1] = etag
+        pending = [i for i in range(chunks_num) if i not in etags]
+        if done:
+            print("[DEBUG] 续传：已完成 {}/{} 片，补传 {} 片".format(chunks_num - len(pending), chunks_num, len(pending)))
+        parts = [(i, i * chunk_size, min(chunk_size, filesize - i * chunk_size)) for i in pending]
+    errors = []
+    sent = []
+    started = time.time()
+
+    def _upload_one(chunk_index, start, size):
+        nbytes = 0
+        try:
+            if errors:
+                return
+            url = (
+                "{scheme}{endpoint}/{path}?"
+                "partNumber={part_number}&uploadId={upload_id}&chunk={chunk}&chunks={chunks}&"
+                "size={size}&start={start}&end={end}&total={total}"
+            ).format(
+                scheme=UPOS_SCHEME,
+                endpoint=endpoint,
+                path=path,
+                part_number=chunk_index + 1,
+                upload_id=upload_id,
+                chunk=chunk_index,
+                chunks=chunks_num,
+                size=size,
+                start=start,
+                end=start + size,
+                total=filesize,
+            )
+            label = "{}/{}".format(chunk_index + 1, chunks_num)
+            part_started = time.time()
+            etags[chunk_index] = _put_part(
+                session, url, lambda: source.slice(start, size), auth, max_retry, label
+            )
+            upload_lines.SELECTOR.observe(line, size / max(time.time() - part_started, 1e-6))
+            if journal is not None:
+                journal.record_part(chunk_index + 1, etags[chunk_index])
+            nbytes = size
+            sent.append(size)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            limiter.release(nbytes)
+
+    # 主线程先占并发名额再提交，保证同时在内存/在传的分片数不超过当前并发度
+    source = ChunkSource(filepath)
+    executor = ThreadPoolExecutor(max_workers=limiter.maximum)
+    try:
+        for chunk_index, start, size in parts:
+            if start + size > filesize:
+                # 只会在 growing 模式出现：分片序号与区间不能超出 preupload 上报的大小
+                errors.append(SizeHintExceeded(
+                    "文件已超出预估大小 {} 字节（分片 {} 结束于 {}），停止边写边传".format(
+                        filesize, chunk_index + 1, start + size
+                    )
+                ))
+                break
+            limiter.acquire()
+            if errors:
+                limiter.release()
                 break
-            start = chunk_index * chunk_size
-            end = start + len(chunk_data)
-            part_number = chunk_index + 1
-
-            for attempt in range(max_retry):
-                url = (
-                    "https:{endpoint}/{path}?"
-                    "partNumber={part_number}&uploadId={upload_id}&chunk={chunk}&chunks={chunks}&"
-                    "size={size}&start={start}&end={end}&total={total}"
-                ).format(
-                    endpoint=endpoint,
-                    path=path,
-                    part_number=part_number,
-                    upload_id=upload_id,
-                    chunk=chunk_index,
-                    chunks=chunks_num,
-                    size=len(chunk_data),
-                    start=start,
-                    end=end,
-                    total=filesize,
-                )
-                r = session.put(url, data=chunk_data, timeout=900)
-                if r.status_code == 200:
-                    etag = _get_etag_from_response(r)
-                    etags.append(etag if etag else "etag")
-                    break
-                if attempt < max_retry - 1:
-                    time.sleep(5 * (attempt + 1))
-            else:
-                raise RuntimeError("分片 {}/{} 上传失败，已达最大重试".format(chunk_index + 1, chunks_num))
+            executor.submit(_upload_one, chunk_index, start, size)
+    finally:
+        executor.shutdown(wait=True)
+        source.close()
+    if errors:
+        raise errors[0]
+    if growing is not None:
+        chunks_num = len(etags)
+    if sent:
+        elapsed = max(time.time() - started, 1e-6)
+        print("[DEBUG] 分片上传完成: {} 片，{:.2f} MB/s，最终并发 {}".format(
+            len(sent), sum(sent) / elapsed / 1048576.0, limiter.limit
+        ))
 
     # 完成 multipart（profile 与  一致：ugcupos/bup）
     complete_url = (
-        "https:{endpoint}/{path}?name={name}&uploadId={upload_id}&biz_id={biz_id}&output=json&profile=ugcupos%2Fbup"
+        "{scheme}{endpoint}/{path}?name={name}&uploadId={upload_id}&biz_id={biz_id}&output=json&profile=ugcupos%2Fbup"
     ).format(
+        scheme=UPOS_SCHEME,
         endpoint=endpoint,
         path=path,
         name=parse.quote_plus(filename),
@@ -174,22 +384,67 @@ def upload_chunks(session, endpoint, upos_uri, upload_id, filepath, chunk_size,
     )
     parts_body = {
         "parts": [
-            {"partNumber": i, "eTag": etags[i - 1] if i - 1 < len(etags) else "etag"}
+            {"partNumber": i, "eTag": etags.get(i - 1) or "etag"}
             for i in range(1, chunks_num + 1)
         ]
     }
-    r = session.post(complete_url, json=parts_body, timeout=60)
+    r = session.post(complete_url, json=parts_body, headers=_upos_headers(auth), timeout=60)
+    if r.status_code in (403, 404):
+        raise UposSessionError("complete 被拒绝（HTTP {}），上传会话已失效".format(r.status_code))
     r.raise_for_status()
     j = r.json()
     print("[DEBUG] complete 响应: {}".format(j))
     if not j.get("OK") and j.get("OK") != 1:
         raise RuntimeError("完成分片失败: {}".format(j))
+    if journal is not None:
+        journal.record_complete(j)
+    return j
+
+
+def _post_until_ready(post, label, stats=None, deadline=None):
+    """
+    发送投稿请求，返回 21015（服务端尚未处理完上传的分片）时按指数退避（带抖动）重试，直到成功、
+    返回其他结果或超过 SUBMIT_READY_TIMEOUT。不再在投稿前固定等待：第一次请求立即发出，服务端已就绪则无额外延迟。
+    :param post: 无参函数，发送一次请求并返回 requests.Response
+    :param stats: 可选 dict，写入 submit_attempts（请求次数）、submit_wait（等待就绪耗时，秒）、submit_seconds（投稿阶段总耗时）
+    :param deadline: 截止时间戳，不传则为当前时间 + SUBMIT_READY_TIMEOUT
+    :return: 最后一次响应的 json
+    """
+    started = time.time()
+    if deadline is None:
+        deadline = started + SUBMIT_READY_TIMEOUT
+    delay = SUBMIT_BACKOFF_INITIAL
+    waited = 0.0
+    attempts = 0
+    while True:
+        attempts += 1
+        r = post()
+        r.raise_for_status()
+        j = r.json()
+        if j.get("code") != SUBMIT_NOT_READY_CODE:
+            break
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            break
+        pause = min(delay * (1 + random.random() * 0.25), remaining)
+        print("[DEBUG] {}：服务端尚未就绪（21015），{:.1f}s 后重试（第 {} 次）".format(label, pause, attempts))
+        time.sleep(pause)
+        waited += pause
+        delay = min(delay * 2, SUBMIT_BACKOFF_MAX)
+    if stats is not None:
+        stats["submit_attempts"] = attempts
+        stats["submit_wait"] = round(waited, 3)
+        stats["submit_seconds"] = round(time.time() - started, 3)
+    if attempts > 1:
+        print("[DEBUG] {}：共请求 {} 次，等待就绪 {:.1f}s".format(label, attempts, waited))
     return j
 
 
-def submit_add(session, csrf, videos, title, tid, tag, desc, source="", cover="", no_reprint=True, dynamic="", dtime=None):
+def submit_add(session, csrf, videos, title, tid, tag, desc, source="", cover="", no_reprint=True, dynamic="", dtime=None, stats=None):
     """
     提交稿件信息。videos 为 preupload 后得到的列表，每项含 filename(不含扩展名)、title、desc。
+    返回 21015 时在 SUBMIT_READY_TIMEOUT 内退避重试（见 _post_until_ready）。
+    :param stats: 可选 dict，写入投稿阶段的请求次数与等待就绪耗时
     :return: 接口返回的 json（含 aid 等）
     """
     _ensure_requests()
@@ -217,19 +472,8 @@ def submit_add(session, csrf, videos, title, tid, tag, desc, source="", cover=""
     url = "{}?t={}&csrf={}".format(ADD_URL, t_ms, csrf)
     print("[DEBUG] Web投稿 URL: {}".format(ADD_URL))
     print("[DEBUG] Web投稿 videos: {}".format(videos))
-    # complete 后稍等再投稿，避免服务端未处理完导致 21015
-    time.sleep(2)
-    r = session.post(url, json=payload, timeout=30)
-    r.raise_for_status()
-    j = r.json()
+    j = _post_until_ready(lambda: session.post(url, json=payload, timeout=30), "Web投稿", stats)
     if j.get("code") != 0:
-        if j.get("code") == 21015:
-            time.sleep(5)
-            r2 = session.post(url, json=payload, timeout=30)
-            r2.raise_for_status()
-            j = r2.json()
-            if j.get("code") == 0:
-                return j
         msg = "投稿提交失败: {}".format(j)
         if j.get("code") == 21015:
             msg += "（若为合并视频，可尝试合并时加 --reencode 重新压制后再上传）"
@@ -250,9 +494,12 @@ def submit_add_by_app(
     no_reprint=True,
     dynamic="",
     dtime=None,
+    stats=None,
 ):
     """
     APP 接口投稿（与  submit_by_app 一致），需 access_token（ 登录后 token_info.access_token）。
+    返回 21015 时在 SUBMIT_READY_TIMEOUT 内退避重试（见 _post_until_ready）。
+    :param stats: 可选 dict，写入投稿阶段的请求次数与等待就绪耗时
     :return: 接口返回的 json（含 aid、bvid 等）
     """
     _ensure_requests()
@@ -295,17 +542,12 @@ def submit_add_by_app(
     url = "{}?{}&sign={}".format(APP_ADD_URL, params_str, sign)
     print("[DEBUG] APP投稿 URL: {}".format(APP_ADD_URL))
     print("[DEBUG] APP投稿 videos: {}".format(videos))
-    time.sleep(2)
-    r = session.post(
-        url,
-        json=payload,
-        timeout=30,
-        headers={
-            "User-Agent": "Mozilla/5.0 BiliDroid/7.80.0 (bbcallen@gmail.com) os/android model/MI 6 mobi_app/android build/7800300 channel/bili innerVer/7800310 osVer/13 network/2",
-        },
+    app_headers = {
+        "User-Agent": "Mozilla/5.0 BiliDroid/7.80.0 (bbcallen@gmail.com) os/android model/MI 6 mobi_app/android build/7800300 channel/bili innerVer/7800310 osVer/13 network/2",
+    }
+    j = _post_until_ready(
+        lambda: session.post(url, json=payload, timeout=30, headers=app_headers), "APP投稿", stats
     )
-    r.raise_for_status()
-    j = r.json()
     if j.get("code") != 0:
         msg = "APP投稿提交失败: {}".format(j)
         # 检测 token 失效的常见错误码
@@ -315,15 +557,6 @@ def submit_add_by_app(
             msg += "  方法2: 使用  login 扫码后，复制其生成的 cookies.json 到 push/bilibili/cookie.json"
             raise RuntimeError(msg)
         if j.get("code") == 21015:
-            time.sleep(5)
-            app_headers = {
-                "User-Agent": "Mozilla/5.0 BiliDroid/7.80.0 (bbcallen@gmail.com) os/android model/MI 6 mobi_app/android build/7800300 channel/bili innerVer/7800310 osVer/13 network/2",
-            }
-            r2 = session.post(url, json=payload, timeout=30, headers=app_headers)
-            r2.raise_for_status()
-            j2 = r2.json()
-            if j2.get("code") == 0:
-                return j2
             msg += "（若为合并视频，可尝试合并时加 --reencode 重新压制后再上传）"
         raise RuntimeError(msg)
     return j
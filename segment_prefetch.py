@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+分段预取：按列表顺序并发下载远程分段（共享 requests.Session 复用连接），按序号取本地路径。
+- get(i) 阻塞到第 i 段就绪后返回本地路径，调用方拿到第 0 段即可开始解码，后续分段仍在后台下载
+- 最多领先 max_ahead 段下载；release(i) 表示第 i 段已用完，删除其下载文件并推进下载窗口，
+  临时目录占用不超过约 max_ahead 段
+- 本地路径不下载、不删除，仅在构造时校验存在
+供 merge_mp4_cv2 / merge_mp4_moviepy 使用。
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import requests
+    from requests.adapters import HTTPAdapter
+except ImportError:
+    requests = None
+
+# 默认最多领先下载的分段数、并发下载数
+PREFETCH_AHEAD = 4
+PREFETCH_CONCURRENCY = 4
+DOWNLOAD_CHUNK = 1024 * 1024
+
+
+def _is_url(item):
+    return item.startswith("http://") or item.startswith("https://")
+
+
+class SegmentPrefetcher(object):
+    """
+    按列表顺序预取分段。线程安全：多个解码线程可同时 get / release 不同分段。
+    用法：
+        with SegmentPrefetcher(paths, temp_dir) as pf:
+            for i in range(len(pf)):
+                path = pf.get(i)
+                ...
+                pf.release(i)
+    """
+
+    def __init__(
+        self,
+        items,
+        temp_dir,
+        max_ahead=PREFETCH_AHEAD,
+        concurrency=PREFETCH_CONCURRENCY,
+        verify_ssl=True,
+        timeout=120,
+        max_retries=3,
+        evict=True,
+    ):
+        """
+        :param items: 列表条目（本地路径或 http(s) URL），顺序即合并顺序
+        :param temp_dir: 远程分段的下载目录
+        :param max_ahead: 未 release 的分段中最多已调度下载的段数（下载窗口）
+        :param concurrency: 并发下载数
+        :param verify_ssl: 下载 https 时是否校验 SSL 证书
+        :param evict: release 时是否删除已下载的分段；调用方需要全部文件留到最后时传 False
+        """
+        self.items = list(items)
+        self.temp_dir = temp_dir
+        self.max_ahead = max(1, max_ahead)
+        self.verify_ssl = verify_ssl
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.evict = evict
+        for item in self.items:
+            if not _is_url(item) and not os.path.isfile(item):
+                raise FileNotFoundError("本地文件不存在: {}".format(item))
+        self._session = None
+        if any(_is_url(item) for item in self.items):
+            if requests is None:
+                raise RuntimeError("支持 URL 需安装 requests: pip install requests")
+            self._session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=concurrency, pool_maxsize=concurrency)
+            self._session.mount("http://", adapter)
+            self._session.mount("https://", adapter)
+        self._executor = ThreadPoolExecutor(max_workers=max(1, concurrency))
+        self._lock = threading.Lock()
+        self._futures = {}
+        self._released = set()
+        self._low = 0  # 最小的未 release 序号
+        self._next = 0  # 下一个待调度的序号
+        with self._lock:
+            self._schedule(-1)
+
+    def __len__(self):
+        return len(self.items)
+
+    def local_name(self, index):
+        """远程分段的本地文件名：序号前缀避免不同 URL 同名文件互相覆盖。"""
+        item = self.items[index]
+        name = os.path.basename(item.split("?")[0]) or "video.mp4"
+        return "{:04d}_{}".format(index, name)
+
+    def local_path(self, index):
+        """第 index 段就绪后的本地路径（不等待下载），可提前写入 ffmpeg concat 列表。"""
+        item = self.items[index]
+        if not _is_url(item):
+            return item
+        return os.path.join(self.temp_dir, self.local_name(index))
+
+    def _schedule(self, index):
+        """调度下载直到窗口 [_low, _low + max_ahead) 填满，且至少包含 index（需持有 _lock）。"""
+        while self._next < len(self.items) and (self._next < self._low + self.max_ahead or self._next <= index):
+            i = self._next
+            self._futures[i] = self._executor.submit(self._fetch, i)
+            self._next += 1
+
+    def _fetch(self, index):
+        item = self.items[index]
+        if not _is_url(item):
+            return item
+        local_path = self.local_path(index)
+        self._download(item, local_path)
+        return local_path
+
+    def _download(self, url, save_path):
+        """
+        下载到 save_path（先写 .part 再改名）。
+        requests 的各类错误（SSL 不稳定如 SSLEOFError、连接错误、读超时、响应体中断 ChunkedEncodingError、
+        5xx / 429）自动重试；其余 4xx 直接失败。SSL/连接错误仍失败时可配合 --no-verify-ssl 使用。
+        """
+        part_path = save_path + ".part"
+        for attempt in range(self.max_retries):
+            try:
+                r = self._session.get(url, stream=True, timeout=self.timeout, verify=self.verify_ssl)
+                r.raise_for_status()
+                with open(part_path, "wb") as f:
+                    for chunk in r.iter_content(chunk_size=DOWNLOAD_CHUNK):
+                        if chunk:
+                            f.write(chunk)
+                os.replace(part_path, save_path)
+                return
+            except requests.exceptions.RequestException as e:
+                status = getattr(e.response, "status_code", None)
+                retryable = status is None or status >= 500 or status == 429
+                if retryable and attempt < self.max_retries - 1:
+                    time.sleep(1 + attempt)
+                    continue
+                if self.verify_ssl and isinstance(
+                    e, (requests.exceptions.SSLError, requests.exceptions.ConnectionError)
+                ):
+                    raise RuntimeError(
+                        "下载失败(SSL/连接): {}。可尝试加参数: --no-verify-ssl（仅用于可信源）".format(e)
+                    )
+                raise
+            finally:
+                if os.path.isfile(part_path):
+                    os.remove(part_path)
+
+    def get(self, index):
+        """阻塞到第 index 段就绪，返回本地路径；下载失败时抛出原异常。"""
+        with self._lock:
+            if self.evict and index in self._released:
+                raise RuntimeError("分段 {} 已释放".format(index))
+            self._schedule(index)
+            future = self._futures[index]
+        return future.result()
+
+    def release(self, index):
+        """第 index 段已用完：删除其下载文件（evict 时），并推进下载窗口。"""
+        with self._lock:
+            if index in self._released:
+                return
+            self._released.add(index)
+            while self._low in self._released:
+                self._low += 1
+            future = self._futures.get(index)
+            self._schedule(-1)
+        if self.evict and future is not None and _is_url(self.items[index]):
+            if future.done() and not future.exception():
+                try:
+                    os.remove(future.result())
+                except OSError:
+                    pass
+
+    def close(self):
+        """取消尚未开始的下载，等待进行中的下载结束并关闭连接。"""
+        with self._lock:
+            for future in self._futures.values():
+                future.cancel()
+        self._executor.shutdown(wait=True)
+        if self._session is not None:
+            self._session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
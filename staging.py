@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+分片暂存：小分片放内存文件系统（/dev/shm，tmpfs），大分片与超出内存预算的分片落磁盘临时目录。
+- 大小不超过 RAM_STAGE_MAX_FILE 且全局预算（RAM_STAGE_BUDGET，本机所有进程共用）有余量、/dev/shm 剩余空间足够时放内存，
+  否则放磁盘；大小未知（URL 无 Content-Length）时直接放磁盘
+- path_for 返回绝对路径，concat 列表与 ffmpeg 不需要区分分片在哪一层
+- close() 删除本任务的内存目录并归还预算（--keep-tmp 也只保留磁盘上的文件）
+- 每个任务的内存目录写入属主进程号（.owner）与已占预算（.reserved）；预算在 /dev/shm 暂存根目录的文件锁下
+  汇总各目录的 .reserved 计算，同时清理属主进程已退出（崩溃、OOM、SIGKILL 未来得及 close）的目录
+"""
+
+import os
+import shutil
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from workspace import pid_alive
+
+# 内存暂存根目录（不存在或不可写时不启用内存层）
+SHM_ROOT = "/dev/shm"
+RAM_STAGE_DIR_NAME = "videoCutPush_stage"
+# 单个分片放内存的大小上限、本机所有任务共用的内存预算（字节）
+RAM_STAGE_MAX_FILE = 32 * 1024 * 1024
+RAM_STAGE_BUDGET = 1024 * 1024 * 1024
+# /dev/shm 至少保留的剩余空间（字节），其他进程也在用时不把它写满
+SHM_RESERVE_BYTES = 256 * 1024 * 1024
+OWNER_MARKER = ".owner"
+RESERVED_MARKER = ".reserved"
+LOCK_NAME = ".lock"
+
+
+def ram_root():
+    """内存暂存根目录；系统无 /dev/shm、不可写或不支持文件锁时返回 None。"""
+    if fcntl is None or not os.path.isdir(SHM_ROOT) or not os.access(SHM_ROOT, os.W_OK):
+        return None
+    return os.path.join(SHM_ROOT, RAM_STAGE_DIR_NAME)
+
+
+def _shm_free_bytes():
+    try:
+        st = os.statvfs(SHM_ROOT)
+    except OSError:
+        return 0
+    return st.f_bavail * st.f_frsize
+
+
+def _read_int(path):
+    try:
+        with open(path, "r") as f:
+            return int(f.read().strip() or 0)
+    except (IOError, OSError, ValueError):
+        return None
+
+
+def _write_int(path, value):
+    with open(path, "w") as f:
+        f.write(str(value))
+
+
+class RamBudget(object):
+    """
+    本机共享的内存暂存预算：各任务目录的 .reserved 之和不超过 limit。
+    所有读写在 <root>/.lock 的排他文件锁下进行（跨进程），进程内再加线程锁。
+    """
+
+    def __init__(self, limit, root=None):
+        self.limit = limit
+        self.root = root
+        self._lock = threading.Lock()
+
+    def _locked(self):
+        return _FileLock(os.path.join(self.root, LOCK_NAME))
+
+    def sweep(self):
+        """删除属主进程已不存在的任务目录（加锁），返回删除的目录列表。"""
+        if not self.root or not os.path.isdir(self.root):
+            return []
+        with self._lock, self._locked():
+            return self._sweep()
+
+    def _sweep(self):
+        removed = []
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if name == LOCK_NAME or not os.path.isdir(path):
+                continue
+            pid = _read_int(os.path.join(path, OWNER_MARKER))
+            # 目录与 .owner 在锁内一起创建，缺少 .owner 的只可能是残留
+            if pid is None or not pid_alive(pid):
+                shutil.rmtree(path, ignore_errors=True)
+                removed.append(path)
+        if removed:
+            print("[staging] 清理已退出进程遗留的内存暂存目录 {} 个".format(len(removed)))
+        return removed
+
+    def _used(self):
+        total = 0
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if name != LOCK_NAME and os.path.isdir(path):
+                total += _read_int(os.path.join(path, RESERVED_MARKER)) or 0
+        return total
+
+    def try_reserve(self, area_dir, nbytes):
+        """为任务目录 area_dir 预占 nbytes（目录不存在时创建并写入属主进程号），预算不足返回 False。"""
+        with self._lock, self._locked():
+            self._sweep()
+            if self._used() + nbytes > self.limit:
+                return False
+            if not os.path.isdir(area_dir):
+                os.makedirs(area_dir)
+                _write_int(os.path.join(area_dir, OWNER_MARKER), os.getpid())
+            reserved_path = os.path.join(area_dir, RESERVED_MARKER)
+            _write_int(reserved_path, (_read_int(reserved_path) or 0) + nbytes)
+            return True
+
+    def release(self, area_dir):
+        """删除任务目录，其预占的预算随之归还。"""
+        with self._lock, self._locked():
+            shutil.rmtree(area_dir, ignore_errors=True)
+
+
+class _FileLock(object):
+    """flock 排他锁（with 语句）。"""
+
+    def __init__(self, path):
+        self.path = path
+        self._f = None
+
+    def __enter__(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._f = open(self.path, "a")
+        fcntl.flock(self._f.fileno(), fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        try:
+            fcntl.flock(self._f.fileno(), fcntl.LOCK_UN)
+        finally:
+            self._f.close()
+
+
+BUDGET = RamBudget(RAM_STAGE_BUDGET, ram_root())
+
+
+class StagingArea(object):
+    """
+    一个合并任务的分片暂存区。线程安全：多个下载线程可同时调用 path_for。
+    创建时清理其他已退出进程遗留的内存目录。
+    :param disk_dir: 磁盘暂存目录（任务的 _tmp）
+    :param name: 内存目录名（任务 ID，需在进程间唯一）
+    :param enabled: False 时全部放磁盘
+    """
+
+    def __init__(self, disk_dir, name, enabled=True, max_file=RAM_STAGE_MAX_FILE, budget=None):
+        self.disk_dir = os.path.abspath(disk_dir)
+        self.budget = budget or BUDGET
+        root = self.budget.root if enabled else None
+        self.ram_dir = os.path.join(root, name) if root else None
+        self.max_file = max_file
+        self.ram_files = 0
+        self._lock = threading.Lock()
+        if self.ram_dir:
+            self.budget.sweep()
+
+    def path_for(self, filename, size=None):
+        """为 filename 选择暂存位置并返回绝对路径；放内存时预占 size 字节预算。"""
+        if self.ram_dir and size is not None and size <= self.max_file:
+            if _shm_free_bytes() - size >= SHM_RESERVE_BYTES and self.budget.try_reserve(self.ram_dir, size):
+                with self._lock:
+                    self.ram_files += 1
+                return os.path.join(self.ram_dir, filename)
+        os.makedirs(self.disk_dir, exist_ok=True)
+        return os.path.join(self.disk_dir, filename)
+
+    def close(self):
+        """删除内存目录并归还预算（可重复调用）。"""
+        if self.ram_dir and os.path.isdir(self.ram_dir):
+            self.budget.release(self.ram_dir)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -1,36 +1,43 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 """
-从 mapbinlist.txt 读取视频列表，逐个调用 playwright_push 的 B 站上传并发布。
-支持本地文件路径和 http(s) URL（URL 会先下载到临时目录再上传）。
+从 mapbinlist.txt 读取视频列表，批量调用 playwright_push 的 B 站上传并发布。
+支持本地文件路径和 http(s) URL（URL 会先下载到临时目录再上传，上传结果记录后删除下载的文件）。
+流水线执行：上传进行时后台预取后续 N 个下载；多个上传进程并行，每个进程槽位固定使用一个账号的 Cookie 文件。
+结果写入 JSON 报告，重新运行时跳过报告中已成功的条目（续跑）。
+
+用法示例：
+  python test_playwright_push_videos.py
+  python test_playwright_push_videos.py --workers 2 --cookie a.json --cookie b.json --prefetch 3
 """
 from __future__ import print_function
 
+import argparse
+import hashlib
+import json
 import os
 import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+import manifest
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 MAPBINLIST = os.path.join(BASE_DIR, "mapbinlist.txt")
 TMP_VIDEOS_DIR = os.path.join(BASE_DIR, "tmp", "playwright_push_videos")
+REPORT_PATH = os.path.join(TMP_VIDEOS_DIR, "report.json")
+# 默认预取（下载领先上传）的条目数
+PREFETCH = 2
 
 
 def _parse_mapbinlist(path):
-    """解析 mapbinlist 文件，每行 file 'path' 或 file \"path\"，返回路径/URL 列表。"""
-    with open(path, "r") as f:
-        content = f.read()
-    lines = [ln.strip() for ln in content.splitlines() if ln.strip()]
-    paths = []
-    for ln in lines:
-        if not ln.startswith("file "):
-            continue
-        rest = ln[5:].strip()
-        if (rest.startswith("'") and rest.endswith("'")) or (
-            rest.startswith('"') and rest.endswith('"')
-        ):
-            rest = rest[1:-1]
-        if rest:
-            paths.append(rest)
-    return paths
+    """
+    解析 mapbinlist 文件，每行 file 'path' 或 file \"path\"，返回路径/URL 列表。
+    这里需要完整列表：条目要先去重，续跑报告按整个列表统计与输出，因此用 load_paths 而非流式 iter_entries。
+    """
+    return manifest.load_paths(path)
 
 
 def _download_url(url, save_path, timeout=300):
@@ -41,10 +48,32 @@ def _download_url(url, save_path, timeout=300):
         raise RuntimeError("下载 URL 需安装 requests: pip install requests")
     r = requests.get(url, stream=True, timeout=timeout)
     r.raise_for_status()
-    with open(save_path, "wb") as f:
-        for chunk in r.iter_content(chunk_size=8192):
-            if chunk:
-                f.write(chunk)
+    # 先写临时文件再改名：中断的下载不会被下次当作已下载的完整文件
+    part_path = "{}.{}.part".format(save_path, threading.get_ident())
+    try:
+        with open(part_path, "wb") as f:
+            for chunk in r.iter_content(chunk_size=8192):
+                if chunk:
+                    f.write(chunk)
+        os.replace(part_path, save_path)
+    finally:
+        if os.path.isfile(part_path):
+            os.remove(part_path)
+
+
+def _is_url(entry):
+    return entry.startswith("http://") or entry.startswith("https://")
+
+
+def _url_basename(url):
+    """URL 最后一段（去掉查询串），无则 video.mp4。"""
+    return os.path.basename(url.split("?")[0]) or "video.mp4"
+
+
+def _entry_title(entry, local_path):
+    """投稿标题：URL 用其文件名，本地文件用文件名（均去掉扩展名）。"""
+    name = _url_basename(entry) if _is_url(entry) else os.path.basename(local_path)
+    return os.path.splitext(name)[0]
 
 
 def _ensure_local_path(entry):
@@ -55,13 +84,14 @@ def _ensure_local_path(entry):
     """
     if not entry:
         return None
-    if entry.startswith("http://") or entry.startswith("https://"):
+    if _is_url(entry):
         if not os.path.isdir(TMP_VIDEOS_DIR):
-            os.makedirs(TMP_VIDEOS_DIR)
-        # 用 URL 最后一段或简单命名
-        name = os.path.basename(entry.split("?")[0]) or "video.mp4"
-        if not name.lower().endswith(".mp4"):
-            name += ".mp4"
+            os.makedirs(TMP_VIDEOS_DIR, exist_ok=True)
+        # URL 最后一段 + 完整 URL 的短哈希：不同 URL 同名文件（如 .../a/1.mp4 与 .../b/1.mp4）并发下载不会互相覆盖
+        base, ext = os.path.splitext(_url_basename(entry))
+        if ext.lower() != ".mp4":
+            base, ext = base + ext, ".mp4"
+        name = "{}_{}{}".format(base, hashlib.sha1(entry.encode("utf-8")).hexdigest()[:10], ext)
         save_path = os.path.join(TMP_VIDEOS_DIR, name)
         if not os.path.isfile(save_path):
             print("正在下载: {} -> {}".format(entry[:60], save_path))
@@ -74,51 +104,197 @@ def _ensure_local_path(entry):
     return None
 
 
+def _load_report(path):
+    """读取报告，返回 {entry: 结果 dict}；不存在或损坏时返回空 dict。"""
+    if not os.path.isfile(path):
+        return {}
+    try:
+        with open(path, "r") as f:
+            return json.load(f).get("entries") or {}
+    except (IOError, OSError, ValueError):
+        return {}
+
+
+def _save_report(path, entries, order):
+    """按 mapbinlist 顺序写出报告（临时文件 + os.replace 原子替换）。"""
+    parent = os.path.dirname(path)
+    if parent and not os.path.isdir(parent):
+        os.makedirs(parent, exist_ok=True)
+    ordered = [e for e in order if e in entries] + [e for e in entries if e not in order]
+    records = [entries[e] for e in ordered]
+    data = {
+        "updated_at": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime()),
+        "summary": {
+            "total": len(order),
+            "success": sum(1 for r in records if r.get("success")),
+            "failed": sum(1 for r in records if r.get("status") == "failed"),
+            "skipped": sum(1 for r in records if r.get("status") == "skipped"),
+        },
+        "entries": dict((e, entries[e]) for e in ordered),
+    }
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def _upload_entry(local_path, title, cookie_file):
+    """
+    上传进程中执行单个上传。upload_bilibili 使用模块级状态（浏览器、日志上下文），
+    因此并行上传放在独立进程中，每个进程同一时刻只跑一个上传。
+    :return: 结果 dict（UploadResult 的字段）
+    """
+    if BASE_DIR not in sys.path:
+        sys.path.insert(0, BASE_DIR)
+    from playwright_push.upload_bilibili import main as upload_main
+
+    res = upload_main(video_path_arg=local_path, title_arg=title, cookie_file=cookie_file)
+    return {
+        "filename": res.filename,
+        "audit_status": res.audit_status,
+        "reason": res.reason,
+        "success": bool(res.success),
+        "dede_user_id": res.dede_user_id,
+        "duration_sec": res.duration_sec,
+    }
+
+
+def run_batch(paths, workers=1, prefetch=PREFETCH, cookie_files=None, report_path=REPORT_PATH, resume=True):
+    """
+    流水线批量上传。
+    :param paths: mapbinlist 条目（本地路径或 URL）
+    :param workers: 并行上传进程数
+    :param prefetch: 除正在上传的条目外，最多提前下载好的条目数
+    :param cookie_files: Cookie 文件列表；上传槽位 i 固定使用 cookie_files[i % len]，
+        文件数不少于 workers 时并行上传不会共用账号；不传则用 upload_bilibili 的默认 Cookie
+    :param report_path: JSON 报告路径，每完成一个条目即更新
+    :param resume: 为 True 时跳过报告中已成功的条目
+    :return: {entry: 结果 dict}
+    """
+    workers = max(1, workers)
+    entries = _load_report(report_path) if resume else {}
+    todo = [e for e in paths if not (entries.get(e) or {}).get("success")]
+    if len(todo) < len(paths):
+        print("续跑：报告中已成功 {} 个，本次处理 {} 个".format(len(paths) - len(todo), len(todo)))
+    cookie_files = cookie_files or [None]
+
+    def _record(entry, record):
+        record["entry"] = entry
+        record["finished_at"] = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
+        entries[entry] = record
+        _save_report(report_path, entries, paths)
+
+    downloads = deque()
+    todo_iter = iter(todo)
+    free_slots = list(range(workers))
+    running = {}
+    with ThreadPoolExecutor(max_workers=max(1, prefetch)) as dl_pool, \
+            ProcessPoolExecutor(max_workers=workers) as up_pool:
+
+        def _fill_downloads():
+            # 已下载/下载中但未开始上传的条目不超过 workers + prefetch
+            while len(downloads) < workers + prefetch:
+                entry = next(todo_iter, None)
+                if entry is None:
+                    return
+                downloads.append((entry, dl_pool.submit(_ensure_local_path, entry)))
+
+        _fill_downloads()
+        while downloads or running:
+            while downloads and free_slots:
+                entry, fut = downloads.popleft()
+                index = paths.index(entry)
+                try:
+                    local_path = fut.result()
+                    error = "非本地文件或文件不存在"
+                except Exception as e:
+                    local_path = None
+                    error = "下载失败: {}".format(e)
+                _fill_downloads()
+                if not local_path:
+                    print("\n[{}/{}] 跳过: {}（{}）".format(index + 1, len(paths), entry[:80], error))
+                    _record(entry, {"status": "skipped", "success": False, "reason": error})
+                    continue
+                slot = free_slots.pop(0)
+                cookie_file = cookie_files[slot % len(cookie_files)]
+                title = _entry_title(entry, local_path)
+                print("\n[{}/{}] 开始上传: {}（槽位 {}，Cookie: {}）".format(
+                    index + 1, len(paths), entry[:80], slot, cookie_file or "默认"
+                ))
+                future = up_pool.submit(_upload_entry, local_path, title, cookie_file)
+                running[future] = (entry, slot, local_path)
+            if not running:
+                continue
+            finished, _ = wait(list(running), return_when=FIRST_COMPLETED)
+            for future in finished:
+                entry, slot, local_path = running.pop(future)
+                free_slots.append(slot)
+                try:
+                    record = future.result()
+                except Exception as e:
+                    record = {"filename": os.path.basename(local_path), "audit_status": "error",
+                              "reason": "上传进程异常: {}".format(e), "success": False}
+                record["status"] = "success" if record.get("success") else "failed"
+                record["local_path"] = local_path
+                _record(entry, record)
+                if _is_url(entry):
+                    # 结果已记录，删除下载的副本（失败的条目续跑时重新下载）
+                    try:
+                        os.remove(local_path)
+                    except OSError:
+                        pass
+                print("  结果: 文件={}, 审核状态={}, 原因={}, 成功={}".format(
+                    record.get("filename"), record.get("audit_status"), record.get("reason"), record.get("success")
+                ))
+    return entries
+
+
 def main():
-    if not os.path.isfile(MAPBINLIST):
-        print("错误: 未找到 mapbinlist.txt: {}".format(MAPBINLIST))
+    parser = argparse.ArgumentParser(description="批量上传 mapbinlist 中的视频到 B 站（Playwright），支持预取、并行与续跑")
+    parser.add_argument("--list", default=MAPBINLIST, help="mapbinlist 文件路径（默认: 项目根目录 mapbinlist.txt）")
+    parser.add_argument("--workers", type=int, default=1, help="并行上传进程数（默认: 1）")
+    parser.add_argument("--prefetch", type=int, default=PREFETCH,
+                        help="上传进行时提前下载的条目数（默认: {}）".format(PREFETCH))
+    parser.add_argument("--cookie", action="append", default=None,
+                        help="Cookie 文件，可重复指定多个账号；上传槽位轮流绑定（默认: upload_bilibili 的 Cookie 配置）")
+    parser.add_argument("--report", default=REPORT_PATH, help="JSON 结果报告路径（默认: {}）".format(REPORT_PATH))
+    parser.add_argument("--no-resume", action="store_true", help="忽略已有报告，全部重新处理")
+    args = parser.parse_args()
+
+    if not os.path.isfile(args.list):
+        print("错误: 未找到 mapbinlist.txt: {}".format(args.list))
         sys.exit(1)
 
-    paths = _parse_mapbinlist(MAPBINLIST)
+    paths = _parse_mapbinlist(args.list)
     if not paths:
         print("错误: mapbinlist.txt 中没有有效视频条目（每行格式: file 'path_or_url'）")
         sys.exit(1)
+    paths = list(dict.fromkeys(paths))  # 报告按条目记录，重复条目只处理一次
 
-    if BASE_DIR not in sys.path:
-        sys.path.insert(0, BASE_DIR)
-    from playwright_push.upload_bilibili import main as upload_main
-
-    results = []
-    for i, entry in enumerate(paths):
-        print("\n[{}/{}] 处理: {}".format(i + 1, len(paths), entry[:80]))
-        local_path = _ensure_local_path(entry)
-        if not local_path:
-            print("  跳过: 非本地文件或下载失败")
-            results.append((entry, None))
-            continue
-        title = os.path.splitext(os.path.basename(local_path))[0]
-        res = upload_main(video_path_arg=local_path, title_arg=title)
-        results.append((entry, res))
-        print("  结果: 文件={}, 审核状态={}, 原因={}, 成功={}".format(
-            res.filename, res.audit_status, res.reason, res.success
-        ))
+    entries = run_batch(
+        paths,
+        workers=args.workers,
+        prefetch=max(0, args.prefetch),
+        cookie_files=args.cookie,
+        report_path=args.report,
+        resume=not args.no_resume,
+    )
 
     # 汇总
-    success_count = sum(1 for _, r in results if r and r.success)
+    records = [entries[e] for e in paths if e in entries]
+    success_count = sum(1 for r in records if r.get("success"))
     print("\n======== 汇总 ========")
-    print("共 {} 个视频，成功 {} 个".format(len(results), success_count))
-    for entry, res in results:
-        if res:
-            print("  {} -> {} ({}): {}".format(
-                os.path.basename(entry.split("?")[0]) or entry[:40],
-                res.audit_status,
-                res.success,
-                res.reason[:50] if res.reason else "",
-            ))
-        else:
+    print("共 {} 个视频，成功 {} 个，报告: {}".format(len(paths), success_count, args.report))
+    for entry in paths:
+        record = entries.get(entry) or {}
+        name = os.path.basename(entry.split("?")[0]) or entry[:40]
+        if record.get("status") == "skipped":
             print("  {} -> 跳过".format(entry[:60]))
+        else:
+            reason = record.get("reason") or ""
+            print("  {} -> {} ({}): {}".format(name, record.get("audit_status"), record.get("success"), reason[:50]))
 
-    if success_count < len([r for _, r in results if r is not None]):
+    if any(r.get("status") == "failed" for r in records):
         sys.exit(1)
 
 
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""边合并边上传：输出超出预估大小（size_hint）时不上传越界分片，合并完成后整文件上传。"""
+
+import os
+import stat
+import sys
+import threading
+
+import pytest
+
+import merge_mp4_ffmpeg2
+from push.bilibili import upload
+from push.bilibili.chunks import GrowingFile
+
+CHUNK = 64 * 1024
+
+
+class _Resp(object):
+    def __init__(self, status_code=200, headers=None, body=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self._body = body or {}
+
+    def json(self):
+        return self._body
+
+    def raise_for_status(self):
+        pass
+
+
+class _FakeSession(object):
+    """记录分片 PUT 的 URL 参数与 complete 提交的分片数。"""
+
+    def __init__(self):
+        self.puts = []
+        self.completed = None
+        self._lock = threading.Lock()
+
+    def put(self, url, data=None, headers=None, timeout=None):
+        query = dict(kv.split("=", 1) for kv in url.split("?", 1)[1].split("&"))
+        body = data.read()
+        with self._lock:
+            self.puts.append((dict((k, int(v)) for k, v in query.items() if v.isdigit()), len(body)))
+        return _Resp(headers={"ETag": "e{}".format(query["partNumber"])})
+
+    def post(self, url, json=None, headers=None, timeout=None):
+        self.completed = len(json["parts"])
+        return _Resp(body={"OK": 1})
+
+
+def _upload(session, path, growing=None, size_hint=None):
+    return upload.upload_chunks(
+        session, "//upos.test", "upos://ugc/x.mp4", "uid", path, CHUNK, 1, "x.mp4",
+        max_retry=1, concurrency=2, growing=growing, size_hint=size_hint,
+    )
+
+
+def _write_growing(path, nbytes):
+    growing = GrowingFile(path)
+    # 与 merge_and_upload_streaming 一致：上传开始前输出文件已创建
+    out_f = open(path, "wb")
+
+    def _produce():
+        with out_f as f:
+            left = nbytes
+            while left > 0:
+                block = b"x" * min(CHUNK // 2, left)
+                f.write(block)
+                f.flush()
+                growing.advance(len(block))
+                left -= len(block)
+        growing.finish()
+
+    t = threading.Thread(target=_produce)
+    t.start()
+    return growing, t
+
+
+def _assert_parts_in_range(session):
+    for query, _ in session.puts:
+        assert query["chunk"] < query["chunks"]
+        assert query["end"] <= query["total"]
+
+
+def test_growing_upload_within_size_hint(tmp_path):
+    path = str(tmp_path / "out.mp4")
+    growing, t = _write_growing(path, CHUNK * 3 + 100)
+    session = _FakeSession()
+    _upload(session, path, growing=growing, size_hint=CHUNK * 5)
+    t.join()
+    _assert_parts_in_range(session)
+    assert sum(n for _, n in session.puts) == CHUNK * 3 + 100
+    assert session.completed == 4
+
+
+def test_growing_upload_larger_than_size_hint_stops(tmp_path):
+    path = str(tmp_path / "out.mp4")
+    growing, t = _write_growing(path, CHUNK * 4)
+    session = _FakeSession()
+    with pytest.raises(upload.SizeHintExceeded):
+        _upload(session, path, growing=growing, size_hint=CHUNK * 2 + 10)
+    t.join()
+    _assert_parts_in_range(session)
+    assert session.completed is None
+
+
+@pytest.mark.skipif(os.name != "posix", reason="需要可执行的脚本替身 ffmpeg")
+def test_streaming_merge_falls_back_to_whole_file(tmp_path):
+    nbytes = CHUNK * 5 + 7
+    fake_ffmpeg = tmp_path / "ffmpeg"
+    fake_ffmpeg.write_text(
+        "#!{}\nimport sys\nsys.stdout.buffer.write(b'm' * {})\n".format(sys.executable, nbytes)
+    )
+    fake_ffmpeg.chmod(fake_ffmpeg.stat().st_mode | stat.S_IEXEC)
+    list_path = tmp_path / "list.txt"
+    list_path.write_text("file 'a.mp4'\n")
+    sessions = []
+
+    def _upload_fn(path, growing):
+        session = _FakeSession()
+        sessions.append((growing is not None, session))
+        return _upload(session, path, growing=growing, size_hint=CHUNK * 2)
+
+    out, result = merge_mp4_ffmpeg2.merge_and_upload_streaming(
+        str(list_path), str(tmp_path / "out.mp4"), _upload_fn, str(fake_ffmpeg)
+    )
+    assert result == {"OK": 1}
+    assert os.path.getsize(out) == nbytes
+    assert [streaming for streaming, _ in sessions] == [True, False]
+    _assert_parts_in_range(sessions[0][1])
+    whole = sessions[1][1]
+    assert sum(n for _, n in whole.puts) == nbytes
+    assert whole.completed == 6
@@ -0,0 +1,269 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+合并任务工作目录管理：tmp/ 下每个任务一个目录，带磁盘配额。
+- 任务 ID 为 <前缀>_<YYYYMMDD_HHMMSS>_<8 位随机>，同一秒内的并发请求也不会共用或撞目录
+- 临时目录先改名移入 tmp/.trash 再由后台线程删除，任务结束不必等待大目录删除完
+- 受管目录（merge_*）总大小超过配额时，按最近使用时间（目录内文件最新 mtime）从旧到新整目录删除；
+  运行中的任务（.job 标记中的进程仍存活）和 WORKSPACE_MIN_AGE 内用过的目录不删，
+  调用方复用某个输出时可 touch() 刷新其使用时间
+- 缓存目录（CACHE_SUBDIRS：树形合并的组缓存 concat_groups/、mp4_index 索引 mp4_index/）中的文件也计入配额，与任务目录一起按最近使用时间逐个淘汰
+"""
+
+import os
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+TMP_DIR = os.path.join(BASE_DIR, "tmp")
+# tmp/ 下受管任务目录的总大小上限（字节）
+WORKSPACE_QUOTA_BYTES = 50 * 1024 * 1024 * 1024
+# 最近该时长（秒）内用过的目录不参与淘汰（如刚合并完、仍在上传的输出）
+WORKSPACE_MIN_AGE = 3600
+# 受管目录名前缀：merge_（命令行）、merge_api_（接口）
+MANAGED_PREFIXES = ("merge_",)
+TMP_SUBDIR_NAME = "_tmp"
+TRASH_DIR_NAME = ".trash"
+JOB_MARKER = ".job"
+# root 下计入配额的缓存目录（其中文件按 mtime 逐个淘汰）
+GROUP_CACHE_SUBDIR = "concat_groups"
+# mp4_index 的索引 JSON 缓存（mp4_index.INDEX_CACHE_DIR）
+INDEX_CACHE_SUBDIR = "mp4_index"
+CACHE_SUBDIRS = (GROUP_CACHE_SUBDIR, INDEX_CACHE_SUBDIR)
+
+
+def pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, OSError):
+        return True
+    return True
+
+
+def _dir_usage(path):
+    """目录总字节数与其中文件的最新 mtime。"""
+    total = 0
+    latest = 0.0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                st = os.stat(os.path.join(root, name))
+            except OSError:
+                continue
+            total += st.st_size
+            latest = max(latest, st.st_mtime)
+    if not latest:
+        try:
+            latest = os.stat(path).st_mtime
+        except OSError:
+            pass
+    return total, latest
+
+
+class Job(object):
+    """一个任务的工作目录：work_dir 放最终输出，temp_dir（work_dir/_tmp）放分片与中间文件。"""
+
+    def __init__(self, manager, job_id, work_dir):
+        self.manager = manager
+        self.job_id = job_id
+        self.work_dir = work_dir
+        self.temp_dir = os.path.join(work_dir, TMP_SUBDIR_NAME)
+        self._finished = False
+
+    def release_temp(self):
+        """后台删除 temp_dir（可在任务结束前调用，提前释放空间）。"""
+        self.manager.discard(self.temp_dir)
+
+    def finish(self, keep_tmp=False):
+        """任务结束：撤销运行标记，删除临时目录（keep_tmp 时保留），空的工作目录一并删除，然后检查配额。"""
+        if self._finished:
+            return
+        self._finished = True
+        try:
+            os.remove(os.path.join(self.work_dir, JOB_MARKER))
+        except OSError:
+            pass
+        if not keep_tmp:
+            self.release_temp()
+            try:
+                os.rmdir(self.work_dir)
+            except OSError:
+                pass
+        self.manager.enforce_quota(protect=(self.work_dir,))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.finish()
+
+
+class WorkspaceManager(object):
+    """root 目录下的任务目录分配、后台删除与配额淘汰；线程安全，多个进程共用同一 root 也不会冲突。"""
+
+    def __init__(self, root=None, quota_bytes=WORKSPACE_QUOTA_BYTES, min_age=WORKSPACE_MIN_AGE):
+        self.root = os.path.abspath(root or TMP_DIR)
+        self.quota_bytes = quota_bytes
+        self.min_age = min_age
+        self.trash_dir = os.path.join(self.root, TRASH_DIR_NAME)
+        self._lock = threading.Lock()
+        self._deleter = None
+        if os.path.isdir(self.trash_dir) and os.listdir(self.trash_dir):
+            # 上次进程退出前未删完的
+            self._submit_delete(self.trash_dir, keep_root=True)
+
+    def new_job(self, prefix="merge"):
+        """分配唯一任务目录（含 _tmp 子目录与运行标记），分配前先按配额淘汰旧目录。"""
+        self.enforce_quota()
+        while True:
+            job_id = "{}_{}_{}".format(prefix, time.strftime("%Y%m%d_%H%M%S", time.localtime()), uuid.uuid4().hex[:8])
+            work_dir = os.path.join(self.root, job_id)
+            try:
+                os.makedirs(work_dir)
+                break
+            except FileExistsError:
+                continue
+        os.makedirs(os.path.join(work_dir, TMP_SUBDIR_NAME))
+        with open(os.path.join(work_dir, JOB_MARKER), "w") as f:
+            f.write(str(os.getpid()))
+        return Job(self, job_id, work_dir)
+
+    def touch(self, path):
+        """标记 path（输出文件或任务目录）为刚使用过，推迟其淘汰。"""
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+
+    def discard(self, path):
+        """删除目录：先改名移入 .trash（立即生效），再由后台线程删除。"""
+        if not path or not os.path.isdir(path):
+            return
+        os.makedirs(self.trash_dir, exist_ok=True)
+        target = os.path.join(self.trash_dir, "{}_{}".format(os.path.basename(path), uuid.uuid4().hex[:8]))
+        try:
+            os.rename(path, target)
+        except OSError:
+            # 跨文件系统等无法改名时直接在后台删除原目录
+            target = path
+        self._submit_delete(target)
+
+    def _submit_delete(self, path, keep_root=False):
+        with self._lock:
+            if self._deleter is None:
+                # 非守护线程：进程退出前会等待删除完成
+                self._deleter = ThreadPoolExecutor(max_workers=1)
+            self._deleter.submit(self._delete, path, keep_root)
+
+    @staticmethod
+    def _delete(path, keep_root):
+        if keep_root:
+            for name in os.listdir(path):
+                shutil.rmtree(os.path.join(path, name), ignore_errors=True)
+        else:
+            shutil.rmtree(path, ignore_errors=True)
+
+    def _managed_dirs(self):
+        if not os.path.isdir(self.root):
+            return []
+        return [
+            os.path.join(self.root, name)
+            for name in os.listdir(self.root)
+            if name.startswith(MANAGED_PREFIXES) and os.path.isdir(os.path.join(self.root, name))
+        ]
+
+    def cache_dir(self, name):
+        """root 下的缓存目录（如 GROUP_CACHE_SUBDIR），不存在时创建；CACHE_SUBDIRS 中的目录计入配额。"""
+        path = os.path.join(self.root, name)
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def _cache_files(self):
+        """缓存目录中的文件：[(mtime, size, path)]。"""
+        files = []
+        for name in CACHE_SUBDIRS:
+            cache_dir = os.path.join(self.root, name)
+            if not os.path.isdir(cache_dir):
+                continue
+            for fname in os.listdir(cache_dir):
+                path = os.path.join(cache_dir, fname)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                if os.path.isfile(path):
+                    files.append((st.st_mtime, st.st_size, path))
+        return files
+
+    def _is_active(self, work_dir):
+        try:
+            with open(os.path.join(work_dir, JOB_MARKER), "r") as f:
+                pid = int(f.read().strip() or 0)
+        except (IOError, OSError, ValueError):
+            return False
+        return pid > 0 and pid_alive(pid)
+
+    def enforce_quota(self, protect=()):
+        """
+        受管目录与缓存文件总大小超过 quota_bytes 时按最近使用时间从旧到新删除（任务目录整个删除，缓存逐个文件删除）。
+        :param protect: 本次不删除的目录
+        :return: 删除的目录与缓存文件列表
+        """
+        if not self.quota_bytes:
+            return []
+        protect = set(os.path.abspath(p) for p in protect)
+        with self._lock:
+            entries = []
+            total = 0
+            for work_dir in self._managed_dirs():
+                size, last_used = _dir_usage(work_dir)
+                total += size
+                entries.append((last_used, size, work_dir))
+            for entry in self._cache_files():
+                total += entry[1]
+                entries.append(entry)
+            if total <= self.quota_bytes:
+                return []
+            now = time.time()
+            evicted = []
+            for last_used, size, path in sorted(entries):
+                if total <= self.quota_bytes:
+                    break
+                if path in protect or now - last_used < self.min_age:
+                    continue
+                if os.path.isdir(path) and self._is_active(path):
+                    continue
+                evicted.append(path)
+                total -= size
+        for path in evicted:
+            if os.path.isdir(path):
+                print("[workspace] 超出配额，删除最久未用的目录: {}".format(path))
+                self.discard(path)
+            else:
+                print("[workspace] 超出配额，删除最久未用的缓存: {}".format(path))
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+        return evicted
+
+
+_managers = {}
+_managers_lock = threading.Lock()
+
+
+def workspace_for(root=None, quota_bytes=None):
+    """按 root 共享的 WorkspaceManager（同一进程内的并发请求共用）；传 quota_bytes 时更新配额。"""
+    root = os.path.abspath(root or TMP_DIR)
+    with _managers_lock:
+        manager = _managers.get(root)
+        if manager is None:
+            manager = _managers[root] = WorkspaceManager(root)
+        if quota_bytes is not None:
+            manager.quota_bytes = quota_bytes
+        return manager